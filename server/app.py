@@ -1,28 +1,72 @@
 # server/app.py
-from typing import List
-from datetime import datetime, timedelta
-
-from fastapi import FastAPI, HTTPException, Depends, Request, Query
+import asyncio, gzip, io, json, os, queue, signal, tempfile, time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from threading import BoundedSemaphore, Lock, Thread, current_thread, main_thread
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from datetime import date, datetime
+
+from fastapi import FastAPI, HTTPException, Depends, Request, Query, Response, Body
 from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
+import exportacao
+import importacao
+import indice
+import metricas
 import storage
 from domain import (
     # modelos
-    StatusAtual, NovoRegistro, Motivo, Tear, Turno,
+    StatusAtual, NovoRegistro, RegistroLote, ResultadoLote, Motivo, Tear, Turno,
     Usuario, NovoUsuario, AtualizaUsuario, LoginPayload,
     # regras de negócio
-    listar_eventos,
-    registrar_parada, registrar_funcionando,
-    status_atual_por_tear, status_atual_dos_teares,
+    registrar_parada, registrar_funcionando, registrar_lote,
+    status_atual_por_tear, status_atual_dos_teares, status_do_tear, ao_salvar_evento, ao_recarregar_eventos,
     listar_motivos, upsert_motivo, delete_motivo,
     listar_teares, criar_tear, renomear_tear, excluir_tear,
     upsert_turno, delete_turno,
     # auth
-    login, user_by_token, autoriza,
+    login, user_by_token, autoriza, to_local, calendario,
+)
+from relatorios import (
+    TotalDiaTurno, TotalTurno, ParetoMotivo, StatusNoInstante, Intervalo, Disponibilidade,
+    totais_por_dia_turno, totais_por_turno, pareto_motivos, status_no_instante, intervalos, disponibilidade,
 )
 
-app = FastAPI(title="Paradas API (isolado)")
+@asynccontextmanager
+async def _ciclo(_app):
+    # O uvicorn só roda o fim do lifespan depois que todas as conexões fecham, e cada tela
+    # mantém um stream SSE aberto. O sinal de parada é interceptado aqui, encadeado ao
+    # handler do uvicorn, para encerrar os streams já no início do desligamento.
+    global _encerrando
+    _encerrando = False
+    loop = asyncio.get_running_loop()
+    anteriores = {}
+
+    def ao_sinal(sig, frame):
+        loop.call_soon_threadsafe(_encerra_streams)   # interrompe o loop no meio: nada de travas aqui
+        anterior = anteriores[sig]
+        if callable(anterior):
+            anterior(sig, frame)
+        else:
+            signal.signal(sig, anterior)
+            signal.raise_signal(sig)
+
+    if current_thread() is main_thread():   # sinais só na thread principal
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            anteriores[sig] = signal.signal(sig, ao_sinal)
+    try:
+        yield
+    finally:
+        _encerra_streams()
+        for sig, anterior in anteriores.items():
+            if signal.getsignal(sig) is ao_sinal:
+                signal.signal(sig, anterior)
+
+app = FastAPI(title="Paradas API (isolado)", lifespan=_ciclo)
 
 # ---------------- CORS ----------------
 app.add_middleware(
@@ -31,55 +75,34 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
     allow_credentials=True,
+    expose_headers=["ETag", "X-Proximo-Cursor"],
 )
+app.add_middleware(metricas.MiddlewareHttp)   # por fora de tudo: mede também o CORS
 
 # -------- Helpers de turno/role --------
 TOL_MIN = 10  # tolerância de 10 minutos após a virada do turno
 
-def _at_time(base: datetime, hhmm: str) -> datetime:
-    h, m = map(int, hhmm.split(":"))
-    return base.replace(hour=h, minute=m, second=0, microsecond=0)
-
 def turno_efetivo(dt: datetime) -> int:
     """
-    Retorna 1, 2 ou 3 conforme o horário informado, com tolerância de 10 min na virada,
+    Retorna o turno vigente em dt pelo calendário de turnos (turnos.json), com tolerância
+    de 10 min na virada (os primeiros minutos ainda contam para o turno que terminou),
     idêntico à regra aplicada no front.
-    Turnos:
-      1: 05:00–13:30
-      2: 13:30–22:00
-      3: 22:00–05:00 (+1 dia)
     """
-    base = dt
-    t1_start = _at_time(base, "05:00")
-    t2_start = _at_time(base, "13:30")
-    t3_start = _at_time(base, "22:00")
-    next_day_5 = _at_time(base, "05:00") + timedelta(days=1)
-
-    t1_tol = t1_start + timedelta(minutes=TOL_MIN)
-    t2_tol = t2_start + timedelta(minutes=TOL_MIN)
-    t3_tol = t3_start + timedelta(minutes=TOL_MIN)
-
-    if dt >= t1_start and dt < t2_start:
-        return 3 if dt < t1_tol else 1
-    if dt >= t2_start and dt < t3_start:
-        return 1 if dt < t2_tol else 2
-    # 22:00 -> 05:00(+1)
-    if dt >= t3_start or dt < t1_start:
-        if dt >= t3_start and dt < t3_tol:
-            return 2
-        return 3
-    return 1
-
-def valida_registro_por_role_e_turno(user_role: int, data_hora_iso: str):
+    turno = calendario().turno_em(dt, TOL_MIN)
+    return turno if turno is not None else 1
+
+def valida_registro_por_role_e_turno(user_role: int, data_hora, agora: Optional[datetime] = None):
     """
     Lança HTTPException se a combinação role/horário violar as regras.
+    data_hora pode vir como datetime (payload já validado) ou string ISO-8601.
     """
     try:
-        sel = datetime.fromisoformat(data_hora_iso.replace("Z", "+00:00")).astimezone().replace(tzinfo=None)
+        sel = data_hora if isinstance(data_hora, datetime) else datetime.fromisoformat(data_hora.replace("Z", "+00:00"))
+        sel = sel.astimezone().replace(tzinfo=None)
     except Exception:
         raise HTTPException(status_code=400, detail="data_hora inválido (use ISO-8601).")
 
-    agora = datetime.now()
+    agora = agora or datetime.now()
 
     # Bloqueio universal de FUTURO (inclusive para role 6)
     if sel > agora:
@@ -135,23 +158,259 @@ def require_any(*recursos: str):
     return dep
 
 
+# -------- GET condicional (ETag) --------
+class NaoModificado(Exception):
+    def __init__(self, etag: str):
+        self.etag = etag
+
+@app.exception_handler(NaoModificado)
+async def _nao_modificado(request: Request, exc: NaoModificado):
+    return Response(status_code=304, headers={"ETag": exc.etag, "Cache-Control": "private, no-cache"})
+
+def condicional(*chaves: str, janela_s: Optional[int] = None):
+    """
+    ETag a partir das versões das chaves do storage (mais uma janela de tempo, para respostas
+    que envelhecem sozinhas, como 'horas'). Se o If-None-Match do cliente já tem essa versão,
+    responde 304 antes de qualquer cálculo ou serialização. Usar depois da dependência de auth.
+    """
+    def dep(request: Request, response: Response):
+        partes = [storage.versao(k) for k in chaves]
+        if janela_s:
+            partes.append(str(int(time.time() // janela_s)))
+        etag = 'W/"' + ".".join(partes) + '"'
+        inm = request.headers.get("if-none-match")
+        if inm and (inm.strip() == "*" or etag in [t.strip() for t in inm.split(",")]):
+            raise NaoModificado(etag)
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "private, no-cache"
+    return dep
+
+
+# -------- Corpos JSON já codificados --------
+# Leituras grandes (histórico de /eventos) saem do índice direto para bytes, numa passada
+# só do json em C: os eventos já foram validados pelo pydantic na gravação. O corpo (e a
+# versão gzip, se o cliente aceitar) fica em cache por chave até o conteúdo mudar.
+CORPOS_MAX = int(os.getenv("PARADAS_CACHE_CORPOS_MB", "64")) * 1024 * 1024
+GZIP_MIN = 1024   # corpos menores que isso não compensam comprimir
+GZIP_NIVEL = 5
+
+_corpos: "OrderedDict[tuple, list]" = OrderedDict()   # chave -> [corpo, corpo_gzip | None, headers]
+_corpos_bytes = 0
+_corpos_lock = Lock()
+metricas.Medidor("paradas_cache_corpos_bytes", "Bytes de corpos JSON em cache", lambda: _corpos_bytes)
+
+def _json_bytes(dados: Any) -> bytes:
+    # mesmo formato do JSONResponse do FastAPI
+    return json.dumps(dados, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def resposta_json(request: Request, response: Response, chave: tuple,
+                  produz: Callable[[], Tuple[Any, Dict[str, str]]]) -> Response:
+    """
+    Resposta JSON servida de bytes em cache. 'produz' devolve (dados, headers extras) e só roda
+    se a chave não estiver no cache; a chave deve mudar sempre que o conteúdo mudar.
+    Os headers da dependência (ETag etc.) vêm de 'response'.
+    """
+    global _corpos_bytes
+    quer_gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+    with _corpos_lock:
+        item = _corpos.get(chave)
+        if item is not None:
+            _corpos.move_to_end(chave)
+    if item is None:
+        dados, extras = produz()
+        item = [_json_bytes(dados), None, extras]
+    corpo, comprimido, extras = item
+    usa_gzip = quer_gzip and len(corpo) >= GZIP_MIN
+    if usa_gzip and comprimido is None:
+        # lista nova: a do cache continua descrevendo o que foi somado em _corpos_bytes
+        comprimido = gzip.compress(corpo, GZIP_NIVEL)
+        item = [corpo, comprimido, extras]
+    with _corpos_lock:
+        antigo = _corpos.pop(chave, None)
+        if antigo is not None:
+            _corpos_bytes -= len(antigo[0]) + len(antigo[1] or b"")
+        if len(corpo) <= CORPOS_MAX // 4:
+            _corpos[chave] = item
+            _corpos_bytes += len(corpo) + len(item[1] or b"")
+        while _corpos_bytes > CORPOS_MAX and _corpos:
+            _k, velho = _corpos.popitem(last=False)
+            _corpos_bytes -= len(velho[0]) + len(velho[1] or b"")
+
+    headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    headers.update(extras)
+    headers["Vary"] = "Accept-Encoding"
+    if usa_gzip:
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=comprimido if usa_gzip else corpo, media_type="application/json", headers=headers)
+
+
 # ---------------- ROTAS ----------------
 
 # ---- Dashboard / Status ----
 @app.get("/status", response_model=List[StatusAtual])
-def get_status(total: int = Query(50, ge=1, le=500), user=Depends(require("dashboard"))):
+def get_status(total: int = Query(50, ge=1, le=500), user=Depends(require("dashboard")),
+               _=Depends(condicional("status", janela_s=36))):
     # legado: calcula status para 1..N
     return status_atual_por_tear(total)
 
 @app.get("/status-teares", response_model=List[StatusAtual])
-def get_status_teares(user=Depends(require("dashboard"))):
+def get_status_teares(user=Depends(require("dashboard")), _=Depends(condicional("status", "teares", janela_s=36))):
     # novo: usa teares cadastrados
     return status_atual_dos_teares()
 
+@app.get("/status-teares/em", response_model=List[StatusNoInstante])
+def get_status_no_instante(
+    instante: datetime,
+    teares: Optional[List[int]] = Query(None),
+    user=Depends(require_any("dashboard", "relatorios", "api_read")),
+    _=Depends(condicional("status", "teares")),
+):
+    # "o que estava rodando às 03:00?": status de cada tear num instante qualquer
+    return status_no_instante(to_local(instante), teares)
+
+# ---- Stream de status (SSE) ----
+# Cada tela recebe um snapshot ao conectar e depois só o status do tear que mudou,
+# quando um registro é gravado. A mensagem é serializada uma vez e repassada a todas
+# as telas; com a fábrica parada, só passa o ping de keep-alive. A sessão é conferida de
+# novo a cada SSE_PING_S (o que também conta como uso): logout ou expiração encerra o stream,
+# e o desligamento do servidor também (as telas reconectam sozinhas, pelo retry).
+SSE_PING_S = 15
+_assinantes: set = set()   # {(loop, fila)} das conexões abertas
+_encerrando = False        # servidor parando (ver _ciclo)
+metricas.Medidor("paradas_sse_assinantes", "Conexões abertas em /status-teares/stream", lambda: len(_assinantes))
+_assinantes_lock = Lock()
+
+def _sse(evento: str, dados) -> str:
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+def _entrega(fila: asyncio.Queue, msg: Optional[str]):
+    try:
+        fila.put_nowait(msg)
+    except asyncio.QueueFull:
+        # tela atrasada: descarta o acumulado e manda um snapshot novo
+        while not fila.empty():
+            fila.get_nowait()
+        fila.put_nowait(None)
+
+def _encerra_streams():
+    global _encerrando
+    _encerrando = True
+    with _assinantes_lock:
+        alvos = list(_assinantes)
+    for loop, fila in alvos:   # acorda quem está esperando na fila
+        loop.call_soon_threadsafe(_entrega, fila, None)
+
+@ao_salvar_evento
+def _difunde_evento(ev):
+    with _assinantes_lock:
+        alvos = list(_assinantes)
+    if not alvos:
+        return
+    st = status_do_tear(ev.tear)
+    if st is None:
+        return
+    msg = _sse("tear", jsonable_encoder(st))
+    for loop, fila in alvos:
+        loop.call_soon_threadsafe(_entrega, fila, msg)
+
+@ao_recarregar_eventos
+def _difunde_snapshot():
+    # histórico reescrito por outro processo: todas as telas recebem um snapshot novo
+    with _assinantes_lock:
+        alvos = list(_assinantes)
+    for loop, fila in alvos:
+        loop.call_soon_threadsafe(_entrega, fila, None)
+
+def _sessao_do_stream(token: str) -> bool:
+    u = user_by_token(token)
+    return bool(u) and autoriza(int(u["role"]), "dashboard")
+
+@app.get("/status-teares/stream")
+async def stream_status_teares(request: Request, token: Optional[str] = None):
+    # EventSource não envia headers: aceita o token também por query string
+    bearer = request.headers.get("Authorization", "")
+    tok, user = None, None
+    for t in (bearer[7:] if bearer.startswith("Bearer ") else None, token):
+        if t and (user := user_by_token(t)):
+            tok = t
+            break
+    if not user:
+        raise HTTPException(status_code=401, detail="Não autenticado")
+    if not autoriza(int(user["role"]), "dashboard"):
+        raise HTTPException(status_code=403, detail="Sem permissão")
+
+    assinante = (asyncio.get_running_loop(), asyncio.Queue(maxsize=256))
+    fila = assinante[1]
+
+    async def gerador():
+        with _assinantes_lock:
+            _assinantes.add(assinante)
+        try:
+            if _encerrando:
+                return
+            teares_base = storage.view("teares")
+            yield "retry: 3000\n\n"
+            yield _sse("snapshot", jsonable_encoder(status_atual_dos_teares()))
+            conferida = time.monotonic()
+            while True:
+                ping = False
+                try:
+                    msg = await asyncio.wait_for(fila.get(), timeout=SSE_PING_S)
+                except asyncio.TimeoutError:
+                    ping = True
+                if _encerrando:
+                    break
+                if time.monotonic() - conferida >= SSE_PING_S:   # também com a fábrica mandando eventos sem parar
+                    conferida = time.monotonic()
+                    if not await run_in_threadpool(_sessao_do_stream, tok):
+                        yield _sse("sessao", {"detail": "Sessão encerrada"})
+                        break
+                if ping:
+                    if await request.is_disconnected():
+                        break
+                    if storage.view("teares") is teares_base:
+                        yield ": ping\n\n"
+                        continue
+                    msg = None  # teares cadastrados/renomeados/excluídos → snapshot
+                if msg is None:
+                    teares_base = storage.view("teares")
+                    msg = _sse("snapshot", jsonable_encoder(status_atual_dos_teares()))
+                yield msg
+        finally:
+            with _assinantes_lock:
+                _assinantes.discard(assinante)
+
+    return StreamingResponse(gerador(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # Observação: eventos é usado pelos relatórios -> liberar leitura via api_read
 @app.get("/eventos")
-def eventos(user=Depends(require_any("dashboard", "api_read"))):
-    return jsonable_encoder([e for e in listar_eventos()])
+def eventos(
+    request: Request,
+    response: Response,
+    inicio: Optional[datetime] = Query(None, alias="from"),
+    fim: Optional[datetime] = Query(None, alias="to"),
+    tear: Optional[List[int]] = Query(None),
+    turno: Optional[List[int]] = Query(None),
+    cursor: Optional[str] = None,
+    limite: Optional[int] = Query(None, ge=1, le=10000),
+    user=Depends(require_any("dashboard", "api_read")),
+    _=Depends(condicional("status")),
+):
+    # filtros por período (from <= data_hora < to), tear e turno; paginação por cursor:
+    # o próximo cursor vem no header X-Proximo-Cursor (ausente na última página)
+    def produz():
+        try:
+            pagina, prox = indice.consultar(
+                to_local(inicio) if inicio else None, to_local(fim) if fim else None,
+                tear, turno, cursor, limite,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return pagina, ({"X-Proximo-Cursor": prox} if prox else {})
+
+    chave = ("eventos", indice.geracao(), inicio, fim, tuple(tear or ()), tuple(turno or ()), cursor, limite)
+    return resposta_json(request, response, chave, produz)
 
 @app.post("/parada")
 def post_parada(payload: NovoRegistro, user=Depends(require("dashboard"))):
@@ -173,11 +432,222 @@ def post_funcionando(payload: NovoRegistro, user=Depends(require("dashboard"))):
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+LOTE_MAX = int(os.getenv("PARADAS_LOTE_MAX", "200"))
+
+@app.post("/registros/lote", response_model=List[ResultadoLote])
+def post_registros_lote(itens: List[RegistroLote] = Body(...), user=Depends(require("dashboard"))):
+    """
+    Vários registros de parada (status=0) / funcionando (status=1) numa requisição, gravados
+    juntos. Responde um resultado por item, na ordem enviada; itens recusados não gravam.
+    """
+    if len(itens) > LOTE_MAX:
+        raise HTTPException(status_code=413, detail=f"Lote acima do limite de {LOTE_MAX} registros.")
+    role = int(user["role"])
+    if role in (4, 5):
+        raise HTTPException(status_code=403, detail="Seu perfil não está autorizado a registrar paradas/funcionamento.")
+    agora = datetime.now()
+    recusados: Dict[int, str] = {}
+    for i, item in enumerate(itens):
+        try:
+            valida_registro_por_role_e_turno(role, item.data_hora, agora)
+        except HTTPException as e:
+            recusados[i] = e.detail
+    aceitos = [i for i in range(len(itens)) if i not in recusados]
+    resultados = {i: ResultadoLote(indice=i, ok=False, erro=erro) for i, erro in recusados.items()}
+    for r in registrar_lote([itens[i] for i in aceitos]):
+        r.indice = aceitos[r.indice]
+        resultados[r.indice] = r
+    return [resultados[i] for i in range(len(itens))]
+
+
+# ---- Relatórios (agregados no servidor) ----
+@app.get("/relatorios/totais", response_model=List[TotalDiaTurno])
+def get_relatorio_totais(
+    inicio: date,
+    fim: date,
+    teares: Optional[List[int]] = Query(None),
+    turnos: Optional[List[int]] = Query(None),
+    user=Depends(require_any("relatorios", "api_read")),
+    _=Depends(condicional("status", "turnos", "teares", "motivos", janela_s=60)),
+):
+    try:
+        return totais_por_dia_turno(inicio, fim, teares, turnos)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/relatorios/turnos", response_model=List[TotalTurno])
+def get_relatorio_turnos(
+    inicio: date,
+    fim: date,
+    teares: Optional[List[int]] = Query(None),
+    turnos: Optional[List[int]] = Query(None),
+    user=Depends(require_any("relatorios", "api_read")),
+    _=Depends(condicional("status", "turnos", "teares", janela_s=60)),
+):
+    # uma linha por tear × instância de turno (Relatório 1º/2º/3º turno)
+    try:
+        return totais_por_turno(inicio, fim, teares, turnos)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/relatorios/pareto-motivos", response_model=List[ParetoMotivo])
+def get_relatorio_pareto(
+    inicio: date,
+    fim: date,
+    teares: Optional[List[int]] = Query(None),
+    turnos: Optional[List[int]] = Query(None),
+    user=Depends(require_any("relatorios", "api_read")),
+    _=Depends(condicional("status", "turnos", "teares", "motivos", janela_s=60)),
+):
+    try:
+        return pareto_motivos(inicio, fim, teares, turnos)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/relatorios/disponibilidade", response_model=List[Disponibilidade])
+def get_relatorio_disponibilidade(
+    inicio: date,
+    fim: date,
+    teares: Optional[List[int]] = Query(None),
+    turnos: Optional[List[int]] = Query(None),
+    agrupar: List[str] = Query(["tear"]),
+    user=Depends(require_any("relatorios", "api_read")),
+    _=Depends(condicional("status", "turnos", "teares", "motivos", janela_s=60)),
+):
+    # disponibilidade %, MTBF e MTTR; agrupar=tear&agrupar=turno&agrupar=motivo em qualquer combinação
+    try:
+        return disponibilidade(inicio, fim, teares, turnos, agrupar)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/relatorios/intervalos", response_model=List[Intervalo])
+def get_relatorio_intervalos(
+    inicio: datetime,
+    fim: datetime,
+    teares: Optional[List[int]] = Query(None),
+    user=Depends(require_any("relatorios", "api_read")),
+    _=Depends(condicional("status", "teares", janela_s=60)),
+):
+    # trechos parado/funcionando que cruzam [inicio, fim), por tear
+    try:
+        return intervalos(to_local(inicio), to_local(fim), teares)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# ---- Exportação (download em blocos) ----
+# Histórico bruto ou linhas por turno em CSV/NDJSON para períodos longos: a resposta começa
+# na hora e sai em pedaços, sem montar o período inteiro em memória como o /eventos.
+def _download(corpo, nome: str, formato: str) -> StreamingResponse:
+    return StreamingResponse(corpo, media_type=exportacao.FORMATOS[formato],
+                             headers={"Content-Disposition": f'attachment; filename="{nome}"'})
+
+@app.get("/exportar/eventos")
+def get_exportar_eventos(
+    inicio: date,
+    fim: date,
+    teares: Optional[List[int]] = Query(None),
+    turnos: Optional[List[int]] = Query(None),
+    formato: str = Query("csv"),
+    user=Depends(require_any("relatorios", "api_read")),
+):
+    try:
+        corpo = exportacao.eventos(inicio, fim, teares, turnos, formato)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _download(corpo, f"eventos_{inicio}_{fim}.{formato}", formato)
+
+@app.get("/exportar/turnos")
+def get_exportar_turnos(
+    inicio: date,
+    fim: date,
+    teares: Optional[List[int]] = Query(None),
+    turnos: Optional[List[int]] = Query(None),
+    formato: str = Query("csv"),
+    user=Depends(require_any("relatorios", "api_read")),
+):
+    try:
+        corpo = exportacao.por_turno(inicio, fim, teares, turnos, formato)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _download(corpo, f"turnos_{inicio}_{fim}.{formato}", formato)
+
+
+# ---- Importação em massa ----
+# O corpo (CSV ou NDJSON, mesmas colunas da exportação) vai para um arquivo temporário e a
+# importação roda numa thread própria; a resposta é NDJSON com o progresso a cada lote e, na
+# última linha, o resumo com os erros. Uma importação por processo; se o cliente cair, ela
+# segue até o fim.
+IMPORTACAO_MAX = int(os.getenv("PARADAS_IMPORTACAO_MB", "512")) * 1024 * 1024
+_importacao_lock = Lock()
+
+def _importa_em_fundo(arquivo, formato: str, simular: bool):
+    """
+    Dispara a importação (a thread solta _importacao_lock ao terminar) e devolve o gerador do
+    progresso. A thread começa aqui, não na primeira iteração: uma resposta que nunca chega a
+    ser enviada não deixa a trava presa.
+    """
+    fila: queue.Queue = queue.Queue()
+
+    def progresso(r: importacao.ResumoImportacao):
+        if r.fase != "concluido":
+            fila.put(r.model_dump_json(exclude={"erros"}))
+
+    def roda():
+        try:
+            with io.TextIOWrapper(arquivo, encoding="utf-8-sig", newline="") as texto:
+                fila.put(importacao.importar(texto, formato, simular, progresso).model_dump_json())
+        except Exception as e:
+            fila.put(json.dumps({"fase": "erro", "erro": str(e)}, ensure_ascii=False))
+        finally:
+            _importacao_lock.release()
+            fila.put(None)
+
+    Thread(target=roda, name="importacao", daemon=True).start()
+
+    def linhas():
+        while (msg := fila.get()) is not None:
+            yield msg + "\n"
+    return linhas()
+
+@app.post("/importar")
+async def post_importar(
+    request: Request,
+    formato: str = Query("csv"),
+    simular: bool = Query(False),
+    user=Depends(require("importar")),
+):
+    if formato not in importacao.FORMATOS:
+        raise HTTPException(status_code=400, detail=f'formato aceita: {", ".join(importacao.FORMATOS)}')
+    excedeu = HTTPException(status_code=413, detail=f"Arquivo acima do limite de {IMPORTACAO_MAX // (1024 * 1024)} MB.")
+    if int(request.headers.get("content-length") or 0) > IMPORTACAO_MAX:
+        raise excedeu
+    if not _importacao_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="Já existe uma importação em andamento")
+    arquivo = None
+    try:
+        arquivo = tempfile.TemporaryFile()
+        tamanho = 0
+        async for pedaco in request.stream():
+            tamanho += len(pedaco)
+            if tamanho > IMPORTACAO_MAX:
+                raise excedeu
+            await run_in_threadpool(arquivo.write, pedaco)   # disco fora do event loop
+        await run_in_threadpool(arquivo.seek, 0)
+        corpo = _importa_em_fundo(arquivo, formato, simular)
+    except BaseException:
+        # a thread não chegou a começar: a trava e o temporário ainda são daqui
+        if arquivo is not None:
+            arquivo.close()
+        _importacao_lock.release()
+        raise
+    return StreamingResponse(corpo, media_type="application/x-ndjson")
 
 # ---- Motivos ----
 # GET liberado com api_read; mutações continuam exigindo 'motivos'
 @app.get("/motivos")
-def motivos(user=Depends(require_any("motivos", "api_read"))):
+def motivos(user=Depends(require_any("motivos", "api_read")), _=Depends(condicional("motivos"))):
     return listar_motivos()
 
 @app.post("/motivos", response_model=Motivo)
@@ -192,7 +662,7 @@ def del_motivo(codigo: int, user=Depends(require("motivos"))):
 # ---- Teares ----
 # GET liberado com api_read; mutações exigem 'teares'
 @app.get("/teares")
-def get_teares(user=Depends(require_any("teares", "api_read"))):
+def get_teares(user=Depends(require_any("teares", "api_read")), _=Depends(condicional("teares"))):
     return listar_teares()
 
 @app.post("/teares", response_model=Tear)
@@ -214,7 +684,7 @@ def delete_teares(codigo: int, user=Depends(require("teares"))):
 # ---- Turnos ----
 # GET liberado com api_read; mutações exigem 'turnos'
 @app.get("/turnos")
-def turnos(user=Depends(require_any("turnos", "api_read"))):
+def turnos(user=Depends(require_any("turnos", "api_read")), _=Depends(condicional("turnos"))):
     return storage.read("turnos")
 
 @app.post("/turnos")
@@ -227,11 +697,81 @@ def del_turno(dia_semana: int, turno: int, user=Depends(require("turnos"))):
 
 
 # ---- Login / sessão ----
+# O PBKDF2 (100k iterações) roda num pool próprio e limitado: numa virada de turno com
+# dezenas de logins, eles fazem fila aqui e não ocupam as threads que atendem o dashboard.
+# (hashlib libera o GIL durante o PBKDF2, então threads bastam.)
+LOGIN_WORKERS = int(os.getenv("PARADAS_LOGIN_WORKERS", "2"))
+LOGIN_FILA_MAX = int(os.getenv("PARADAS_LOGIN_FILA", "32"))  # além disso: 503
+_login_pool = ThreadPoolExecutor(max_workers=LOGIN_WORKERS, thread_name_prefix="login")
+_login_vagas = BoundedSemaphore(LOGIN_WORKERS + LOGIN_FILA_MAX)
+
+class _LimiteTentativas:
+    """
+    Janela deslizante: no máximo `maximo` registros por chave em `janela_s` segundos.
+    Chaves que não voltam (nomes inventados a cada tentativa) saem numa varredura a cada
+    janela; acima de `chaves_max`, saem as mais antigas.
+    """
+    def __init__(self, maximo: int, janela_s: float, chaves_max: int = 10_000):
+        self.maximo, self.janela_s, self.chaves_max = maximo, janela_s, chaves_max
+        self._hist: Dict[str, deque] = {}
+        self._varrido = time.monotonic()
+        self._lock = Lock()
+
+    def _limpa(self, chave: str, agora: float) -> deque:
+        h = self._hist.get(chave)
+        if h is None:
+            return deque()
+        while h and agora - h[0] > self.janela_s:
+            h.popleft()
+        if not h:
+            del self._hist[chave]
+        return h
+
+    def espera(self, chave: str) -> int:
+        """Segundos até liberar a chave (0 = liberada)."""
+        agora = time.monotonic()
+        with self._lock:
+            h = self._limpa(chave, agora)
+            if len(h) < self.maximo:
+                return 0
+            return max(1, int(self.janela_s - (agora - h[0])) + 1)
+
+    def _varre(self, agora: float):
+        """Chamar sob _lock."""
+        for chave in [c for c, h in self._hist.items() if agora - h[-1] > self.janela_s]:
+            del self._hist[chave]
+        while len(self._hist) >= self.chaves_max:
+            del self._hist[next(iter(self._hist))]   # ordem de inserção: a chave vista primeiro
+        self._varrido = agora
+
+    def registra(self, chave: str):
+        agora = time.monotonic()
+        with self._lock:
+            if agora - self._varrido > self.janela_s or len(self._hist) >= self.chaves_max:
+                self._varre(agora)
+            self._hist.setdefault(chave, deque()).append(agora)
+
+_tentativas_ip = _LimiteTentativas(int(os.getenv("PARADAS_LOGIN_MAX_IP", "20")), 60)        # por IP, qualquer tentativa
+_falhas_usuario = _LimiteTentativas(int(os.getenv("PARADAS_LOGIN_MAX_FALHAS", "5")), 60)   # por nome, só falhas
+
 @app.post("/login")
-def do_login(payload: LoginPayload):
+async def do_login(payload: LoginPayload, request: Request):
+    ip = request.client.host if request.client else "?"
+    nome = payload.nome.strip().lower()
+    espera = max(_tentativas_ip.espera(ip), _falhas_usuario.espera(nome))
+    if espera:
+        raise HTTPException(status_code=429, detail="Muitas tentativas de login. Aguarde e tente novamente.",
+                            headers={"Retry-After": str(espera)})
+    _tentativas_ip.registra(ip)
+    if not _login_vagas.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Servidor ocupado processando logins. Tente novamente.",
+                            headers={"Retry-After": "2"})
+    fut = _login_pool.submit(login, payload.nome, payload.senha)
+    fut.add_done_callback(lambda _f: _login_vagas.release())  # libera mesmo se o cliente desistir
     try:
-        return login(payload.nome, payload.senha)
+        return await asyncio.wrap_future(fut)
     except ValueError as e:
+        _falhas_usuario.registra(nome)
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/me")
@@ -275,7 +815,28 @@ def del_user(cod: int, user=Depends(require("usuarios"))):
 def health():
     return {"ok": True}
 
+# ---- Métricas (Prometheus) ----
+# Sem sessão (o scraper não faz login); se PARADAS_METRICS_TOKEN estiver definido, exige
+# "Authorization: Bearer <token>".
+METRICS_TOKEN = os.getenv("PARADAS_METRICS_TOKEN")
+
+@app.get("/metrics", include_in_schema=False)
+def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Não autenticado")
+    return Response(metricas.texto(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Perfilador por amostragem (PARADAS_PERFIL=1): pilhas colapsadas de todas as threads durante
+# 'segundos', para flamegraph. Ocupa uma thread do pool enquanto amostra.
+@app.get("/debug/perfil", include_in_schema=False)
+def debug_perfil(segundos: float = Query(10, gt=0, le=60), hz: int = Query(100, ge=1, le=1000),
+                 user=Depends(require("usuarios"))):
+    if not metricas.PERFIL:
+        raise HTTPException(status_code=404, detail="Perfilador desligado (PARADAS_PERFIL=1)")
+    return Response(metricas.perfil(segundos, hz), media_type="text/plain; charset=utf-8")
+
 # ---- Main ----
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    uvicorn.run(app, host="0.0.0.0", port=8001,
+                timeout_graceful_shutdown=SSE_PING_S)   # rede de segurança para conexões que não fecham
@@ -0,0 +1,150 @@
+# server/benchmark.py
+# Benchmark em processo das funções de domínio, dos relatórios e da API (TestClient) sobre
+# uma carga sintética do gerar_carga.py. Mostra vazão e latência p50/p99 por operação; com
+# --salvar/--comparar vira verificação de regressão local (sai com código 1 se piorar).
+#
+#   python benchmark.py --teares 60 --meses 6 --salvar base.json
+#   python benchmark.py --teares 60 --meses 6 --comparar base.json
+#   python benchmark.py --dados /tmp/carga --backend sqlite
+import argparse, json, os, shutil, sys, tempfile, threading, time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import gerar_carga
+
+Resultado = Dict[str, float]
+
+
+def medir(fn: Callable[[int], Any], n: int, aquecimento: int = 2) -> Resultado:
+    """Roda fn(i) n vezes (depois do aquecimento) e devolve vazão e latências em ms."""
+    for i in range(aquecimento):
+        fn(i)
+    tempos: List[float] = []
+    inicio = time.perf_counter()
+    for i in range(n):
+        t = time.perf_counter()
+        fn(i)
+        tempos.append(time.perf_counter() - t)
+    total = time.perf_counter() - inicio
+    tempos.sort()
+    def pct(p: float) -> float:
+        return tempos[min(len(tempos) - 1, int(p * len(tempos)))] * 1000
+    return {'n': n, 'ops_s': round(n / total, 1), 'p50_ms': round(pct(0.50), 3), 'p99_ms': round(pct(0.99), 3)}
+
+def _casos(n: int) -> Dict[str, tuple]:
+    """nome -> (fn(i), repetições). Importa a aplicação: PARADAS_DATA_DIR já deve estar definido."""
+    import domain, indice, relatorios, storage
+    from fastapi.testclient import TestClient
+    import app as app_mod
+
+    for th in threading.enumerate():
+        if th.name == 'arquiva-status':
+            th.join()   # arquivamento inicial em segundo plano: fora da medição
+    teares = [int(t['codigo']) for t in storage.view('teares')]
+    usuarios = list(storage.view('users'))
+    ti = next(u for u in usuarios if int(u['role']) == 6)
+    cliente = TestClient(app_mod.app)
+    h = {'Authorization': f'Bearer carga-{ti["cod"]}'}
+    hoje = datetime.now(domain.TZ).date()
+    de, ate = hoje - timedelta(days=30), hoje
+    mes = (datetime.now(domain.TZ) - timedelta(days=30)).replace(microsecond=0).isoformat()
+
+    def get(url: str, **kw):
+        def fn(_i):
+            r = cliente.get(url, headers={**h, **kw})
+            assert r.status_code == 200, (url, r.status_code, r.text[:200])
+        return fn
+
+    def salvar(i: int):
+        agora = datetime.now(domain.TZ)
+        domain.salvar_evento(domain.Evento(tear=teares[i % len(teares)], data_hora=agora, status=1,
+                                           hora_registro=agora, motivo=None, turno=domain.turno_atual(agora)))
+
+    def post_funcionando(i: int):
+        agora = datetime.now(domain.TZ)
+        r = cliente.post('/funcionando', headers=h,
+                         json={'tear': teares[i % len(teares)], 'data_hora': agora.isoformat()})
+        assert r.status_code == 200, r.text[:200]
+
+    # leituras primeiro: as escritas do fim invalidam caches (como na fábrica)
+    return {
+        'domain.status_atual_dos_teares': (lambda _i: domain.status_atual_dos_teares(), n * 10),
+        'domain.user_by_token': (lambda i: domain.user_by_token(f'carga-{usuarios[i % len(usuarios)]["cod"]}'), n * 100),
+        'indice.consultar 30d': (lambda _i: indice.consultar(datetime.fromisoformat(mes)), n),
+        'relatorios.totais 30d': (lambda _i: relatorios.totais_por_dia_turno(de, ate), n),
+        'relatorios.pareto 30d': (lambda _i: relatorios.pareto_motivos(de, ate), n),
+        'relatorios.turnos 30d': (lambda _i: relatorios.totais_por_turno(de, ate), n),
+        'relatorios.disponibilidade 30d': (lambda _i: relatorios.disponibilidade(de, ate, agrupar=('tear', 'turno')), n),
+        'GET /status-teares': (get('/status-teares'), n * 5),
+        'GET /eventos 30d': (get(f'/eventos?from={mes}'), n),
+        'GET /eventos 30d gzip': (get(f'/eventos?from={mes}', **{'Accept-Encoding': 'gzip'}), n),
+        'GET /eventos tudo': (get('/eventos'), max(n // 5, 3)),
+        'GET /relatorios/totais 30d': (get(f'/relatorios/totais?inicio={de}&fim={ate}'), n),
+        'GET /relatorios/pareto-motivos 30d': (get(f'/relatorios/pareto-motivos?inicio={de}&fim={ate}'), n),
+        'domain.salvar_evento': (salvar, n * 5),
+        'POST /funcionando': (post_funcionando, n * 5),
+        'relatorios.totais 30d após escritas': (lambda _i: relatorios.totais_por_dia_turno(de, ate), n),
+    }
+
+def comparar(atual: Dict[str, Resultado], base: Dict[str, Resultado], tolerancia: float) -> List[str]:
+    """Operações cujo p50 piorou mais que 'tolerancia' (fração) em relação à base."""
+    piores = []
+    for nome, r in atual.items():
+        b = base.get(nome)
+        if b and r['p50_ms'] > b['p50_ms'] * (1 + tolerancia):
+            piores.append(f'{nome}: p50 {b["p50_ms"]} -> {r["p50_ms"]} ms')
+    return piores
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description='Benchmark do domínio, relatórios e API sobre carga sintética.')
+    ap.add_argument('--dados', help='diretório já gerado (é copiado; o original não é alterado)')
+    ap.add_argument('--teares', type=int, default=60)
+    ap.add_argument('--meses', type=int, default=6)
+    ap.add_argument('--semente', type=int, default=1)
+    ap.add_argument('--backend', choices=['json', 'sqlite'], default='json')
+    ap.add_argument('-n', type=int, default=20, help='repetições base por operação')
+    ap.add_argument('--filtro', help='só operações cujo nome contém este texto')
+    ap.add_argument('--salvar', help='grava os resultados em JSON')
+    ap.add_argument('--comparar', help='JSON de uma execução anterior (--salvar)')
+    ap.add_argument('--tolerancia', type=float, default=0.25, help='piora de p50 aceita no --comparar')
+    a = ap.parse_args(argv)
+
+    trabalho = tempfile.mkdtemp(prefix='paradas-bench-')
+    dados = os.path.join(trabalho, 'data')
+    try:
+        if a.dados:
+            shutil.copytree(a.dados, dados)
+            gerar_carga.renovar_sessoes(dados)   # as do diretório podem já ter expirado
+        else:
+            print('carga:', gerar_carga.gerar(dados, a.teares, a.meses, a.semente), file=sys.stderr)
+        # o storage lê o ambiente na importação
+        os.environ['PARADAS_DATA_DIR'] = dados
+        os.environ['PARADAS_STORAGE'] = a.backend
+        t = time.perf_counter()
+        casos = _casos(a.n)
+        print(f'importação/carga inicial: {time.perf_counter() - t:.2f}s', file=sys.stderr)
+
+        resultados: Dict[str, Resultado] = {}
+        print(f'{"operação":<40} {"n":>6} {"ops/s":>10} {"p50 ms":>10} {"p99 ms":>10}')
+        for nome, (fn, n) in casos.items():
+            if a.filtro and a.filtro not in nome:
+                continue
+            r = resultados[nome] = medir(fn, n)
+            print(f'{nome:<40} {r["n"]:>6} {r["ops_s"]:>10} {r["p50_ms"]:>10} {r["p99_ms"]:>10}')
+    finally:
+        shutil.rmtree(trabalho, ignore_errors=True)
+
+    if a.salvar:
+        with open(a.salvar, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+    if a.comparar:
+        with open(a.comparar, 'r', encoding='utf-8') as f:
+            piores = comparar(resultados, json.load(f), a.tolerancia)
+        for linha in piores:
+            print('REGRESSÃO', linha)
+        return 1 if piores else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+# server/calendario.py
+# Calendário de turnos pré-compilado a partir de turnos.json: responde "qual instância
+# de turno contém o instante t e quais seus limites" sem reler arquivo nem reparsear "HH:MM".
+from array import array
+from datetime import date, datetime, time, timedelta
+from typing import Iterable, List, Mapping, NamedTuple, Optional
+
+MIN_SEMANA = 7 * 24 * 60
+
+
+class Instancia(NamedTuple):
+    inicio: datetime
+    fim: datetime
+    turno: int
+
+
+class Segmento(NamedTuple):
+    inicio: datetime
+    fim: datetime
+    dia: date          # dia civil do pedaço (após o corte na meia-noite)
+    turno: int
+    inicio_turno: datetime  # início da instância de turno a que o pedaço pertence
+
+
+def _hhmm(hhmm: str) -> time:
+    h, m = map(int, hhmm.split(':'))
+    return time(hour=h, minute=m)
+
+
+class CalendarioTurnos:
+    def __init__(self, turnos: Iterable[Mapping]):
+        # por dia da semana (1..7): [(inicio, duração, turno)] em ordem de início
+        self._por_dia: dict[int, List[tuple]] = {d: [] for d in range(1, 8)}
+        # minuto da semana (seg 00:00 = 0) -> índice em self._janelas (-1 = fora de turno)
+        self._janelas: List[tuple] = []
+        self._tabela = array('h', [-1]) * MIN_SEMANA
+        for t in turnos:
+            ini, fim = _hhmm(t['inicio']), _hhmm(t['fim'])
+            dur = (fim.hour * 60 + fim.minute) - (ini.hour * 60 + ini.minute)
+            if dur <= 0:
+                dur += 24 * 60  # cruza a meia-noite (ex.: 22:00-05:00)
+            dow, turno = int(t['dia_semana']), int(t['turno'])
+            self._por_dia[dow].append((ini, timedelta(minutes=dur), turno))
+            k = len(self._janelas)
+            m0 = (dow - 1) * 1440 + ini.hour * 60 + ini.minute
+            self._janelas.append((m0, dur, turno))
+            for m in range(m0, m0 + dur):
+                if self._tabela[m % MIN_SEMANA] == -1:  # em sobreposição vale o primeiro cadastrado
+                    self._tabela[m % MIN_SEMANA] = k
+        for lst in self._por_dia.values():
+            lst.sort(key=lambda x: x[0])
+
+    def instancia(self, dt: datetime) -> Optional[Instancia]:
+        """Instância de turno que contém dt (ou None se dt cai fora de qualquer turno)."""
+        m = (dt.isoweekday() - 1) * 1440 + dt.hour * 60 + dt.minute
+        k = self._tabela[m]
+        if k < 0:
+            return None
+        m0, dur, turno = self._janelas[k]
+        ini = dt.replace(second=0, microsecond=0) - timedelta(minutes=(m - m0) % MIN_SEMANA)
+        return Instancia(ini, ini + timedelta(minutes=dur), turno)
+
+    def turno_em(self, dt: datetime, tolerancia_min: int = 0) -> Optional[int]:
+        """
+        Turno vigente em dt. Com tolerância, os primeiros `tolerancia_min` minutos de um turno
+        ainda contam para o turno anterior (se ele termina exatamente onde este começa).
+        """
+        inst = self.instancia(dt)
+        if inst is None:
+            return None
+        if tolerancia_min and dt < inst.inicio + timedelta(minutes=tolerancia_min):
+            ant = self.instancia(inst.inicio - timedelta(minutes=1))
+            if ant is not None and ant.fim == inst.inicio:
+                return ant.turno
+        return inst.turno
+
+    def instancias(self, inicio: datetime, fim: datetime, turnos: Optional[Iterable[int]] = None) -> List[Instancia]:
+        """Instâncias de turno que se sobrepõem a [inicio, fim), em ordem de início."""
+        sel = set(turnos) if turnos else None
+        out: List[Instancia] = []
+        d = inicio.date() - timedelta(days=1)  # turno da véspera que ainda está aberto em 'inicio'
+        while d <= fim.date():
+            for ini, dur, turno in self._por_dia[d.isoweekday()]:
+                if sel is not None and turno not in sel:
+                    continue
+                a = datetime.combine(d, ini, tzinfo=inicio.tzinfo)
+                b = a + dur
+                if b > inicio and a < fim:
+                    out.append(Instancia(a, b, turno))
+            d += timedelta(days=1)
+        out.sort()
+        return out
+
+    def segmentos(self, inicio: datetime, fim: datetime, turnos: Optional[Iterable[int]] = None) -> List[Segmento]:
+        """
+        Divide [inicio, fim) pelas instâncias de turno e pela meia-noite, em lote.
+        Tempo fora de qualquer turno (ou de turnos não selecionados) fica de fora.
+        """
+        out: List[Segmento] = []
+        for inst in self.instancias(inicio, fim, turnos):
+            a, b = max(inst.inicio, inicio), min(inst.fim, fim)
+            while a < b:
+                meia_noite = datetime.combine(a.date() + timedelta(days=1), time(0), tzinfo=a.tzinfo)
+                c = min(b, meia_noite)
+                out.append(Segmento(a, c, a.date(), inst.turno, inst.inicio))
+                a = c
+        return out
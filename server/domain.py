@@ -1,13 +1,17 @@
-import secrets, hashlib, hmac
-from typing import Optional, List, Dict, Any, Tuple
+import logging, os, secrets, hashlib, hmac
+from typing import Optional, List, Dict, Any, Tuple, Callable
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, Field
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, Field
 from typing import List, Optional
-from datetime import datetime, time, timedelta
+from datetime import datetime
 from dateutil import tz
+from threading import Event, Lock, Thread
+import metricas
 import storage
+import sessoes
+from calendario import CalendarioTurnos
 from dateutil import tz
 TZ = tz.gettz("America/Sao_Paulo")
 
@@ -15,21 +19,33 @@ def to_local(dt):
     if dt.tzinfo is None: return dt.replace(tzinfo=TZ)
     return dt.astimezone(TZ)
 
+# códigos de motivo vão para um array('h') no índice (e -1 é "sem motivo")
+MOTIVO_MAX = 2 ** 15 - 1
+
 class Evento(BaseModel):
     tear: int = Field(..., ge=1)
     data_hora: datetime
     status: int = Field(..., ge=0, le=1)  # 1=funcionando, 0=parado
     hora_registro: datetime
-    motivo: Optional[int] = None
+    motivo: Optional[int] = Field(None, ge=0, le=MOTIVO_MAX)
     turno: Optional[int] = None
 
 class NovoRegistro(BaseModel):
     tear: int
     data_hora: datetime
-    motivo: Optional[int] = None  # só para parada
+    motivo: Optional[int] = Field(None, ge=0, le=MOTIVO_MAX)  # só para parada
+
+class RegistroLote(NovoRegistro):
+    status: int = Field(..., ge=0, le=1)  # 0=parada, 1=funcionando
+
+class ResultadoLote(BaseModel):
+    indice: int                   # posição do item na lista enviada
+    ok: bool
+    evento: Optional[Evento] = None
+    erro: Optional[str] = None
 
 class Motivo(BaseModel):
-    codigo: int
+    codigo: int = Field(..., ge=0, le=MOTIVO_MAX)
     descricao: str
 
 class StatusAtual(BaseModel):
@@ -77,69 +93,33 @@ class LoginPayload(BaseModel):
     senha: str
 
 
-def _parse_hhmm(hhmm: str) -> time:
-    h, m = map(int, hhmm.split(':'))
-    return time(hour=h, minute=m)
+# ---------- Calendário de turnos ----------
+# Compilado uma vez a cada mudança em turnos.json (upsert_turno/delete_turno ou edição
+# externa): a view do storage só troca de objeto quando o conteúdo muda.
+_calendario: Optional[CalendarioTurnos] = None
+_calendario_base: Optional[tuple] = None
+
+def calendario() -> CalendarioTurnos:
+    global _calendario, _calendario_base
+    base = storage.view('turnos')
+    if base is not _calendario_base:
+        _calendario, _calendario_base = CalendarioTurnos(base), base
+    return _calendario
 
 def turno_atual(dt: datetime) -> int:
     """Retorna o número do turno vigente no instante dt (timezone local)."""
-    d = dt.isoweekday()  # 1..7
-    turnos = storage.read('turnos')
-
-    ttime = dt.time()
-    for t in turnos:
-        if t['dia_semana'] != d:
-            continue
-        ini = _parse_hhmm(t['inicio'])
-        fim = _parse_hhmm(t['fim'])
-
-        if ini < fim:
-            # janela normal (ex.: 05:00-14:00)
-            if ini <= ttime < fim:
-                return int(t['turno'])
-        else:
-            # cruza meia-noite (ex.: 22:00-05:00) → vale se (>= ini) OU (< fim)
-            if (ttime >= ini) or (ttime < fim):
-                return int(t['turno'])
-
+    turno = calendario().turno_em(dt)
     # fallback se nada casar
-    return 1
-
-def _dt_replace(d: datetime, t: time) -> datetime:
-    return d.replace(hour=t.hour, minute=t.minute, second=0, microsecond=0)
+    return turno if turno is not None else 1
 
 def janela_turno_vigente(agora: datetime) -> tuple[datetime, datetime, int]:
     """
     Retorna (inicio, fim, turno_num) da janela do turno EM QUE O USUÁRIO ESTÁ AGORA.
     Para turnos que cruzam a meia-noite (ex.: 22:00→05:00), 'fim' é no dia seguinte.
     """
-    d = agora.isoweekday()          # 1..7
-    ttime = agora.time()
-    turnos = storage.read('turnos')
-
-    for t in turnos:
-        if t['dia_semana'] != d:
-            continue
-        ini = _parse_hhmm(t['inicio'])
-        fim = _parse_hhmm(t['fim'])
-
-        if ini < fim:
-            # janela normal no mesmo dia
-            dt_ini = _dt_replace(agora, ini)
-            dt_fim = _dt_replace(agora, fim)
-            if dt_ini <= agora < dt_fim:
-                return dt_ini, dt_fim, int(t['turno'])
-        else:
-            # cruza meia-noite: [ini, 24h) U [00:00, fim)
-            if ttime >= ini:
-                dt_ini = _dt_replace(agora, ini)                 # hoje às 22:00
-                dt_fim = _dt_replace(agora + timedelta(days=1), fim)  # amanhã às 05:00
-                return dt_ini, dt_fim, int(t['turno'])
-            if ttime < fim:
-                dt_ini = _dt_replace(agora - timedelta(days=1), ini)  # ontem às 22:00
-                dt_fim = _dt_replace(agora, fim)                      # hoje às 05:00
-                return dt_ini, dt_fim, int(t['turno'])
-
+    inst = calendario().instancia(agora)
+    if inst is not None:
+        return inst.inicio, inst.fim, inst.turno
     # fallback (não deve acontecer se turnos estiverem configurados)
     dt_ini = agora.replace(hour=5, minute=0, second=0, microsecond=0)
     dt_fim = agora.replace(hour=14, minute=0, second=0, microsecond=0)
@@ -148,158 +128,278 @@ def janela_turno_vigente(agora: datetime) -> tuple[datetime, datetime, int]:
 
 def inicio_turno_atual(agora: datetime) -> datetime:
     """Retorna o datetime exato do início do turno vigente no instante 'agora'."""
-    d = agora.isoweekday()
-    turnos = storage.read('turnos')
-    ttime = agora.time()
-
-    for t in turnos:
-        if t['dia_semana'] != d:
-            continue
-        ini = _parse_hhmm(t['inicio'])
-        fim = _parse_hhmm(t['fim'])
-
-        if ini < fim:
-            # janela normal no mesmo dia
-            dt_ini = agora.replace(hour=ini.hour, minute=ini.minute, second=0, microsecond=0)
-            dt_fim = agora.replace(hour=fim.hour, minute=fim.minute, second=0, microsecond=0)
-            if dt_ini <= agora < dt_fim:
-                return dt_ini
-        else:
-            # janela cruza meia-noite: [ini, 24h) U [00:00, fim)
-            if ttime >= ini:
-                # estamos na parte "hoje >= ini"
-                return agora.replace(hour=ini.hour, minute=ini.minute, second=0, microsecond=0)
-            if ttime < fim:
-                # estamos após meia-noite, turno começou ontem às 'ini'
-                ontem = (agora - timedelta(days=1)).replace(
-                    hour=ini.hour, minute=ini.minute, second=0, microsecond=0
-                )
-                return ontem
-
+    inst = calendario().instancia(agora)
+    if inst is not None:
+        return inst.inicio
     # fallback: 05:00 do mesmo dia
     return agora.replace(hour=5, minute=0, second=0, microsecond=0)
 
 
-def listar_eventos() -> List[Evento]:
-    return [Evento(**e) for e in storage.read('status')]
-
 def salvar_evento(ev: Evento):
-    data = storage.read('status')
-    data.append(jsonable_encoder(ev))  # <- garante serialização (datetime -> ISO)
-    storage.write('status', data)
+    salvar_eventos([ev])
 
+@metricas.cronometrado('salvar_eventos')
+def salvar_eventos(evs: List[Evento]):
+    # append no journal: custo constante, independente do tamanho do histórico;
+    # um lote inteiro vai numa única escrita + fsync
+    storage.append_lote('status', [jsonable_encoder(ev) for ev in evs])  # <- garante serialização (datetime -> ISO)
+    for ev in evs:
+        _notifica(ev)
 
-def status_atual_por_tear(total: int) -> List[StatusAtual]:
-    eventos = listar_eventos()
-    por = {i: [] for i in range(1, total + 1)}
-    for e in eventos:
-        por.setdefault(e.tear, []).append(e)
-    agora = datetime.now(TZ)
-    saida: List[StatusAtual] = []
-    for tear, lst in por.items():
-        lst = sorted(lst, key=lambda x: x.data_hora)
-        if not lst:
-            saida.append(StatusAtual(tear=tear, status=1, desde=None, horas=None))
+# callbacks chamados após cada evento gravado (rollups de relatório etc.)
+_ouvintes_evento: List[Callable[[Evento], None]] = []
+
+def ao_salvar_evento(fn: Callable[[Evento], None]):
+    _ouvintes_evento.append(fn)
+    return fn
+
+# callbacks chamados quando o histórico é reescrito por inteiro (por outro processo, p.ex.):
+# quem mantém algo derivado dos eventos deve descartar e recalcular
+_ouvintes_recarga: List[Callable[[], None]] = []
+
+def ao_recarregar_eventos(fn: Callable[[], None]):
+    _ouvintes_recarga.append(fn)
+    return fn
+
+log = logging.getLogger('paradas')
+ERROS_OUVINTE = metricas.Contador('paradas_ouvinte_erros_total',
+                                  'Falhas ao aplicar um evento já gravado numa estrutura derivada', ('ouvinte',))
+
+def _tenta(fn: Callable[[], None]):
+    try:
+        fn()
+    except Exception:
+        log.exception('falha ao descartar %s.%s', fn.__module__, fn.__name__)
+
+def _notifica(ev: Evento):
+    """
+    Estado e ouvintes de um evento já gravado. O evento é durável: uma falha aqui não pode
+    virar erro da requisição (o cliente repetiria e duplicaria). Ela é registrada e o que
+    aquele ouvinte mantém é descartado (os ouvintes de recarga do mesmo módulo) para recálculo.
+    """
+    try:
+        _atualiza_estado(ev)
+    except Exception:
+        log.exception('falha ao aplicar evento no estado atual; reconstruindo')
+        ERROS_OUVINTE.inc('estado')
+        _tenta(reconstruir_estado)
+    for fn in _ouvintes_evento:
+        try:
+            fn(ev)
+        except Exception:
+            log.exception('ouvinte %s.%s falhou; descartando para recálculo', fn.__module__, fn.__name__)
+            ERROS_OUVINTE.inc(f'{fn.__module__}.{fn.__name__}')
+            for descarta in _ouvintes_recarga:
+                if descarta.__module__ == fn.__module__:
+                    _tenta(descarta)
+
+
+# ---------- Estado atual por tear (materializado) ----------
+# tear -> {'status', 'desde', 'ultimo': Evento}. Reconstruído na carga do módulo e
+# atualizado a cada salvar_evento, para o dashboard não varrer o histórico inteiro.
+_estado: Dict[int, Dict[str, Any]] = {}
+_estado_lock = Lock()
+
+def _estado_da_lista(lst: List[Tuple[datetime, Any]], inicial: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """lst: [(data_hora, registro)] já ordenada por data_hora; inicial: estado antes do primeiro."""
+    status = inicial['status'] if inicial else None
+    desde = inicial['desde'] if inicial else None
+    for dt, r in lst:
+        if int(r['status']) != status:
+            status, desde = int(r['status']), dt
+    return {'status': status, 'desde': desde, 'ultimo': Evento(**lst[-1][1])}
+
+def _estado_do_historico(tear: Optional[int] = None) -> Dict[int, Dict[str, Any]]:
+    # meses arquivados entram pelo estado resumido no manifesto; só a janela quente é varrida
+    arquivado = storage.estado_arquivado()
+    por: Dict[int, List[Tuple[datetime, Any]]] = {}
+    for r in storage.view('status'):
+        if tear is None or int(r['tear']) == tear:
+            por.setdefault(int(r['tear']), []).append((datetime.fromisoformat(r['data_hora']), r))
+    saida = {}
+    for cod in sorted(set(por) | {t for t in arquivado if tear is None or t == tear}):
+        lst = sorted(por.get(cod, []), key=lambda x: x[0])  # estável: empate mantém ordem de gravação
+        arq = arquivado.get(cod)
+        if arq is None:
+            saida[cod] = _estado_da_lista(lst)
             continue
-        last = lst[-1]
-        desde = last.data_hora
-        for prev in reversed(lst[:-1]):
-            if prev.status != last.status:
-                break
-            desde = prev.data_hora
-        horas = (agora - desde).total_seconds() / 3600.0 if desde else None
-        saida.append(StatusAtual(tear=tear, status=last.status, desde=desde, horas=round(horas, 2) if horas else None))
+        inicial = {'status': int(arq['status']), 'desde': datetime.fromisoformat(arq['desde']),
+                   'ultimo': Evento(**arq['ultimo'])}
+        if not lst:
+            saida[cod] = inicial
+        elif lst[0][0] >= inicial['ultimo'].data_hora:
+            saida[cod] = _estado_da_lista(lst, inicial)
+        else:
+            # evento retroativo anterior ao fim do arquivo: refaz o tear com o histórico completo
+            todos = [(datetime.fromisoformat(r['data_hora']), r) for r in storage.consultar_eventos(teares=[cod])]
+            saida[cod] = _estado_da_lista(todos)
     return saida
 
-def status_atual_dos_teares() -> List[StatusAtual]:
-    teares = storage.read('teares')  # [{codigo, nome}, ...]
-    eventos = listar_eventos()
-    por: dict[int, List[Evento]] = {}
-    for e in eventos:
-        por.setdefault(e.tear, []).append(e)
+def reconstruir_estado():
+    """Recalcula o estado atual de todos os teares a partir do histórico gravado."""
+    storage.acompanhar('status')  # o que outros processos gravaram até aqui já vem no histórico
+    novo = _estado_do_historico()
+    with _estado_lock:
+        _estado.clear()
+        _estado.update(novo)
+
+def _atualiza_estado(ev: Evento):
+    with _estado_lock:
+        st = _estado.get(ev.tear)
+        if st is None or ev.data_hora >= st['ultimo'].data_hora:
+            desde = st['desde'] if (st and st['status'] == ev.status) else ev.data_hora
+            _estado[ev.tear] = {'status': ev.status, 'desde': desde, 'ultimo': ev}
+            return
+    # evento retroativo (TI pode registrar no passado): recalcula só este tear
+    recalculado = _estado_do_historico(ev.tear)
+    with _estado_lock:
+        _estado.update(recalculado)
+
+# ---------- Vários processos (uvicorn --workers N) ----------
+# Eventos gravados por outro worker chegam pelo storage.acompanhar e seguem o mesmo
+# caminho de um evento local: estado, índice, rollups, SSE.
+SYNC_S = float(os.getenv('PARADAS_SYNC_MS', '1000')) / 1000
+RECARGA_MIN = int(os.getenv('PARADAS_RECARGA_MIN', '5000'))   # acima disso (importação), recalcula tudo de uma vez
+
+def recarregar_eventos():
+    """Recalcula o estado e tudo que deriva dos eventos (histórico reescrito ou carga em massa)."""
+    reconstruir_estado()
+    for fn in _ouvintes_recarga:
+        fn()
+
+def sincronizar_processos():
+    novos = storage.acompanhar('status')
+    if novos is None or len(novos) > RECARGA_MIN:
+        recarregar_eventos()
+        return
+    for r in novos:
+        _notifica(Evento(**r))
+
+def _loop_sincronizacao():
+    while not Event().wait(SYNC_S):
+        try:
+            sincronizar_processos()
+        except Exception:
+            log.exception('falha ao sincronizar com outros processos')   # tenta de novo no próximo ciclo
+
+def _status_de(cod: int, nome: Optional[str], agora: datetime, horas_zero_none: bool = False) -> StatusAtual:
+    st = _estado.get(cod)
+    if not st:
+        # Sem eventos: assume funcionando
+        return StatusAtual(tear=cod, nome=nome, status=1, desde=None, horas=None)
+    desde = st['desde']
+    horas = (agora - desde).total_seconds() / 3600.0
+    if horas_zero_none and not horas:
+        horas = None
+    return StatusAtual(
+        tear=cod, nome=nome, status=st['status'],
+        desde=desde, horas=round(horas, 2) if horas is not None else None
+    )
+
+def status_atual_por_tear(total: int) -> List[StatusAtual]:
     agora = datetime.now(TZ)
-    saida: List[StatusAtual] = []
-    for t in sorted(teares, key=lambda x: int(x['codigo'])):
-        cod = int(t['codigo'])
-        lst = sorted(por.get(cod, []), key=lambda x: x.data_hora)
-        if not lst:
-            # Sem eventos: assume funcionando
-            saida.append(StatusAtual(tear=cod, nome=t.get('nome'), status=1, desde=None, horas=None))
-            continue
-        last = lst[-1]
-        # “desde” do mesmo status
-        desde = last.data_hora
-        for prev in reversed(lst[:-1]):
-            if prev.status != last.status:
-                break
-            desde = prev.data_hora
-        horas = (agora - desde).total_seconds()/3600.0 if desde else None
-        saida.append(StatusAtual(
-            tear=cod, nome=t.get('nome'), status=last.status,
-            desde=desde, horas=round(horas, 2) if horas is not None else None
-        ))
-    return saida
+    with _estado_lock:
+        extras = sorted(c for c in _estado if not (1 <= c <= total))
+        return [_status_de(c, None, agora, horas_zero_none=True)
+                for c in list(range(1, total + 1)) + extras]
 
-def registrar_parada(payload: NovoRegistro) -> Evento:
-    if not tear_existe(payload.tear):
-        raise ValueError('Tear inexistente. Cadastre o tear antes de registrar.')
+@metricas.cronometrado('status_atual_dos_teares')
+def status_atual_dos_teares() -> List[StatusAtual]:
+    teares = storage.view('teares')  # [{codigo, nome}, ...]
     agora = datetime.now(TZ)
+    with _estado_lock:
+        return [_status_de(int(t['codigo']), t.get('nome'), agora)
+                for t in sorted(teares, key=lambda x: int(x['codigo']))]
+
+def status_do_tear(cod: int) -> Optional[StatusAtual]:
+    """Status atual de um tear cadastrado (None se o tear não existe)."""
+    t = next((t for t in storage.view('teares') if int(t['codigo']) == int(cod)), None)
+    if t is None:
+        return None
+    with _estado_lock:
+        return _status_de(int(cod), t.get('nome'), datetime.now(TZ))
+
+def _novo_evento(payload: NovoRegistro, status: int, agora: datetime,
+                 janela: tuple[datetime, datetime, int], teares: set) -> Evento:
+    """Valida e monta o evento (sem gravar). Lança ValueError se o registro não for aceito."""
+    if int(payload.tear) not in teares:
+        raise ValueError('Tear inexistente. Cadastre o tear antes de registrar.')
     local_dt = to_local(payload.data_hora)
-
-    ini, fim, turno_vigente = janela_turno_vigente(agora)
-    if not (ini <= local_dt < fim):
-        raise ValueError(
-            f'Data/Hora fora da janela do turno vigente '
-            f'({ini.strftime("%d/%m %H:%M")}–{fim.strftime("%d/%m %H:%M")})'
-        )
-
-    ev = Evento(
+    if status == 0:
+        ini, fim, turno = janela
+        if not (ini <= local_dt < fim):
+            raise ValueError(
+                f'Data/Hora fora da janela do turno vigente '
+                f'({ini.strftime("%d/%m %H:%M")}–{fim.strftime("%d/%m %H:%M")})'
+            )
+        motivo = payload.motivo
+    else:
+        turno = turno_atual(local_dt)
+        motivo = None
+    return Evento(
         tear=payload.tear,
         data_hora=local_dt,
-        status=0,
+        status=status,
         hora_registro=agora,
-        motivo=payload.motivo,
-        turno=turno_vigente,
+        motivo=motivo,
+        turno=turno,
     )
+
+def _codigos_teares() -> set:
+    return {int(t['codigo']) for t in storage.view('teares')}
+
+def registrar_parada(payload: NovoRegistro) -> Evento:
+    agora = datetime.now(TZ)
+    ev = _novo_evento(payload, 0, agora, janela_turno_vigente(agora), _codigos_teares())
     salvar_evento(ev)
     return ev
 
 def registrar_funcionando(payload: NovoRegistro) -> Evento:
-    if not tear_existe(payload.tear):
-        raise ValueError('Tear inexistente. Cadastre o tear antes de registrar.')
     agora = datetime.now(TZ)
-    local_dt = to_local(payload.data_hora)
-    turno_registro = turno_atual(local_dt)
-    ev = Evento(
-        tear=payload.tear,
-        data_hora=local_dt,
-        status=1,
-        hora_registro=agora,
-        motivo=None,
-        turno=turno_registro,
-    )
+    ev = _novo_evento(payload, 1, agora, janela_turno_vigente(agora), _codigos_teares())
     salvar_evento(ev)
     return ev
 
+def registrar_lote(itens: List[RegistroLote]) -> List[ResultadoLote]:
+    """
+    Registra paradas/funcionamentos de vários teares de uma vez: uma só janela de turno,
+    uma só consulta aos teares e uma única gravação durável. Itens inválidos voltam com
+    o erro e não impedem a gravação dos demais.
+    """
+    agora = datetime.now(TZ)
+    janela = janela_turno_vigente(agora)
+    teares = _codigos_teares()
+    resultados: List[ResultadoLote] = []
+    aceitos: List[Evento] = []
+    for i, item in enumerate(itens):
+        try:
+            ev = _novo_evento(item, item.status, agora, janela, teares)
+        except ValueError as e:
+            resultados.append(ResultadoLote(indice=i, ok=False, erro=str(e)))
+            continue
+        aceitos.append(ev)
+        resultados.append(ResultadoLote(indice=i, ok=True, evento=ev))
+    if aceitos:
+        salvar_eventos(aceitos)
+    return resultados
+
 
 def upsert_turno(t: Turno) -> Turno:
-    rows = storage.read('turnos')
-    # substitui se existir mesmo (dia_semana, turno)
-    updated = False
-    for i, r in enumerate(rows):
-        if r['dia_semana'] == t.dia_semana and r['turno'] == t.turno:
-            rows[i] = t.model_dump()
-            updated = True
-            break
-    if not updated:
-        rows.append(t.model_dump())
-    storage.write('turnos', rows)
+    with storage.transacao('turnos') as rows:
+        # substitui se existir mesmo (dia_semana, turno)
+        updated = False
+        for i, r in enumerate(rows):
+            if r['dia_semana'] == t.dia_semana and r['turno'] == t.turno:
+                rows[i] = t.model_dump()
+                updated = True
+                break
+        if not updated:
+            rows.append(t.model_dump())
     return t
 
 def delete_turno(dia_semana: int, turno: int) -> dict:
-    rows = storage.read('turnos')
-    new = [r for r in rows if not (r['dia_semana'] == dia_semana and r['turno'] == turno)]
-    storage.write('turnos', new)
+    with storage.transacao('turnos') as rows:
+        rows[:] = [r for r in rows if not (r['dia_semana'] == dia_semana and r['turno'] == turno)]
     return {'ok': True}
 
 # --- Motivos de Parada (CRUD simples) ----
@@ -307,20 +407,18 @@ def listar_motivos():
     return storage.read('motivos')
 
 def upsert_motivo(m: Motivo) -> Motivo:
-    rows = storage.read('motivos')
-    for i, r in enumerate(rows):
-        if int(r['codigo']) == int(m.codigo):
-            rows[i] = m.model_dump()
-            storage.write('motivos', rows)
-            return m
-    rows.append(m.model_dump())
-    storage.write('motivos', rows)
+    with storage.transacao('motivos') as rows:
+        for i, r in enumerate(rows):
+            if int(r['codigo']) == int(m.codigo):
+                rows[i] = m.model_dump()
+                break
+        else:
+            rows.append(m.model_dump())
     return m
 
 def delete_motivo(codigo: int) -> dict:
-    rows = storage.read('motivos')
-    rows = [r for r in rows if int(r['codigo']) != int(codigo)]
-    storage.write('motivos', rows)
+    with storage.transacao('motivos') as rows:
+        rows[:] = [r for r in rows if int(r['codigo']) != int(codigo)]
     return {'ok': True}
 
 # ---------- TEARES (máquinas) ----------
@@ -337,32 +435,28 @@ def _nome_padrao(codigo: int) -> str:
     return f"tear{codigo:02d}"
 
 def criar_tear(nome: str | None = None) -> Tear:
-    teares = storage.read('teares')
-    codigo = _proximo_codigo(teares)
-    nome_final = nome.strip() if (nome and nome.strip()) else _nome_padrao(codigo)
-    novo = Tear(codigo=codigo, nome=nome_final)
-    teares.append(novo.model_dump())
-    storage.write('teares', teares)
+    with storage.transacao('teares') as teares:
+        codigo = _proximo_codigo(teares)
+        nome_final = nome.strip() if (nome and nome.strip()) else _nome_padrao(codigo)
+        novo = Tear(codigo=codigo, nome=nome_final)
+        teares.append(novo.model_dump())
     return novo
 
 def renomear_tear(codigo: int, novo_nome: str) -> Tear:
-    teares = storage.read('teares')
-    for i, t in enumerate(teares):
-        if int(t['codigo']) == int(codigo):
-            teares[i]['nome'] = (novo_nome or '').strip() or _nome_padrao(codigo)
-            storage.write('teares', teares)
-            return Tear(**teares[i])
-    raise ValueError('Tear não encontrado')
+    with storage.transacao('teares') as teares:
+        for i, t in enumerate(teares):
+            if int(t['codigo']) == int(codigo):
+                teares[i]['nome'] = (novo_nome or '').strip() or _nome_padrao(codigo)
+                return Tear(**teares[i])
+        raise ValueError('Tear não encontrado')
 
 def excluir_tear(codigo: int) -> dict:
-    teares = storage.read('teares')
-    novo = [t for t in teares if int(t['codigo']) != int(codigo)]
-    storage.write('teares', novo)
+    with storage.transacao('teares') as teares:
+        teares[:] = [t for t in teares if int(t['codigo']) != int(codigo)]
     return {'ok': True}
 
 def tear_existe(codigo: int) -> bool:
-    teares = storage.read('teares')
-    return any(int(t['codigo']) == int(codigo) for t in teares)
+    return int(codigo) in _codigos_teares()
 
 _SECRET = "paradas-secret-salt"  # se quiser, mova para .env
 def _hash_senha(senha: str) -> str:
@@ -387,47 +481,51 @@ def _verifica_senha(senha: str, senha_hash_armazenado: str) -> bool:
         return senha == senha_hash_armazenado
 
 def _bootstrap_admin():
-    users = storage.read('users')
-    if not users:
-        # Admin agora nasce como TI (role 6)
-        admin = Usuario(cod=1, nome='admin', senha_hash=_hash_senha('admin'), role=6)
-        storage.write('users', [admin.model_dump()])
+    if storage.view('users'):
+        return
+    # Admin agora nasce como TI (role 6)
+    admin = Usuario(cod=1, nome='admin', senha_hash=_hash_senha('admin'), role=6)
+    with storage.transacao('users') as users:
+        if not users:  # outro worker pode ter criado enquanto o hash era calculado
+            users.append(admin.model_dump())
 _bootstrap_admin()
+reconstruir_estado()
+Thread(target=_loop_sincronizacao, daemon=True, name='sincroniza-processos').start()
 
 def _prox_cod(users: List[Dict[str, Any]]) -> int:
     return (max([u['cod'] for u in users]) + 1) if users else 1
 
 def listar_usuarios() -> List[Dict[str, Any]]:
-    users = storage.read('users')
+    users = storage.view('users')
     # nunca devolve hash
     return [{'cod': u['cod'], 'nome': u['nome'], 'role': u['role'] } for u in users]
 
 def criar_usuario(nu: NovoUsuario) -> Dict[str, Any]:
-    users = storage.read('users')
-    if any(u['nome'].lower() == nu.nome.lower() for u in users):
-        raise ValueError('Nome já existe')
-    cod = _prox_cod(users)
-    novo = Usuario(cod=cod, nome=nu.nome.strip(), senha_hash=_hash_senha(nu.senha), role=nu.role)
-    users.append(novo.model_dump())
-    storage.write('users', users)
+    senha_hash = _hash_senha(nu.senha)  # fora da transação: o hash é lento
+    with storage.transacao('users') as users:
+        if any(u['nome'].lower() == nu.nome.lower() for u in users):
+            raise ValueError('Nome já existe')
+        cod = _prox_cod(users)
+        novo = Usuario(cod=cod, nome=nu.nome.strip(), senha_hash=senha_hash, role=nu.role)
+        users.append(novo.model_dump())
     return {'cod': cod, 'nome': novo.nome, 'role': novo.role}
 
 def atualizar_usuario(cod: int, up: AtualizaUsuario) -> Dict[str, Any]:
-    users = storage.read('users')
-    for u in users:
-        if int(u['cod']) == int(cod):
-            if up.nome is not None: u['nome'] = up.nome.strip()
-            if up.senha is not None: u['senha_hash'] = _hash_senha(up.senha)
-            if up.role is not None: u['role'] = up.role
-            storage.write('users', users)
-            return {'cod': u['cod'], 'nome': u['nome'], 'role': u['role']}
-    raise ValueError('Usuário não encontrado')
+    senha_hash = _hash_senha(up.senha) if up.senha is not None else None
+    with storage.transacao('users') as users:
+        for u in users:
+            if int(u['cod']) == int(cod):
+                if up.nome is not None: u['nome'] = up.nome.strip()
+                if senha_hash is not None: u['senha_hash'] = senha_hash
+                if up.role is not None: u['role'] = up.role
+                return {'cod': u['cod'], 'nome': u['nome'], 'role': u['role']}
+        raise ValueError('Usuário não encontrado')
 
 def excluir_usuario(cod: int) -> Dict[str, Any]:
-    users = storage.read('users')
-    novo = [u for u in users if int(u['cod']) != int(cod)]
-    if len(novo) == len(users): raise ValueError('Usuário não encontrado')
-    storage.write('users', novo)
+    with storage.transacao('users') as users:
+        novo = [u for u in users if int(u['cod']) != int(cod)]
+        if len(novo) == len(users): raise ValueError('Usuário não encontrado')
+        users[:] = novo
     return {'ok': True}
 
 def login(nome: str, senha: str) -> dict:
@@ -438,36 +536,27 @@ def login(nome: str, senha: str) -> dict:
 
     # migração automática de legado -> hash
     if not _parece_hash(user['senha_hash']):
-        user['senha_hash'] = _hash_senha(senha)
-        storage.write('users', users)
-
-    import secrets
-    token = secrets.token_hex(16)
-    sessions = storage.read('sessions')
-    sessions = [s for s in sessions if s.get('cod') != user['cod']]
-    from datetime import datetime
-    from dateutil import tz
-    TZ = tz.gettz("America/Sao_Paulo")
-    sessions.append({'token': token, 'cod': user['cod'], 'created_at': datetime.now(TZ).isoformat()})
-    storage.write('sessions', sessions)
+        novo_hash = _hash_senha(senha)
+        with storage.transacao('users') as rows:
+            for u in rows:
+                if int(u['cod']) == int(user['cod']) and u['senha_hash'] == user['senha_hash']:
+                    u['senha_hash'] = novo_hash
+
+    token = sessoes.criar(user['cod'], TZ)
     return {'token': token, 'user': {'cod': user['cod'], 'nome': user['nome'], 'role': user['role']}}
 
 def user_by_token(token: str) -> Optional[Dict[str, Any]]:
-    sessions = storage.read('sessions')
-    sess = next((s for s in sessions if s['token'] == token), None)
-    if not sess: return None
-    users = storage.read('users')
-    return next(({'cod': u['cod'], 'nome': u['nome'], 'role': u['role']} for u in users if u['cod'] == sess['cod']), None)
+    return sessoes.usuario(token)
 
 # ======= PERMISSÕES POR PAPEL (ATUALIZADO 1..6) =======
-# recursos: dashboard, turnos, teares, motivos, relatorios, usuarios, api_read, relatorio_turno1
+# recursos: dashboard, turnos, teares, motivos, relatorios, usuarios, api_read, relatorio_turno1, importar
 PERMISSOES = {
     1: {'dashboard', 'api_read', 'relatorio_turno1'},            # Líder 1º turno
     2: {'dashboard', 'api_read', 'relatorio_turno2'},                                # Líder 2º turno
     3: {'dashboard', 'api_read', 'relatorio_turno3'},                                # Líder 3º turno
     4: {'dashboard','turnos','teares','motivos','api_read'},     # Processos
     5: {'dashboard','relatorios','api_read'},                    # Gestor
-    6: {'dashboard','turnos','teares','motivos','relatorios','usuarios','api_read'}  # TI
+    6: {'dashboard','turnos','teares','motivos','relatorios','usuarios','api_read','importar'}  # TI
 }
 
 def autoriza(role: int, recurso: str) -> bool:
@@ -0,0 +1,93 @@
+# server/exportacao.py
+# Exportação em streaming (CSV ou NDJSON) dos eventos brutos e das linhas por turno, para
+# períodos longos: o corpo sai em blocos à medida que é produzido, sem montar a lista inteira.
+# A memória não cresce com o período: eventos vêm do storage um mês do arquivo por vez e
+# as linhas por turno são calculadas mês a mês também a partir do storage — nenhum dos dois
+# passa pelo índice, que continuaria com os meses lidos do arquivo.
+import csv, io, json
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import storage
+from domain import TZ
+from relatorios import totais_por_turno
+
+FORMATOS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+BLOCO = 64 * 1024   # caracteres juntados antes de mandar um pedaço da resposta
+
+COLUNAS_EVENTOS = ['tear', 'data_hora', 'status', 'hora_registro', 'motivo', 'turno']
+COLUNAS_TURNOS = ['tear', 'data', 'turno', 'inicio', 'fim', 'fechado', 'trabalhado_min',
+                  'parado_min', 'funcionando_min', 'ocorrencias', 'motivos']
+
+
+def _valida(inicio: date, fim: date, formato: str):
+    if fim < inicio:
+        raise ValueError('Data fim anterior à data início')
+    if formato not in FORMATOS:
+        raise ValueError(f'formato aceita: {", ".join(FORMATOS)}')
+
+def _blocos(linhas: Iterable[Dict[str, Any]], colunas: List[str], formato: str,
+            celula=lambda c, v: v) -> Iterator[bytes]:
+    """Serializa as linhas (CSV com cabeçalho ou um JSON por linha) em blocos de ~BLOCO."""
+    buf = io.StringIO()
+    if formato == 'csv':
+        w = csv.writer(buf)
+        w.writerow(colunas)
+    for linha in linhas:
+        if formato == 'csv':
+            w.writerow(['' if linha[c] is None else celula(c, linha[c]) for c in colunas])
+        else:
+            buf.write(json.dumps(linha, ensure_ascii=False))
+            buf.write('\n')
+        if buf.tell() >= BLOCO:
+            yield buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode('utf-8')
+
+def _meses(inicio: date, fim: date) -> Iterator[tuple]:
+    """[inicio, fim] cortado em pedaços de no máximo um mês civil."""
+    d = inicio
+    while d <= fim:
+        prox = (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+        yield d, min(fim, prox - timedelta(days=1))
+        d = prox
+
+
+def eventos(inicio: date, fim: date, teares: Optional[List[int]] = None,
+            turnos: Optional[List[int]] = None, formato: str = 'csv') -> Iterator[bytes]:
+    """Eventos com data_hora nos dias [inicio, fim], em ordem de data_hora. Valida na chamada."""
+    _valida(inicio, fim, formato)
+    a = datetime.combine(inicio, time(0), tzinfo=TZ).timestamp()
+    b = datetime.combine(fim + timedelta(days=1), time(0), tzinfo=TZ).timestamp()
+    sel_turnos = set(turnos) if turnos else None
+
+    def linhas():
+        for r in storage.percorrer_eventos(a, b, teares):
+            if sel_turnos is not None and r.get('turno') not in sel_turnos:
+                continue
+            yield {c: r.get(c) for c in COLUNAS_EVENTOS}
+
+    return _blocos(linhas(), COLUNAS_EVENTOS, formato)
+
+def _motivos_csv(coluna: str, valor: Any) -> Any:
+    # no CSV, motivos vira "motivo:minutos:ocorrências" separados por ";"
+    if coluna != 'motivos':
+        return valor
+    return ';'.join(f'{m["motivo"]}:{m["parado_min"]}:{m["ocorrencias"]}' for m in valor)
+
+def por_turno(inicio: date, fim: date, teares: Optional[List[int]] = None,
+              turnos: Optional[List[int]] = None, formato: str = 'csv') -> Iterator[bytes]:
+    """
+    Linhas de /relatorios/turnos (tear × instância de turno), um mês por vez: em ordem de
+    mês, tear e início do turno. Valida na chamada.
+    """
+    _valida(inicio, fim, formato)
+
+    def linhas():
+        for a, b in _meses(inicio, fim):
+            for t in totais_por_turno(a, b, teares, turnos, guardar=False):
+                yield t.model_dump(mode='json')
+
+    return _blocos(linhas(), COLUNAS_TURNOS, formato, _motivos_csv)
@@ -0,0 +1,127 @@
+# server/gerar_carga.py
+# Gera um diretório de dados sintético (mesmo formato de data/) com N teares × M meses de
+# paradas/retomadas, nos turnos e motivos configurados. Mesma semente e mesmo 'ate', mesmos
+# arquivos: serve de base para o benchmark.py e para testar o servidor com volume.
+#
+#   python gerar_carga.py /tmp/carga --teares 60 --meses 6 --semente 1
+#   PARADAS_DATA_DIR=/tmp/carga uvicorn app:app
+import argparse, json, os, random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from dateutil import tz
+
+from calendario import CalendarioTurnos
+
+TZ = tz.gettz("America/Sao_Paulo")
+ORIGEM = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+# duração típica (min) das paradas por motivo: (mínimo, máximo); o resto usa PADRAO
+DURACOES = {1: (15, 60), 103: (60, 240), 120: (30, 180), 140: (20, 120), 204: (30, 300), 305: (5, 45)}
+PADRAO = (10, 120)
+FUNCIONANDO_MEDIA_MIN = 150   # tempo médio entre paradas
+
+
+def _le(nome: str, origem: str) -> Any:
+    with open(os.path.join(origem, nome), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def _grava(destino: str, nome: str, dados: Any):
+    with open(os.path.join(destino, nome), 'w', encoding='utf-8') as f:
+        json.dump(dados, f, ensure_ascii=False)
+
+def _eventos_do_tear(rnd: random.Random, tear: int, inicio: datetime, ate: datetime,
+                     cal: CalendarioTurnos, motivos: List[int], pesos: List[float]) -> List[Dict[str, Any]]:
+    """Alterna funcionando/parado; paradas só dentro de turno, como exige o registro pela API."""
+    evs: List[Dict[str, Any]] = []
+    t = inicio + timedelta(minutes=rnd.randint(0, 600))
+    while t < ate:
+        t += timedelta(minutes=rnd.expovariate(1 / FUNCIONANDO_MEDIA_MIN))
+        inst = cal.instancia(t)
+        if inst is None:
+            prox = cal.instancias(t, t + timedelta(days=7))
+            if not prox:
+                break  # nenhum turno cadastrado
+            t = prox[0].inicio + timedelta(minutes=rnd.randint(0, 30))
+            inst = cal.instancia(t)
+        t = t.replace(second=0, microsecond=0)
+        if t >= ate or inst is None:
+            break
+        motivo = rnd.choices(motivos, pesos)[0]
+        evs.append(_evento(rnd, tear, t, 0, motivo, inst.turno))
+        a, b = DURACOES.get(motivo, PADRAO)
+        t = (t + timedelta(minutes=rnd.uniform(a, b))).replace(second=0, microsecond=0)
+        if t >= ate:
+            break
+        evs.append(_evento(rnd, tear, t, 1, None, cal.turno_em(t) or 1))
+    return evs
+
+def _evento(rnd: random.Random, tear: int, dt: datetime, status: int, motivo: Optional[int], turno: int) -> Dict[str, Any]:
+    registro = dt + timedelta(seconds=rnd.uniform(5, 240))   # digitado alguns minutos depois
+    return {'tear': tear, 'data_hora': dt.isoformat(), 'status': status,
+            'hora_registro': registro.isoformat(), 'motivo': motivo, 'turno': turno}
+
+def _sessoes(users: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # criadas agora, não em 'ate': com a expiração por inatividade, 'ate' de horas atrás já
+    # entregaria as sessões vencidas
+    criada = datetime.now(TZ).isoformat()
+    return [{'token': f'carga-{u["cod"]}', 'cod': u['cod'], 'created_at': criada} for u in users]
+
+def renovar_sessoes(destino: str):
+    """Recria as sessões 'carga-<cod>' de um diretório já gerado (cópia usada pelo benchmark)."""
+    _grava(destino, 'sessions.json', _sessoes(_le('users.json', destino)))
+    journal = os.path.join(destino, 'sessions.jsonl')
+    if os.path.exists(journal):
+        os.remove(journal)
+
+def gerar(destino: str, teares: int = 60, meses: int = 6, semente: int = 1,
+          ate: Optional[datetime] = None, usuarios: int = 50, origem: str = ORIGEM) -> Dict[str, int]:
+    """
+    Escreve status_tear.json, teares.json, users.json, sessions.json e copia turnos/motivos
+    de 'origem'. Usuários 'carga<N>' (senha 'carga', papéis 1..6) já têm sessão com token
+    'carga-<cod>', criada no momento da geração. 'ate' padrão: hoje 00:00.
+    """
+    rnd = random.Random(semente)
+    if ate is None:
+        ate = datetime.now(TZ).replace(hour=0, minute=0, second=0, microsecond=0)
+    inicio = ate - timedelta(days=round(meses * 30.44))
+    turnos = _le('turnos.json', origem)
+    motivos = _le('motivos.json', origem)
+    cal = CalendarioTurnos(turnos)
+    codigos = [int(m['codigo']) for m in motivos] or [0]
+    pesos = [rnd.uniform(0.5, 3) for _ in codigos]   # uns motivos bem mais frequentes que outros
+
+    eventos: List[Dict[str, Any]] = []
+    for tear in range(1, teares + 1):
+        eventos.extend(_eventos_do_tear(rnd, tear, inicio, ate, cal, codigos, pesos))
+    eventos.sort(key=lambda e: e['hora_registro'])   # ordem de gravação
+
+    users = [{'cod': cod, 'nome': f'carga{cod}', 'senha_hash': 'carga', 'role': (cod - 1) % 6 + 1}
+             for cod in range(1, usuarios + 1)]   # senha em texto: o login migra para hash
+    sessoes = _sessoes(users)
+
+    if os.path.isdir(destino) and os.listdir(destino):
+        raise ValueError(f'{destino} não está vazio (journal/arquivo antigos se misturariam aos dados novos)')
+    os.makedirs(destino, exist_ok=True)
+    _grava(destino, 'turnos.json', turnos)
+    _grava(destino, 'motivos.json', motivos)
+    _grava(destino, 'teares.json', [{'codigo': t, 'nome': f'Tear {t:02d}'} for t in range(1, teares + 1)])
+    _grava(destino, 'users.json', users)
+    _grava(destino, 'sessions.json', sessoes)
+    _grava(destino, 'status_tear.json', eventos)
+    return {'eventos': len(eventos), 'teares': teares, 'usuarios': len(users)}
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='Gera dados sintéticos de paradas para testes de carga.')
+    ap.add_argument('destino')
+    ap.add_argument('--teares', type=int, default=60)
+    ap.add_argument('--meses', type=int, default=6)
+    ap.add_argument('--semente', type=int, default=1)
+    ap.add_argument('--ate', type=datetime.fromisoformat, default=None,
+                    help='fim do histórico (ISO-8601; padrão: hoje 00:00)')
+    ap.add_argument('--usuarios', type=int, default=50)
+    ap.add_argument('--origem', default=ORIGEM, help='diretório de onde copiar turnos.json e motivos.json')
+    a = ap.parse_args()
+    ate = a.ate.replace(tzinfo=a.ate.tzinfo or TZ) if a.ate else None
+    print(gerar(a.destino, a.teares, a.meses, a.semente, ate, a.usuarios, a.origem))
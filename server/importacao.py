@@ -0,0 +1,219 @@
+# server/importacao.py
+# Importação em massa de eventos (histórico de planilhas, logs de CLP): lê um arquivo CSV ou
+# NDJSON em streaming (mesmas colunas da exportação), valida em lotes contra os teares
+# cadastrados, atribui o turno pelo calendário, ordena, descarta duplicados (dentro
+# do arquivo e já gravados) e grava em blocos com storage.importar — uma gravação por bloco,
+# não uma por evento. Estado, índice e relatórios são recalculados uma vez, no fim.
+#
+#   python importacao.py historico.csv
+#   python importacao.py clp.ndjson --formato ndjson --simular
+import argparse, csv, json, math, os, sys, time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, IO, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+import storage
+from calendario import CalendarioTurnos
+from domain import MOTIVO_MAX, TZ, calendario, recarregar_eventos, to_local
+
+FORMATOS = ('csv', 'ndjson')
+LOTE_VALIDACAO = 10_000
+LOTE_GRAVACAO = int(os.getenv('PARADAS_IMPORTACAO_LOTE', '200000'))
+ERROS_MAX = 100     # erros guardados no resumo (os demais só contam em 'rejeitadas')
+
+# linha aceita: (ts, tear, status, motivo, turno, ts de hora_registro)
+Linha = Tuple[float, int, int, Optional[int], int, float]
+
+
+class ErroImportacao(BaseModel):
+    linha: int
+    erro: str
+
+class ResumoImportacao(BaseModel):
+    fase: str = 'lendo'     # lendo | gravando | concluido
+    lidas: int = 0
+    validas: int = 0
+    rejeitadas: int = 0
+    duplicadas: int = 0
+    gravadas: int = 0
+    segundos: float = 0.0
+    simulacao: bool = False
+    erros: List[ErroImportacao] = []
+
+
+def _linhas(arquivo: IO[str], formato: str) -> Iterator[Tuple[int, Any]]:
+    """(número da linha no arquivo, registro); no NDJSON o registro ainda é texto."""
+    if formato == 'csv':
+        leitor = csv.DictReader(arquivo)
+        for r in leitor:
+            yield leitor.line_num, r
+    else:
+        for n, texto in enumerate(arquivo, 1):
+            if texto.strip():
+                yield n, texto
+
+_fusos: Dict[int, timezone] = {}   # hora (ts // 3600) -> deslocamento de TZ nessa hora
+
+def _no_fuso(ts: float) -> datetime:
+    """datetime de ts no fuso local. O dateutil custa caro por chamada; o deslocamento é guardado por hora."""
+    h = int(ts // 3600)
+    fuso = _fusos.get(h)
+    if fuso is None:
+        fuso = _fusos[h] = timezone(datetime.fromtimestamp(h * 3600, TZ).utcoffset())
+    return datetime.fromtimestamp(ts, fuso)
+
+def _data(valor: Any, campo: str) -> datetime:
+    if valor in (None, ''):
+        raise ValueError(f'{campo} ausente')
+    try:
+        dt = datetime.fromisoformat(str(valor).strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'{campo} inválida: {valor!r}')
+    return to_local(dt) if dt.tzinfo is None else _no_fuso(dt.timestamp())
+
+def _inteiro(valor: Any, campo: str) -> int:
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f'{campo} inválido: {valor!r}')
+
+def _valida(r: Any, teares: set, cal: CalendarioTurnos, agora: float) -> Linha:
+    """Converte um registro do arquivo. Lança ValueError se ele não for aceito."""
+    if isinstance(r, str):
+        try:
+            r = json.loads(r)
+        except ValueError:
+            raise ValueError('JSON inválido')
+    if not isinstance(r, dict):
+        raise ValueError('registro deve ser um objeto')
+    tear = _inteiro(r.get('tear'), 'tear')
+    if tear not in teares:
+        raise ValueError(f'Tear {tear} inexistente. Cadastre o tear antes de importar.')
+    status = _inteiro(r.get('status'), 'status')
+    if status not in (0, 1):
+        raise ValueError('status deve ser 0 (parado) ou 1 (funcionando)')
+    dt = _data(r.get('data_hora'), 'data_hora')
+    ts = dt.timestamp()
+    if ts > agora:
+        raise ValueError('data_hora no futuro')
+    motivo = None
+    if status == 0 and r.get('motivo') not in (None, ''):
+        motivo = _inteiro(r['motivo'], 'motivo')
+        if not 0 <= motivo <= MOTIVO_MAX:
+            raise ValueError(f'motivo fora de 0..{MOTIVO_MAX}: {motivo}')
+    hr = r.get('hora_registro')
+    hr_ts = ts if hr in (None, '') else _data(hr, 'hora_registro').timestamp()
+    return ts, tear, status, motivo, cal.turno_em(dt) or 1, hr_ts   # mesmo fallback de turno_atual
+
+def _chave(l: Linha) -> tuple:
+    # identidade de um evento para a deduplicação (motivo None antes de qualquer código)
+    return l[0], l[1], l[2], -1 if l[3] is None else l[3]
+
+def _existentes(bloco: List[Linha]) -> set:
+    """Chaves dos eventos já gravados no intervalo e nos teares do bloco."""
+    a, b = bloco[0][0], math.nextafter(bloco[-1][0], math.inf)
+    teares = sorted({l[1] for l in bloco})
+    out = set()
+    for r in storage.percorrer_eventos(a, b, teares):
+        m = r.get('motivo')
+        out.add((datetime.fromisoformat(r['data_hora']).timestamp(), int(r['tear']),
+                 int(r['status']), -1 if m is None else int(m)))
+    return out
+
+def _registro(l: Linha) -> Dict[str, Any]:
+    ts, tear, status, motivo, turno, hr = l
+    data_hora = _no_fuso(ts).isoformat()
+    return {'tear': tear, 'data_hora': data_hora, 'status': status,
+            'hora_registro': data_hora if hr == ts else _no_fuso(hr).isoformat(), 'motivo': motivo,
+            'turno': turno}
+
+
+def importar(arquivo: IO[str], formato: str = 'csv', simular: bool = False,
+             progresso: Optional[Callable[[ResumoImportacao], None]] = None) -> ResumoImportacao:
+    """
+    Importa os eventos do arquivo (texto). Linhas inválidas são contadas e as primeiras
+    ERROS_MAX voltam no resumo; não impedem a gravação das demais. Com simular=True, valida
+    e deduplica sem gravar. `progresso` recebe o resumo parcial a cada lote.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f'formato aceita: {", ".join(FORMATOS)}')
+    t0 = time.perf_counter()
+    res = ResumoImportacao(simulacao=simular)
+    avisa = progresso or (lambda _r: None)
+
+    def marca(fase: str):
+        res.fase, res.segundos = fase, round(time.perf_counter() - t0, 2)
+        avisa(res)
+
+    # 1) leitura e validação em lotes (teares e turnos relidos a cada lote)
+    aceitas: List[Linha] = []
+    lote: List[Tuple[int, Any]] = []
+
+    def valida_lote():
+        teares = {int(t['codigo']) for t in storage.view('teares')}
+        cal, agora = calendario(), time.time()
+        for n, r in lote:
+            try:
+                aceitas.append(_valida(r, teares, cal, agora))
+            except ValueError as e:
+                res.rejeitadas += 1
+                if len(res.erros) < ERROS_MAX:
+                    res.erros.append(ErroImportacao(linha=n, erro=str(e)))
+        res.lidas += len(lote)
+        res.validas = len(aceitas)
+        lote.clear()
+        marca('lendo')
+
+    for item in _linhas(arquivo, formato):
+        lote.append(item)
+        if len(lote) >= LOTE_VALIDACAO:
+            valida_lote()
+    if lote:
+        valida_lote()
+
+    # 2) ordena, tira duplicados do próprio arquivo e grava em blocos sem os já gravados
+    aceitas.sort(key=_chave)
+    unicas: List[Linha] = []
+    anterior = None
+    for l in aceitas:
+        k = _chave(l)
+        if k != anterior:
+            unicas.append(l)
+            anterior = k
+    res.duplicadas = len(aceitas) - len(unicas)
+    aceitas.clear()
+    for i in range(0, len(unicas), LOTE_GRAVACAO):
+        bloco = unicas[i:i + LOTE_GRAVACAO]
+        ja = _existentes(bloco)
+        novos = [_registro(l) for l in bloco if _chave(l) not in ja]
+        res.duplicadas += len(bloco) - len(novos)
+        if novos and not simular:
+            storage.importar('status', novos)
+        res.gravadas += len(novos)
+        marca('gravando')
+
+    if res.gravadas and not simular:
+        recarregar_eventos()
+    marca('concluido')
+    return res
+
+
+if __name__ == '__main__':
+    ap = argparse.ArgumentParser(description='Importa eventos de um arquivo CSV/NDJSON.')
+    ap.add_argument('arquivo')
+    ap.add_argument('--formato', choices=FORMATOS,
+                    help='padrão: pela extensão do arquivo (.ndjson/.jsonl, senão csv)')
+    ap.add_argument('--simular', action='store_true', help='valida e deduplica sem gravar')
+    args = ap.parse_args()
+    formato = args.formato or ('ndjson' if args.arquivo.endswith(('.ndjson', '.jsonl')) else 'csv')
+
+    def mostra(r: ResumoImportacao):
+        print(f'{r.fase:>10}  lidas={r.lidas} válidas={r.validas} rejeitadas={r.rejeitadas} '
+              f'duplicadas={r.duplicadas} gravadas={r.gravadas}  {r.segundos}s', file=sys.stderr)
+
+    with open(args.arquivo, encoding='utf-8-sig', newline='') as f:
+        resumo = importar(f, formato, args.simular, mostra)
+    for e in resumo.erros:
+        print(f'linha {e.linha}: {e.erro}', file=sys.stderr)
+    print(resumo.model_dump_json(exclude={'erros'}))
@@ -0,0 +1,432 @@
+# server/indice.py
+# Índice em memória dos eventos, ordenado por data_hora, com índice secundário por tear.
+# Permite consultas por intervalo/tear (bisect) sem varrer nem serializar o histórico inteiro.
+# Começa só com a janela quente do storage; meses arquivados entram sob demanda, quando
+# uma consulta pede um período anterior.
+# Por tear os eventos ficam em colunas (arrays tipados), que é o que os relatórios percorrem.
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from heapq import merge
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.encoders import jsonable_encoder
+
+import metricas
+import storage
+from domain import Evento, ao_recarregar_eventos, ao_salvar_evento
+
+Chave = Tuple[float, int]  # (data_hora epoch, seq de gravação) — seq desempata e mantém ordem de gravação
+_MIN = float('-inf')       # seq sentinela: antes de qualquer seq (os do arquivo são negativos)
+_SEQ_ARQUIVO = -10 ** 15   # seq dos eventos arquivados: base + segmento * 10**8 + posição
+
+
+class Colunas:
+    """
+    Eventos de um tear em arrays tipados, em ordem de (data_hora, seq). motivo/turno None viram -1.
+    'parado' acumula os segundos parados desde o primeiro evento: o tempo parado entre dois
+    instantes é uma diferença (parado_entre), sem laço por evento. Só as diferenças valem.
+    'troca' é a data_hora do evento que iniciou a sequência de mesmo status (o "desde").
+    'regs' aponta para os mesmos dicts do índice global (somente leitura).
+    """
+    __slots__ = ('ts', 'seq', 'status', 'motivo', 'turno', 'parado', 'troca', 'regs')
+
+    def __init__(self):
+        self.ts = array('d')
+        self.seq = array('q')
+        self.status = array('b')
+        self.motivo = array('h')
+        self.turno = array('b')
+        self.parado = array('d')
+        self.troca = array('d')
+        self.regs: List[Dict[str, Any]] = []
+
+    @staticmethod
+    def _celulas(reg: Dict[str, Any]) -> Tuple[int, int, int]:
+        """(status, motivo, turno) como vão para os arrays. ValueError se algum não couber."""
+        st = int(reg['status'])
+        m = -1 if reg['motivo'] is None else int(reg['motivo'])
+        t = -1 if reg['turno'] is None else int(reg['turno'])
+        if not (-2 ** 7 <= st < 2 ** 7 and -2 ** 15 <= m < 2 ** 15 and -2 ** 7 <= t < 2 ** 7):
+            raise ValueError(f'Evento fora da faixa do índice (status={st}, motivo={m}, turno={t})')
+        return st, m, t
+
+    @classmethod
+    def de_itens(cls, itens: Iterable[Tuple[Chave, Dict[str, Any]]]) -> 'Colunas':
+        itens = list(itens)
+        cel = [cls._celulas(r) for _c, r in itens]
+        col = cls()
+        col.ts = array('d', [c[0] for c, _r in itens])
+        col.seq = array('q', [c[1] for c, _r in itens])
+        col.status = array('b', [c[0] for c in cel])
+        col.motivo = array('h', [c[1] for c in cel])
+        col.turno = array('b', [c[2] for c in cel])
+        col.parado = array('d', bytes(8 * len(itens)))
+        col.troca = array('d', col.ts)
+        col.regs = [r for _c, r in itens]
+        col._acumula(0)
+        return col
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def _anexa(self, chave: Chave, reg: Dict[str, Any]):
+        st, m, t = self._celulas(reg)   # valida antes de mexer em qualquer array
+        self.ts.append(chave[0])
+        self.seq.append(chave[1])
+        self.status.append(st)
+        self.motivo.append(m)
+        self.turno.append(t)
+        self.parado.append(0.0)
+        self.troca.append(chave[0])
+        self.regs.append(reg)
+
+    def _acumula(self, desde: int):
+        """Refaz 'parado' e 'troca' a partir da posição desde."""
+        ts, st, p, tr = self.ts, self.status, self.parado, self.troca
+        acc = p[desde - 1] if desde else 0.0
+        for k in range(desde, len(ts)):
+            if k and st[k - 1] == 0:
+                acc += ts[k] - ts[k - 1]
+            p[k] = acc
+            tr[k] = tr[k - 1] if k and st[k - 1] == st[k] else ts[k]
+
+    def posicao(self, chave: Chave) -> int:
+        """Ponto de inserção à direita de chave (bisect_right sobre as chaves)."""
+        i, j = bisect_left(self.ts, chave[0]), bisect_right(self.ts, chave[0])
+        return bisect_right(self.seq, chave[1], i, j) if i < j else i
+
+    def insere(self, i: int, chave: Chave, reg: Dict[str, Any]):
+        if i == len(self.ts):
+            self._anexa(chave, reg)
+            self._acumula(i)
+            return
+        st, m, t = self._celulas(reg)   # valida antes de mexer em qualquer array
+        p0 = self.parado[0]
+        if i == 0 and st == 0:
+            p0 -= self.ts[0] - chave[0]
+        self.ts.insert(i, chave[0])
+        self.seq.insert(i, chave[1])
+        self.status.insert(i, st)
+        self.motivo.insert(i, m)
+        self.turno.insert(i, t)
+        self.parado.insert(i, p0)
+        self.troca.insert(i, chave[0])
+        self.regs.insert(i, reg)
+        if i:
+            self._acumula(i)
+            return
+        # no começo só a primeira sequência muda de "desde", e só se tiver o mesmo status
+        k, st = 1, self.status
+        while k < len(st) and st[k] == st[0]:
+            self.troca[k] = chave[0]
+            k += 1
+
+    def antepoe(self, antes: 'Colunas'):
+        """
+        Junta no começo um bloco todo anterior ao primeiro evento deste (mês lido do arquivo).
+        Só o bloco novo e a primeira sequência deste são ajustados; o resto é cópia de arrays.
+        """
+        if not len(antes):
+            return
+        if len(self):
+            # 'parado' do bloco novo passa a terminar onde começa o deste (só as diferenças valem)
+            fim = antes.parado[-1] + (self.ts[0] - antes.ts[-1] if antes.status[-1] == 0 else 0.0)
+            d, p = self.parado[0] - fim, antes.parado
+            for k in range(len(p)):
+                p[k] += d
+            if antes.status[-1] == self.status[0]:
+                k, st = 0, self.status
+                while k < len(st) and st[k] == st[0]:
+                    self.troca[k] = antes.troca[-1]
+                    k += 1
+        for nome in ('ts', 'seq', 'status', 'motivo', 'turno', 'parado', 'troca'):
+            setattr(self, nome, getattr(antes, nome) + getattr(self, nome))
+        self.regs = antes.regs + self.regs
+
+    def fatia(self, i: int, j: int) -> 'Colunas':
+        col = Colunas()
+        col.ts, col.seq, col.status = self.ts[i:j], self.seq[i:j], self.status[i:j]
+        col.motivo, col.turno, col.parado = self.motivo[i:j], self.turno[i:j], self.parado[i:j]
+        col.troca = self.troca[i:j]
+        col.regs = self.regs[i:j]
+        return col
+
+    def itens(self, i: int = 0, j: Optional[int] = None):
+        ts, seq, regs = self.ts, self.seq, self.regs
+        return (((ts[k], seq[k]), regs[k]) for k in range(i, len(ts) if j is None else j))
+
+    def parado_ate(self, t: float) -> float:
+        k = bisect_right(self.ts, t) - 1
+        if k < 0:
+            return self.parado[0] if self.parado else 0.0
+        p = self.parado[k]
+        return p + (t - self.ts[k]) if self.status[k] == 0 else p
+
+    def parado_entre(self, a: float, b: float) -> float:
+        """Segundos parados em [a, b); sem evento anterior o tear conta como funcionando."""
+        return self.parado_ate(b) - self.parado_ate(a)
+
+
+_chaves: List[Chave] = []
+_regs: List[Dict[str, Any]] = []
+_por_tear: Dict[int, Colunas] = {}
+_prox_seq = 0
+_pronto = False
+_geracao = 0                         # muda sempre que o conteúdo do índice muda
+_frios: List[Dict[str, Any]] = []   # segmentos do arquivo ainda fora do índice (os mais antigos)
+_cobre_desde = _MIN                  # todo evento com data_hora >= isto está no índice
+_lock = Lock()
+metricas.Medidor('paradas_indice_eventos', 'Eventos no índice em memória (janela quente + meses já lidos do arquivo)',
+                 lambda: len(_regs))
+
+
+def _normaliza(r) -> Dict[str, Any]:
+    return {
+        'tear': int(r['tear']), 'data_hora': r['data_hora'], 'status': int(r['status']),
+        'hora_registro': r['hora_registro'], 'motivo': r.get('motivo'), 'turno': r.get('turno'),
+    }
+
+def _insere(chave: Chave, reg: Dict[str, Any]):
+    global _geracao
+    _geracao += 1
+    col = _por_tear.setdefault(reg['tear'], Colunas())
+    col.insere(col.posicao(chave), chave, reg)   # primeiro: é o que pode recusar o evento
+    i = bisect_right(_chaves, chave)
+    _chaves.insert(i, chave)
+    _regs.insert(i, reg)
+
+def _constroi():
+    """Monta o índice a partir da janela quente do storage. Chamar sob _lock."""
+    global _prox_seq, _pronto, _frios, _cobre_desde, _geracao
+    _geracao += 1
+    _chaves.clear(); _regs.clear(); _por_tear.clear()
+    _frios = storage.segmentos_arquivo()
+    limite = storage.limite_quente()
+    _cobre_desde = _MIN if limite is None else math.nextafter(limite, math.inf)
+    itens = [((datetime.fromisoformat(r['data_hora']).timestamp(), seq), _normaliza(r))
+             for seq, r in enumerate(storage.view('status'))]
+    itens.sort(key=lambda x: x[0])
+    por: Dict[int, List[Tuple[Chave, Dict[str, Any]]]] = {}
+    for chave, reg in itens:
+        _chaves.append(chave)
+        _regs.append(reg)
+        por.setdefault(reg['tear'], []).append((chave, reg))
+    for tear, lst in por.items():
+        _por_tear[tear] = Colunas.de_itens(lst)
+    _prox_seq = len(itens)
+    _pronto = True
+
+def _mescla(ch: List[Chave], rs: List[Dict[str, Any]], novos: List[Tuple[Chave, Dict[str, Any]]]):
+    if novos and (not ch or novos[-1][0] < ch[0]):
+        # caso comum: o mês do arquivo é todo anterior ao que já está no índice
+        ch[:0] = [c for c, _r in novos]
+        rs[:0] = [r for _c, r in novos]
+        return
+    itens = list(merge(zip(ch, rs), novos, key=lambda x: x[0]))
+    ch[:] = [c for c, _r in itens]
+    rs[:] = [r for _c, r in itens]
+
+def _estende(desde: Optional[float]):
+    """Traz do arquivo os segmentos necessários para cobrir data_hora >= desde (None = tudo). Chamar sob _lock."""
+    global _cobre_desde
+    while _frios and (desde is None or desde < _cobre_desde):
+        k = len(_frios) - 1
+        seg = _frios.pop()
+        base = _SEQ_ARQUIVO + k * 10 ** 8
+        novos = [((datetime.fromisoformat(r['data_hora']).timestamp(), base + i), _normaliza(r))
+                 for i, r in enumerate(storage.ler_segmento(seg))]
+        novos.sort(key=lambda x: x[0])
+        _mescla(_chaves, _regs, novos)
+        por: Dict[int, List[Tuple[Chave, Dict[str, Any]]]] = {}
+        for item in novos:
+            por.setdefault(item[1]['tear'], []).append(item)
+        for tear, itens in por.items():
+            col = _por_tear.get(tear)
+            if col is None:
+                _por_tear[tear] = Colunas.de_itens(itens)
+            elif itens[-1][0] < (col.ts[0], col.seq[0]):
+                col.antepoe(Colunas.de_itens(itens))
+            else:   # evento retroativo na janela quente anterior a este mês
+                _por_tear[tear] = Colunas.de_itens(merge(col.itens(), itens, key=lambda x: x[0]))
+        _cobre_desde = seg['inicio'] if _frios else _MIN
+
+def _garante():
+    if not _pronto:
+        _constroi()
+
+@ao_salvar_evento
+def _novo_evento(ev: Evento):
+    global _prox_seq
+    with _lock:
+        if not _pronto:
+            return  # a carga inicial vai ler este evento do storage
+        reg = _normaliza(jsonable_encoder(ev))
+        ts = ev.data_hora.timestamp()
+        col = _por_tear.get(ev.tear, Colunas())
+        i = bisect_left(col.ts, ts)
+        while i < len(col) and col.ts[i] == ts:
+            if col.regs[i]['hora_registro'] == reg['hora_registro']:
+                return  # já lido pela carga inicial
+            i += 1
+        _insere((ts, _prox_seq), reg)
+        _prox_seq += 1
+
+@ao_recarregar_eventos
+def _descarta():
+    global _pronto
+    with _lock:
+        _pronto = False  # próxima consulta remonta a partir do storage
+
+
+def parse_cursor(cursor: str) -> Chave:
+    try:
+        ts, seq = cursor.split(':')
+        return float(ts), int(seq)
+    except ValueError:
+        raise ValueError('Cursor inválido')
+
+def _fatia(chaves: List[Chave], regs: List[Dict[str, Any]], ini: Chave, fim: float):
+    i = bisect_right(chaves, ini)
+    j = bisect_left(chaves, (fim, _MIN))
+    return ((chaves[k], regs[k]) for k in range(i, j))
+
+def _fatia_tear(col: Colunas, ini: Chave, fim: float):
+    return col.itens(col.posicao(ini), bisect_left(col.ts, fim))
+
+@metricas.cronometrado('consultar_eventos')
+def consultar(inicio: Optional[datetime] = None, fim: Optional[datetime] = None,
+              teares: Optional[Iterable[int]] = None, turnos: Optional[Iterable[int]] = None,
+              cursor: Optional[str] = None, limite: Optional[int] = None
+              ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Eventos com inicio <= data_hora < fim, em ordem de data_hora. Devolve (página, próximo cursor);
+    o cursor é None quando não há mais páginas. Os registros são os do índice: somente leitura.
+    """
+    ini: Chave = (inicio.timestamp(), _MIN) if inicio else (_MIN, _MIN)
+    if cursor:
+        ini = max(ini, parse_cursor(cursor))
+    lim_fim = fim.timestamp() if fim else float('inf')
+    sel_turnos = set(turnos) if turnos else None
+
+    with _lock:
+        _garante()
+        _estende(ini[0] if ini[0] > _MIN else None)
+        if teares:
+            fontes = [_fatia_tear(_por_tear[t], ini, lim_fim) for t in sorted(set(teares)) if t in _por_tear]
+            itens = merge(*fontes, key=lambda x: x[0])
+        else:
+            itens = _fatia(_chaves, _regs, ini, lim_fim)
+
+        pagina: List[Dict[str, Any]] = []
+        ultima: Optional[Chave] = None
+        for chave, reg in itens:
+            if sel_turnos is not None and reg['turno'] not in sel_turnos:
+                continue
+            if limite is not None and len(pagina) >= limite:
+                return pagina, f'{ultima[0]!r}:{ultima[1]}'
+            pagina.append(reg)
+            ultima = chave
+    return pagina, None
+
+def geracao() -> int:
+    """Muda a cada evento inserido ou recarga: mesma geração e mesma consulta, mesmo resultado."""
+    with _lock:
+        _garante()
+        return _geracao
+
+def linha_do_tempo(tear: int, ate: float = float('inf'), desde: Optional[float] = None) -> Colunas:
+    """
+    Colunas (cópia) do tear, em ordem de data_hora, só eventos com data_hora < ate.
+    Garante todos os eventos com data_hora >= desde (None = histórico inteiro) e o último
+    anterior ou igual a desde, que dá o status do tear nesse instante. Pode trazer eventos
+    mais antigos. Os registros em .regs são compartilhados com o índice: somente leitura.
+    """
+    with _lock:
+        _garante()
+        _estende(desde)
+        col = _por_tear.get(tear, Colunas())
+        j = bisect_left(col.ts, ate)
+        i = 0 if desde is None else max(bisect_right(col.ts, desde, 0, j) - 1, 0)
+        out = col.fatia(i, j)
+        if desde is not None and _frios:
+            # o anterior a 'desde' pode estar num segmento ainda no arquivo
+            ant = _anterior_arquivado(tear)
+            if ant is not None and ant[0] < ate:
+                out.insere(bisect_right(out.ts, ant[0]), (ant[0], _SEQ_ARQUIVO), ant[1])
+        return out
+
+def colunas_de(registros: Iterable[Dict[str, Any]]) -> Colunas:
+    """Colunas de registros do storage já em ordem de data_hora, sem passar pelo índice (nada fica retido)."""
+    return Colunas.de_itens(((datetime.fromisoformat(r['data_hora']).timestamp(), k), _normaliza(r))
+                            for k, r in enumerate(registros))
+
+def _anterior_arquivado(tear: int) -> Optional[Tuple[float, Dict[str, Any]]]:
+    """Último evento do tear nos segmentos ainda fora do índice (manifesto). Chamar sob _lock."""
+    for seg in reversed(_frios):
+        r = seg['ultimos'].get(str(tear))
+        if r is not None:
+            return datetime.fromisoformat(r['data_hora']).timestamp(), _normaliza(r)
+    return None
+
+def ultimo_evento(tear: int) -> Optional[Tuple[float, Dict[str, Any]]]:
+    """(ts, registro) do evento mais recente do tear, esteja ele no índice ou no arquivo."""
+    with _lock:
+        _garante()
+        col = _por_tear.get(tear)
+        ult = (col.ts[-1], col.regs[-1]) if col else None
+        ant = _anterior_arquivado(tear)
+        if ant is not None and (ult is None or ant[0] > ult[0]):
+            return ant
+        return ult
+
+def estado_em(teares: Iterable[int], ts: float) -> Dict[int, Tuple[int, float, Dict[str, Any]]]:
+    """
+    Por tear: (status, desde, registro) no instante ts — registro é o último evento com
+    data_hora <= ts e desde é a data_hora em que começou a sequência com aquele status.
+    Teares sem evento até ts ficam de fora. Busca binária por tear; meses do arquivo só
+    são lidos quando a resposta pode estar neles.
+    """
+    saida = {}
+    with _lock:
+        _garante()
+        _estende(ts)
+        for tear in teares:
+            e = _estado_em(tear, ts)
+            if e is not None:
+                saida[tear] = e
+    return saida
+
+def _estado_em(tear: int, ts: float) -> Optional[Tuple[int, float, Dict[str, Any]]]:
+    """Chamar sob _lock, depois de _estende(ts)."""
+    while True:
+        col = _por_tear.get(tear)
+        k = bisect_right(col.ts, ts) - 1 if col else -1
+        if not _frios or (k >= 0 and col.troca[k] > col.ts[0]):
+            break
+        # a sequência pode ter começado num mês ainda no arquivo
+        ant = _anterior_arquivado(tear)
+        if ant is None:
+            break
+        if k >= 0 and ant[1]['status'] != col.status[k]:
+            break   # o último arquivado tem outro status: a sequência começa no índice mesmo
+        _estende(math.nextafter(_cobre_desde, -math.inf))   # traz mais um mês
+    if k < 0:
+        return None
+    return col.status[k], col.troca[k], col.regs[k]
+
+def proximo_evento(tear: int, ts: float) -> Optional[float]:
+    """data_hora (epoch) do primeiro evento do tear estritamente depois de ts, ou None."""
+    with _lock:
+        _garante()
+        _estende(ts)
+        col = _por_tear.get(tear, Colunas())
+        i = bisect_right(col.ts, ts)
+        return col.ts[i] if i < len(col) else None
+
+def teares_com_eventos() -> List[int]:
+    with _lock:
+        _garante()
+        return sorted(set(_por_tear) | {int(t) for seg in _frios for t in seg['ultimos']})
@@ -0,0 +1,248 @@
+# server/metricas.py
+# Métricas do processo no formato texto do Prometheus (GET /metrics), sem dependência externa:
+# histogramas e contadores com rótulos, medidores calculados na coleta (tamanho de arquivo,
+# assinantes), Lock que mede a espera e um perfilador por amostragem opcional.
+# Cada worker do uvicorn tem as suas: o scraper deve consultar cada processo.
+import math, os, sys, threading, time
+from collections import Counter as _Contagem
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+from typing import Callable, Dict, List, Tuple, Union
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PERFIL = os.getenv('PARADAS_PERFIL', '0') == '1'   # liga o /debug/perfil
+
+_LE_INF = 'le="+Inf"'
+
+_registro: List['_Metrica'] = []
+_lock = Lock()
+
+
+def _rotulos(nomes: Tuple[str, ...], valores: tuple, extra: str = '') -> str:
+    partes = [f'{n}="{_escapa(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+def _escapa(v) -> str:
+    return str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _num(v: float) -> str:
+    if v == math.inf:
+        return '+Inf'
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _Metrica:
+    tipo = ''
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()):
+        self.nome, self.ajuda, self.rotulos = nome, ajuda, tuple(rotulos)
+        with _lock:
+            _registro.append(self)
+
+    def linhas(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[tuple, float] = {}
+
+    def inc(self, *rotulos, n: float = 1):
+        with _lock:
+            self._valores[rotulos] = self._valores.get(rotulos, 0) + n
+
+    def linhas(self) -> List[str]:
+        with _lock:
+            itens = sorted(self._valores.items())
+        return [f'{self.nome}{_rotulos(self.rotulos, k)} {_num(v)}' for k, v in itens]
+
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Tuple[str, ...] = (), buckets: tuple = BUCKETS):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(buckets)
+        self._series: Dict[tuple, list] = {}   # rótulos -> [contagem por bucket..., soma, total]
+
+    def observa(self, valor: float, *rotulos):
+        with _lock:
+            s = self._series.get(rotulos)
+            if s is None:
+                s = self._series[rotulos] = [0] * len(self.buckets) + [0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if valor <= b:
+                    s[i] += 1
+                    break
+            s[-2] += valor
+            s[-1] += 1
+
+    @contextmanager
+    def tempo(self, *rotulos):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observa(time.perf_counter() - t, *rotulos)
+
+    def linhas(self) -> List[str]:
+        with _lock:
+            series = sorted((k, list(s)) for k, s in self._series.items())
+        out = []
+        for k, s in series:
+            acc = 0
+            for b, n in zip(self.buckets, s):
+                acc += n
+                le = 'le="%s"' % _num(b)
+                out.append(f'{self.nome}_bucket{_rotulos(self.rotulos, k, le)} {acc}')
+            out.append(f'{self.nome}_bucket{_rotulos(self.rotulos, k, _LE_INF)} {s[-1]}')
+            out.append(f'{self.nome}_sum{_rotulos(self.rotulos, k)} {_num(s[-2])}')
+            out.append(f'{self.nome}_count{_rotulos(self.rotulos, k)} {s[-1]}')
+        return out
+
+
+Valor = Union[float, Dict[tuple, float]]
+
+class Medidor(_Metrica):
+    """Gauge calculado na coleta: fn() devolve um número ou {valores dos rótulos: número}."""
+    tipo = 'gauge'
+
+    def __init__(self, nome: str, ajuda: str, fn: Callable[[], Valor], rotulos: Tuple[str, ...] = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self.fn = fn
+
+    def linhas(self) -> List[str]:
+        try:
+            v = self.fn()
+        except Exception:
+            return []   # coleta não derruba o /metrics
+        if not isinstance(v, dict):
+            return [f'{self.nome} {_num(v)}']
+        return [f'{self.nome}{_rotulos(self.rotulos, k)} {_num(x)}' for k, x in sorted(v.items())]
+
+
+def texto() -> str:
+    with _lock:
+        metricas = list(_registro)
+    out = []
+    for m in metricas:
+        out.append(f'# HELP {m.nome} {m.ajuda}')
+        out.append(f'# TYPE {m.nome} {m.tipo}')
+        out.extend(m.linhas())
+    return '\n'.join(out) + '\n'
+
+
+# ---------- Métricas compartilhadas ----------
+ESPERA_TRAVA = Histograma('paradas_trava_espera_segundos',
+                          'Espera por trava disputada (só conta quando não estava livre)', ('trava',))
+DOMINIO = Histograma('paradas_dominio_segundos', 'Duração das funções de domínio e relatórios', ('funcao',))
+HTTP = Histograma('paradas_http_segundos', 'Duração das requisições por rota', ('metodo', 'rota', 'status'))
+_em_andamento = [0]
+Medidor('paradas_http_em_andamento', 'Requisições em andamento', lambda: _em_andamento[0])
+Medidor('paradas_threads', 'Threads vivas no processo', threading.active_count)
+
+
+class TravaMedida:
+    """Lock que registra em ESPERA_TRAVA quanto tempo esperou quando já estava ocupado."""
+    __slots__ = ('_lock', 'nome')
+
+    def __init__(self, nome: str):
+        self._lock = Lock()
+        self.nome = nome
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        if self._lock.acquire(False):
+            return True
+        if not blocking:
+            return False
+        t = time.perf_counter()
+        ok = self._lock.acquire(True, timeout)
+        ESPERA_TRAVA.observa(time.perf_counter() - t, self.nome)
+        return ok
+
+    def release(self):
+        self._lock.release()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def cronometrado(nome: str):
+    """Decorador: registra a duração de cada chamada em DOMINIO{funcao=nome}."""
+    def deco(fn):
+        @wraps(fn)
+        def envolto(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                DOMINIO.observa(time.perf_counter() - t, nome)
+        return envolto
+    return deco
+
+
+class MiddlewareHttp:
+    """
+    Middleware ASGI: duração por método × rota (o padrão da rota, não a URL) × status.
+    Streams (SSE) ficam de fora: a duração deles é o tempo de conexão, não de resposta.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        t = time.perf_counter()
+        info = {'status': 500, 'stream': False}
+
+        async def envia(msg):
+            if msg['type'] == 'http.response.start':
+                info['status'] = msg['status']
+                info['stream'] = any(k == b'content-type' and v.startswith(b'text/event-stream')
+                                     for k, v in msg.get('headers', ()))
+            await send(msg)
+
+        _em_andamento[0] += 1
+        try:
+            await self.app(scope, receive, envia)
+        finally:
+            _em_andamento[0] -= 1
+            if not info['stream']:
+                rota = getattr(scope.get('route'), 'path', None) or 'desconhecida'
+                HTTP.observa(time.perf_counter() - t, scope['method'], rota, str(info['status']))
+
+
+# ---------- Perfilador por amostragem ----------
+def perfil(segundos: float, hz: int = 100) -> str:
+    """
+    Amostra as pilhas de todas as outras threads por 'segundos' e devolve pilhas colapsadas
+    ("func;func;func N" por linha, formato de flamegraph), mais frequentes primeiro.
+    """
+    contagem: _Contagem = _Contagem()
+    eu = threading.get_ident()
+    fim = time.monotonic() + segundos
+    while time.monotonic() < fim:
+        for ident, frame in sys._current_frames().items():
+            if ident == eu:
+                continue
+            pilha = []
+            while frame is not None:
+                co = frame.f_code
+                pilha.append(f'{co.co_name} ({os.path.basename(co.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            contagem[';'.join(reversed(pilha))] += 1
+        time.sleep(1 / hz)
+    return ''.join(f'{pilha} {n}\n' for pilha, n in contagem.most_common())
@@ -0,0 +1,604 @@
+# server/relatorios.py
+# Agregações de relatório calculadas no servidor (antes feitas no navegador
+# sobre o dump completo de /eventos).
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, time, timedelta
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from pydantic import BaseModel
+
+import indice
+import metricas
+import storage
+from domain import TZ, Evento, ao_recarregar_eventos, ao_salvar_evento, calendario
+
+
+class TotalDiaTurno(BaseModel):
+    tear: int
+    dia: date
+    turno: int
+    trabalhado_min: float   # minutos de janela de turno (cortado em "agora")
+    parado_min: float
+    funcionando_min: float
+
+class ParetoMotivo(BaseModel):
+    motivo: int
+    descricao: Optional[str] = None
+    parado_min: float
+    ocorrencias: int
+    percentual: float
+    acumulado: float
+
+class Disponibilidade(BaseModel):
+    tear: Optional[int] = None      # None: linha agrega todos os teares (não agrupado por tear)
+    turno: Optional[int] = None
+    motivo: Optional[int] = None
+    descricao: Optional[str] = None
+    planejado_min: float            # janelas de turno no período (até "agora"), somadas nos teares da linha
+    parado_min: float               # com motivo na linha: só as paradas desse motivo
+    funcionando_min: float
+    paradas: int
+    disponibilidade: float          # % de planejado sem parada (com motivo: sem parada por esse motivo)
+    mtbf_min: Optional[float] = None   # funcionando / paradas
+    mttr_min: Optional[float] = None   # parado / paradas
+
+class MotivoTurno(BaseModel):
+    motivo: int
+    parado_min: float
+    ocorrencias: int
+
+class TotalTurno(BaseModel):
+    tear: int
+    data: date              # dia em que a instância de turno começa
+    turno: int
+    inicio: datetime
+    fim: datetime
+    fechado: bool           # turno já terminou (linha imutável em cache)
+    trabalhado_min: float   # janela do turno, cortada em "agora" se ainda aberto
+    parado_min: float
+    funcionando_min: float
+    ocorrencias: int
+    motivos: List[MotivoTurno]
+
+class StatusNoInstante(BaseModel):
+    tear: int
+    nome: Optional[str] = None
+    status: int
+    desde: Optional[datetime] = None   # início da sequência com esse status (None: sem eventos até o instante)
+    horas: Optional[float] = None      # de 'desde' até o instante
+    motivo: Optional[int] = None       # da última parada registrada, se parado
+    turno: Optional[int] = None
+
+class Intervalo(BaseModel):
+    tear: int
+    status: int
+    motivo: Optional[int] = None
+    inicio: datetime        # cortado na janela pedida
+    fim: datetime           # cortado na janela pedida e em "agora"
+    minutos: float
+
+
+# (inicio_epoch, fim_epoch, dia, turno) — pedaço de uma janela de turno dentro de um dia civil
+Segmento = Tuple[float, float, date, int]
+
+
+def _segmentos_turno(inicio: date, fim: date, turnos: Optional[Iterable[int]], agora: Optional[datetime]) -> List[Segmento]:
+    """
+    Janelas de turno entre os dias [inicio, fim], cortadas por dia civil (00:00) e por 'agora' (se informado).
+    Um turno que cruza a meia-noite gera dois segmentos: um no dia em que começa e outro no seguinte.
+    """
+    a = datetime.combine(inicio, time(0), tzinfo=TZ)
+    b = datetime.combine(fim + timedelta(days=1), time(0), tzinfo=TZ)
+    if agora is not None:
+        b = min(b, agora)
+    if b <= a:
+        return []
+    return [(s.inicio.timestamp(), s.fim.timestamp(), s.dia, s.turno)
+            for s in calendario().segmentos(a, b, turnos)]
+
+
+@metricas.cronometrado('totais_por_dia_turno')
+def totais_por_dia_turno(inicio: date, fim: date,
+                         teares: Optional[List[int]] = None,
+                         turnos: Optional[List[int]] = None) -> List[TotalDiaTurno]:
+    """Minutos trabalhados/parados por tear × dia × turno, já cortados nas janelas de turno."""
+    if fim < inicio:
+        raise ValueError('Data fim anterior à data início')
+    agora = datetime.now(TZ)
+    segs = _segmentos_turno(inicio, fim, turnos, agora)
+    if teares:
+        codigos = sorted(set(int(t) for t in teares))
+    else:
+        codigos = sorted(int(t['codigo']) for t in storage.view('teares'))
+    ate = segs[-1][1] if segs else 0.0
+
+    saida: List[TotalDiaTurno] = []
+    for tear in codigos:
+        col = indice.linha_do_tempo(tear, ate, desde=segs[0][0] if segs else None)
+        acc: Dict[Tuple[date, int], List[float]] = {}
+        for a, b, dia, turno in segs:
+            tot = acc.setdefault((dia, turno), [0.0, 0.0])
+            tot[0] += b - a
+            tot[1] += col.parado_entre(a, b)
+        for (dia, turno), (trab, par) in sorted(acc.items()):
+            saida.append(TotalDiaTurno(
+                tear=tear, dia=dia, turno=turno,
+                trabalhado_min=round(trab / 60, 2),
+                parado_min=round(par / 60, 2),
+                funcionando_min=round(max(0.0, trab - par) / 60, 2),
+            ))
+    return saida
+
+
+# ---------- Rollups diários de paradas por motivo ----------
+# Intervalos de parada FECHADOS (entre um evento status=0 e o evento seguinte do mesmo
+# tear) já distribuídos por dia/turno. Calculados por mês, quando uma consulta pede o mês
+# (meses arquivados só são lidos se consultados), e mantidos por evento gravado; a parada
+# em aberto de cada tear é somada na hora da consulta.
+# chave interna: (tear, turno, motivo) -> [segundos, ocorrencias]
+Rollup = Dict[Tuple[int, int, int], List[float]]
+_rollup_dia: Dict[date, Rollup] = {}
+_rollup_mes: Dict[Tuple[int, int], Rollup] = {}
+_meses_prontos: set = set()   # (ano, mês) já calculados; só estes recebem os eventos novos
+_ultimo_por_tear: Dict[int, Tuple[float, int, Optional[int], str]] = {}  # ts, status, motivo, hora_registro
+_rollup_turnos = None   # calendario() usado no cálculo; se os turnos mudarem, recalcula
+_rollup_lock = Lock()
+
+
+def _acumula(dia: date, chave: Tuple[int, int, int], segundos: float, ocorrencias: int):
+    if (dia.year, dia.month) not in _meses_prontos:
+        return  # mês ainda não calculado: entra inteiro quando for consultado
+    for tabela, k in ((_rollup_dia, dia), (_rollup_mes, (dia.year, dia.month))):
+        tot = tabela.setdefault(k, {}).setdefault(chave, [0.0, 0])
+        tot[0] += segundos
+        tot[1] += ocorrencias
+
+def _distribui(tear: int, a: float, b: float, motivo: int, segs: List[Segmento], inicios: List[float]):
+    """Soma o intervalo de parada [a, b) nos segmentos de turno que ele cruza."""
+    j = max(bisect_right(inicios, a) - 1, 0)
+    while j < len(segs) and segs[j][0] < b:
+        sa, sb, dia, turno = segs[j]
+        sobra = min(b, sb) - max(a, sa)
+        if sobra > 0:
+            _acumula(dia, (tear, turno, motivo), sobra, 0)
+        j += 1
+
+def _conta_ocorrencia(tear: int, ts: float, motivo: int, segs: List[Segmento], inicios: List[float]):
+    j = bisect_right(inicios, ts) - 1
+    if j >= 0 and segs[j][0] <= ts < segs[j][1]:
+        _acumula(segs[j][2], (tear, segs[j][3], motivo), 0.0, 1)
+
+def _segmentos_cobrindo(a: float, b: float) -> Tuple[List[Segmento], List[float]]:
+    d0 = datetime.fromtimestamp(a, TZ).date()
+    d1 = datetime.fromtimestamp(b, TZ).date()
+    segs = _segmentos_turno(d0, d1, None, None)
+    return segs, [s[0] for s in segs]
+
+def _mes(d: date) -> Tuple[int, int]:
+    return d.year, d.month
+
+def _inicia_rollup():
+    """Zera os rollups e anota o último evento de cada tear (carga inicial / turnos alterados). Chamar sob _rollup_lock."""
+    global _rollup_turnos
+    _rollup_dia.clear()
+    _rollup_mes.clear()
+    _meses_prontos.clear()
+    _ultimo_por_tear.clear()
+    _rollup_turnos = calendario()
+    for tear in indice.teares_com_eventos():
+        ult = indice.ultimo_evento(tear)
+        if ult is not None:
+            ts, r = ult
+            _ultimo_por_tear[tear] = (ts, r['status'], r['motivo'], r['hora_registro'])
+
+def _calcula_mes(ano: int, mes: int):
+    """
+    Rollup de um mês a partir do índice. Só conta eventos até o último já visto por
+    _rollup_novo_evento em cada tear; os posteriores chegam pelo ouvinte. Chamar sob _rollup_lock.
+    """
+    inicio = date(ano, mes, 1)
+    fim = (inicio.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    segs = _segmentos_turno(inicio, fim, None, None)
+    _meses_prontos.add((ano, mes))
+    if not segs:
+        return
+    inicios = [s[0] for s in segs]
+    a, b = segs[0][0], segs[-1][1]
+    for tear, ult in _ultimo_por_tear.items():
+        col = indice.linha_do_tempo(tear, desde=a)
+        ts, status, motivos = col.ts, col.status, col.motivo
+        n = bisect_right(ts, ult[0])
+        while n and ts[n - 1] == ult[0] and col.regs[n - 1]['hora_registro'] != ult[3]:
+            n -= 1
+        for i in range(max(bisect_right(ts, a, 0, n) - 1, 0), n):
+            if ts[i] >= b:
+                break
+            if status[i] != 0:
+                continue
+            motivo = max(motivos[i], 0)
+            _conta_ocorrencia(tear, ts[i], motivo, segs, inicios)
+            if i + 1 < n:
+                _distribui(tear, ts[i], ts[i + 1], motivo, segs, inicios)
+
+def _descarta_meses(desde: Tuple[int, int]):
+    """Esquece os meses >= desde; são recalculados quando consultados. Chamar sob _rollup_lock."""
+    for m in [m for m in _meses_prontos if m >= desde]:
+        _meses_prontos.discard(m)
+        _rollup_mes.pop(m, None)
+    for d in [d for d in _rollup_dia if _mes(d) >= desde]:
+        del _rollup_dia[d]
+
+def _garante_rollup(inicio: date, fim: date):
+    if _rollup_turnos is None or calendario() is not _rollup_turnos:
+        _inicia_rollup()
+    m = _mes(inicio)
+    while m <= _mes(fim):
+        if m not in _meses_prontos:
+            _calcula_mes(*m)
+        m = (m[0] + 1, 1) if m[1] == 12 else (m[0], m[1] + 1)
+
+@ao_salvar_evento
+def _rollup_novo_evento(ev: Evento):
+    with _rollup_lock:
+        if _rollup_turnos is None:
+            return  # ainda não foi montado; a carga inicial já vai ler este evento
+        ts = ev.data_hora.timestamp()
+        hr = ev.hora_registro.isoformat()
+        ult = _ultimo_por_tear.get(ev.tear)
+        if ult and (ult[0], ult[3]) == (ts, hr):
+            return  # já contabilizado pela carga inicial
+        if ult and ts < ult[0]:
+            # evento retroativo (TI): muda intervalos a partir dele → recalcula esses meses
+            _descarta_meses(_mes(datetime.fromtimestamp(ts, TZ).date()))
+            return
+        try:
+            if ult and ult[1] == 0:
+                segs, inicios = _segmentos_cobrindo(ult[0], ts)
+                _distribui(ev.tear, ult[0], ts, int(ult[2] or 0), segs, inicios)
+            if ev.status == 0:
+                segs, inicios = _segmentos_cobrindo(ts, ts)
+                _conta_ocorrencia(ev.tear, ts, int(ev.motivo or 0), segs, inicios)
+            _ultimo_por_tear[ev.tear] = (ts, ev.status, ev.motivo, hr)
+        except Exception:
+            _inicia_rollup()
+
+@ao_recarregar_eventos
+def _descarta_rollup():
+    global _rollup_turnos
+    with _rollup_lock:
+        _rollup_turnos = None  # próxima consulta recalcula
+
+def _rollups_do_periodo(inicio: date, fim: date) -> List[Rollup]:
+    """Rollups (mês inteiro ou dia) que cobrem [inicio, fim]. Chamar sob _rollup_lock, depois de _garante_rollup."""
+    saida = []
+    d = inicio
+    while d <= fim:
+        prox_mes = (d.replace(day=28) + timedelta(days=4)).replace(day=1)
+        if d.day == 1 and prox_mes - timedelta(days=1) <= fim:
+            saida.append(_rollup_mes.get((d.year, d.month), {}))   # mês inteiro no período
+            d = prox_mes
+        else:
+            saida.append(_rollup_dia.get(d, {}))
+            d += timedelta(days=1)
+    return saida
+
+def _abertas(sel_teares: Optional[set]) -> List[Tuple[int, float, int]]:
+    """(tear, início, motivo) das paradas ainda em aberto. Chamar sob _rollup_lock."""
+    return [(tear, u[0], int(u[2] or 0)) for tear, u in _ultimo_por_tear.items()
+            if u[1] == 0 and (sel_teares is None or tear in sel_teares)]
+
+def _distribui_abertas(abertas: List[Tuple[int, float, int]], inicio: date, fim: date,
+                       turnos: Optional[List[int]]) -> Iterable[Tuple[int, int, int, float]]:
+    """(tear, turno, motivo, segundos) das paradas em aberto: do último evento até agora, nos turnos."""
+    if not abertas:
+        return
+    segs = _segmentos_turno(inicio, fim, turnos, datetime.now(TZ))
+    inicios = [s[0] for s in segs]
+    for tear, ts, motivo in abertas:
+        j = max(bisect_right(inicios, ts) - 1, 0)
+        while j < len(segs):
+            sobra = segs[j][1] - max(ts, segs[j][0])
+            if sobra > 0:
+                yield tear, segs[j][3], motivo, sobra
+            j += 1
+
+@metricas.cronometrado('pareto_motivos')
+def pareto_motivos(inicio: date, fim: date,
+                   teares: Optional[List[int]] = None,
+                   turnos: Optional[List[int]] = None) -> List[ParetoMotivo]:
+    """Minutos parados e ocorrências por motivo no período, ordenados do maior para o menor."""
+    if fim < inicio:
+        raise ValueError('Data fim anterior à data início')
+    sel_teares = set(teares) if teares else None
+    sel_turnos = set(turnos) if turnos else None
+    acc: Dict[int, List[float]] = {}
+
+    with _rollup_lock:
+        _garante_rollup(inicio, fim)
+        for rollup in _rollups_do_periodo(inicio, fim):
+            for (tear, turno, motivo), (seg, n) in rollup.items():
+                if sel_teares is not None and tear not in sel_teares:
+                    continue
+                if sel_turnos is not None and turno not in sel_turnos:
+                    continue
+                tot = acc.setdefault(motivo, [0.0, 0])
+                tot[0] += seg
+                tot[1] += n
+        abertas = _abertas(sel_teares)
+
+    for _tear, _turno, motivo, seg in _distribui_abertas(abertas, inicio, fim, turnos):
+        acc.setdefault(motivo, [0.0, 0])[0] += seg
+
+    descr = {int(m['codigo']): m.get('descricao') for m in storage.view('motivos')}
+    total = sum(seg for seg, _n in acc.values()) or 1.0
+    saida: List[ParetoMotivo] = []
+    corrido = 0.0
+    for motivo, (seg, n) in sorted(acc.items(), key=lambda x: (-x[1][0], x[0])):
+        corrido += seg
+        saida.append(ParetoMotivo(
+            motivo=motivo, descricao=descr.get(motivo),
+            parado_min=round(seg / 60, 2), ocorrencias=int(n),
+            percentual=round(100 * seg / total, 2), acumulado=round(100 * corrido / total, 2),
+        ))
+    return saida
+
+
+AGRUPAMENTOS = ('tear', 'turno', 'motivo')
+
+@metricas.cronometrado('disponibilidade')
+def disponibilidade(inicio: date, fim: date,
+                    teares: Optional[List[int]] = None,
+                    turnos: Optional[List[int]] = None,
+                    agrupar: Iterable[str] = ('tear',)) -> List[Disponibilidade]:
+    """
+    Disponibilidade, MTBF e MTTR no período, agrupados por qualquer combinação de tear, turno
+    e motivo. Sai dos mesmos rollups do pareto (atualizados a cada evento) mais as janelas de
+    turno do calendário; uma parada conta onde foi registrada, como nos demais relatórios.
+    """
+    if fim < inicio:
+        raise ValueError('Data fim anterior à data início')
+    dims = set(agrupar)
+    if not dims <= set(AGRUPAMENTOS):
+        raise ValueError(f'agrupar aceita: {", ".join(AGRUPAMENTOS)}')
+    por_tear, por_turno, por_motivo = 'tear' in dims, 'turno' in dims, 'motivo' in dims
+    codigos = set(int(t) for t in teares) if teares else {int(t['codigo']) for t in storage.view('teares')}
+    sel_turnos = set(turnos) if turnos else None
+
+    # tempo planejado: igual para todos os teares, por turno
+    planejado_turno: Dict[int, float] = {}
+    for a, b, _dia, turno in _segmentos_turno(inicio, fim, turnos, datetime.now(TZ)):
+        planejado_turno[turno] = planejado_turno.get(turno, 0.0) + (b - a)
+
+    # (tear, turno, motivo) -> [segundos, paradas]
+    base: Dict[Tuple[int, int, int], List[float]] = {}
+    with _rollup_lock:
+        _garante_rollup(inicio, fim)
+        for rollup in _rollups_do_periodo(inicio, fim):
+            for chave, (seg, n) in rollup.items():
+                if chave[0] not in codigos or (sel_turnos is not None and chave[1] not in sel_turnos):
+                    continue
+                tot = base.setdefault(chave, [0.0, 0])
+                tot[0] += seg
+                tot[1] += n
+        abertas = _abertas(codigos)
+    for tear, turno, motivo, seg in _distribui_abertas(abertas, inicio, fim, turnos):
+        base.setdefault((tear, turno, motivo), [0.0, 0])[0] += seg
+
+    def grupo(tear: int, turno: int) -> Tuple[Optional[int], Optional[int]]:
+        return (tear if por_tear else None, turno if por_turno else None)
+
+    planejado: Dict[tuple, float] = {}
+    for tear in codigos:
+        for turno, seg in planejado_turno.items():
+            g = grupo(tear, turno)
+            planejado[g] = planejado.get(g, 0.0) + seg
+    parado_grupo: Dict[tuple, float] = {}
+    linhas: Dict[tuple, List[float]] = {} if por_motivo else {g: [0.0, 0] for g in planejado}
+    for (tear, turno, motivo), (seg, n) in base.items():
+        g = grupo(tear, turno)
+        parado_grupo[g] = parado_grupo.get(g, 0.0) + seg
+        tot = linhas.setdefault(g + (motivo,) if por_motivo else g, [0.0, 0])
+        tot[0] += seg
+        tot[1] += n
+
+    descr = {int(m['codigo']): m.get('descricao') for m in storage.view('motivos')} if por_motivo else {}
+    saida: List[Disponibilidade] = []
+    for chave, (parado, n) in sorted(linhas.items(), key=lambda x: tuple(-1 if v is None else v for v in x[0])):
+        g = chave[:2]
+        plan = planejado.get(g, 0.0)
+        func = max(0.0, plan - parado_grupo.get(g, 0.0))
+        motivo = chave[2] if por_motivo else None
+        saida.append(Disponibilidade(
+            tear=g[0], turno=g[1], motivo=motivo, descricao=descr.get(motivo),
+            planejado_min=round(plan / 60, 2), parado_min=round(parado / 60, 2),
+            funcionando_min=round(func / 60, 2), paradas=int(n),
+            disponibilidade=round(100 * max(0.0, plan - parado) / plan, 2) if plan else 0.0,
+            mtbf_min=round(func / n / 60, 2) if n else None,
+            mttr_min=round(parado / n / 60, 2) if n else None,
+        ))
+    return saida
+
+
+# ---------- Rollups por instância de turno ----------
+# Uma linha por (instância de turno, tear) com segundos parados e ocorrências por motivo.
+# Turnos já terminados ficam em cache e só são recalculados se um evento (novo ou
+# retroativo) cair dentro deles ou antes deles sem outro evento do tear no meio.
+# chave: (inicio_epoch, fim_epoch, turno) -> {tear: {motivo: [segundos, ocorrencias]}}
+Instancia = Tuple[float, float, int]
+_instancias: Dict[Instancia, Dict[int, Dict[int, List[float]]]] = {}
+_instancias_turnos = None   # calendario() usado no cache; se os turnos mudarem, zera
+_instancias_lock = Lock()
+metricas.Medidor('paradas_rollup_turnos_em_cache', 'Linhas (instância de turno × tear) de turnos fechados em cache',
+                 lambda: sum(len(v) for v in list(_instancias.values())))
+
+
+def _resumo_instancias(col: 'indice.Colunas', insts: List[Instancia], agora: float):
+    """Para cada instância devolve {motivo: [segundos parado, ocorrências]}, cortada em agora."""
+    ts, st, mot = col.ts, col.status, col.motivo
+    for a, b, _turno in insts:
+        b = min(b, agora)
+        i = bisect_left(ts, a)
+        status, motivo = (st[i - 1], mot[i - 1]) if i else (1, -1)
+        cur = a
+        por_motivo: Dict[int, List[float]] = {}
+        while i < len(ts) and ts[i] < b:
+            if status == 0:
+                por_motivo.setdefault(max(motivo, 0), [0.0, 0])[0] += ts[i] - cur
+            cur = ts[i]
+            status, motivo = st[i], mot[i]
+            if status == 0:
+                por_motivo.setdefault(max(motivo, 0), [0.0, 0])[1] += 1
+            i += 1
+        if status == 0:
+            por_motivo.setdefault(max(motivo, 0), [0.0, 0])[0] += b - cur
+        yield por_motivo
+
+@ao_salvar_evento
+def _invalida_instancias(ev: Evento):
+    with _instancias_lock:
+        ts = ev.data_hora.timestamp()
+        afetadas = [k for k, linhas in _instancias.items() if k[1] > ts and ev.tear in linhas]
+        if not afetadas:
+            return
+        # o evento muda o status do tear de ts até o próximo evento dele
+        prox = indice.proximo_evento(ev.tear, ts)
+        for k in afetadas:
+            if prox is None or k[0] <= prox:
+                del _instancias[k][ev.tear]
+
+@ao_recarregar_eventos
+def _descarta_instancias():
+    with _instancias_lock:
+        _instancias.clear()
+
+def _linhas_do_storage(codigos: List[int], desde: float, ate: float) -> Dict[int, 'indice.Colunas']:
+    """Como indice.linha_do_tempo(tear, ate, desde) para cada tear, numa leitura só do storage."""
+    por: Dict[int, List[Mapping[str, Any]]] = {t: [] for t in codigos}
+    for t, r in storage.anteriores(desde, codigos).items():
+        por[t].append(r)
+    for r in storage.percorrer_eventos(desde, ate, codigos):
+        por[int(r['tear'])].append(r)
+    return {t: indice.colunas_de(rs) for t, rs in por.items()}
+
+@metricas.cronometrado('totais_por_turno')
+def totais_por_turno(inicio: date, fim: date,
+                     teares: Optional[List[int]] = None,
+                     turnos: Optional[List[int]] = None,
+                     guardar: bool = True) -> List[TotalTurno]:
+    """
+    Minutos trabalhados/parados e ocorrências por motivo, por tear × instância de turno iniciada
+    em [inicio, fim]. guardar=False (exportações de anos) usa o cache mas não o aumenta, e o
+    que falta é lido direto do storage: meses do arquivo não entram no índice.
+    """
+    global _instancias_turnos
+    if fim < inicio:
+        raise ValueError('Data fim anterior à data início')
+    agora = datetime.now(TZ)
+    a = datetime.combine(inicio, time(0), tzinfo=TZ)
+    b = min(datetime.combine(fim + timedelta(days=1), time(0), tzinfo=TZ), agora)
+    if teares:
+        codigos = sorted(set(int(t) for t in teares))
+    else:
+        codigos = sorted(int(t['codigo']) for t in storage.view('teares'))
+    agora_ts = agora.timestamp()
+
+    saida: List[TotalTurno] = []
+    fora: Optional[Dict[int, 'indice.Colunas']] = None   # guardar=False: linhas do tempo lidas do storage
+    with _instancias_lock:
+        cal = calendario()
+        if cal is not _instancias_turnos:
+            _instancias.clear()
+            _instancias_turnos = cal
+        insts = [(i.inicio.timestamp(), i.fim.timestamp(), i.turno)
+                 for i in cal.instancias(a, b, turnos) if inicio <= i.inicio.date() and i.inicio < b]
+        for tear in codigos:
+            faltam = [k for k in insts if tear not in _instancias.get(k, {})]
+            calculadas: Dict[Instancia, Dict[int, List[float]]] = {}
+            if faltam:
+                if guardar:
+                    col = indice.linha_do_tempo(tear, min(faltam[-1][1], agora_ts), desde=faltam[0][0])
+                else:
+                    if fora is None:
+                        fora = _linhas_do_storage(codigos, insts[0][0], min(insts[-1][1], agora_ts))
+                    col = fora[tear]
+                for k, por_motivo in zip(faltam, _resumo_instancias(col, faltam, agora_ts)):
+                    calculadas[k] = por_motivo
+                    if guardar and k[1] <= agora_ts:
+                        _instancias.setdefault(k, {})[tear] = por_motivo
+            for k in insts:
+                por_motivo = calculadas[k] if k in calculadas else _instancias[k][tear]
+                trab = min(k[1], agora_ts) - k[0]
+                par = sum(seg for seg, _n in por_motivo.values())
+                ini = datetime.fromtimestamp(k[0], TZ)
+                saida.append(TotalTurno(
+                    tear=tear, data=ini.date(), turno=k[2],
+                    inicio=ini, fim=datetime.fromtimestamp(k[1], TZ), fechado=k[1] <= agora_ts,
+                    trabalhado_min=round(trab / 60, 2),
+                    parado_min=round(par / 60, 2),
+                    funcionando_min=round(max(0.0, trab - par) / 60, 2),
+                    ocorrencias=int(sum(n for _seg, n in por_motivo.values())),
+                    motivos=[MotivoTurno(motivo=m, parado_min=round(seg / 60, 2), ocorrencias=int(n))
+                             for m, (seg, n) in sorted(por_motivo.items())],
+                ))
+    return saida
+
+
+# ---------- Consultas num instante / numa janela ----------
+def _codigos(teares: Optional[List[int]]) -> List[Tuple[int, Optional[str]]]:
+    nomes = {int(t['codigo']): t.get('nome') for t in storage.view('teares')}
+    if teares:
+        return [(c, nomes.get(c)) for c in sorted(set(int(t) for t in teares))]
+    return sorted(nomes.items())
+
+@metricas.cronometrado('status_no_instante')
+def status_no_instante(instante: datetime, teares: Optional[List[int]] = None) -> List[StatusNoInstante]:
+    """Status de cada tear no instante (auditoria de troca de turno, análise de ocorrência)."""
+    codigos = _codigos(teares)
+    ts = instante.timestamp()
+    estados = indice.estado_em([c for c, _n in codigos], ts)
+    saida = []
+    for cod, nome in codigos:
+        e = estados.get(cod)
+        if e is None:
+            # sem eventos até o instante: funcionando, como no status atual
+            saida.append(StatusNoInstante(tear=cod, nome=nome, status=1))
+            continue
+        status, desde, reg = e
+        saida.append(StatusNoInstante(
+            tear=cod, nome=nome, status=status,
+            desde=datetime.fromtimestamp(desde, TZ), horas=round((ts - desde) / 3600, 2),
+            motivo=reg['motivo'] if status == 0 else None, turno=reg['turno'],
+        ))
+    return saida
+
+@metricas.cronometrado('intervalos')
+def intervalos(inicio: datetime, fim: datetime, teares: Optional[List[int]] = None) -> List[Intervalo]:
+    """
+    Trechos parado/funcionando de cada tear que cruzam [inicio, fim), cortados na janela.
+    Uma parada que troca de motivo vira dois trechos. Antes do primeiro evento do tear não há trecho.
+    """
+    if fim <= inicio:
+        raise ValueError('Fim deve ser posterior ao início')
+    a = inicio.timestamp()
+    b = min(fim, datetime.now(TZ)).timestamp()
+    saida: List[Intervalo] = []
+    for cod, _nome in _codigos(teares):
+        col = indice.linha_do_tempo(cod, b, desde=a)
+        ts, st, mo = col.ts, col.status, col.motivo
+        trechos: List[list] = []   # [status, motivo, ini, fim]
+        for k in range(len(ts)):
+            ini, fim_k = max(ts[k], a), (ts[k + 1] if k + 1 < len(ts) else b)
+            if fim_k <= a:
+                continue
+            if trechos and trechos[-1][0] == st[k] and trechos[-1][1] == mo[k]:
+                trechos[-1][3] = fim_k
+            else:
+                trechos.append([st[k], mo[k], ini, fim_k])
+        for status, motivo, ini, fim_k in trechos:
+            saida.append(Intervalo(
+                tear=cod, status=status, motivo=motivo if status == 0 and motivo >= 0 else None,
+                inicio=datetime.fromtimestamp(ini, TZ), fim=datetime.fromtimestamp(fim_k, TZ),
+                minutos=round((fim_k - ini) / 60, 2),
+            ))
+    return saida
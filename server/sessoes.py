@@ -0,0 +1,131 @@
+# server/sessoes.py
+# Sessões de login indexadas por token, com expiração por inatividade.
+# sessions.json vira journal (um registro por login, sem reescrever o arquivo) e só é
+# compactado pela limpeza periódica, que também descarta as sessões vencidas.
+# O último uso fica no journal (visto_em), gravado no máximo a cada TOQUE_S por token:
+# vale para todos os workers e sobrevive a reinícios.
+import logging, os, secrets, time
+from datetime import datetime
+from threading import Lock, Thread
+from typing import Any, Dict, Optional, Tuple
+
+import storage
+
+TTL_S = float(os.getenv('PARADAS_SESSAO_TTL_H', '12')) * 3600     # inatividade até expirar
+LIMPEZA_S = float(os.getenv('PARADAS_SESSAO_LIMPEZA_MIN', '10')) * 60
+TOQUE_S = float(os.getenv('PARADAS_SESSAO_TOQUE_MIN', '5')) * 60      # intervalo mínimo entre gravações de visto_em
+
+log = logging.getLogger('paradas')
+
+_por_token: Dict[str, Dict[str, Any]] = {}     # token -> {token, cod, created_at, visto_em}
+_visto: Dict[str, float] = {}                  # token -> último uso (epoch): o do disco ou um local mais novo
+_gravado: Dict[str, float] = {}                # token -> último uso já no disco
+_usuarios: Dict[int, Dict[str, Any]] = {}      # cod -> {cod, nome, role}
+_base_sessoes: Optional[tuple] = None          # views do storage de onde os índices vieram
+_base_usuarios: Optional[tuple] = None
+_lock = Lock()
+_lock_escrita = Lock()   # login x compactação: a compactação não pode engolir um login novo
+
+
+def _epoch(iso: str) -> float:
+    return datetime.fromisoformat(iso).timestamp()
+
+def _resolve(sessoes) -> Tuple[Dict[int, Dict[str, Any]], Dict[str, float]]:
+    """
+    Journal -> (sessão vigente de cada cod, último uso de cada token). Vale o login mais
+    recente (created_at) de cada usuário; um registro de uso atrasado não derruba um login novo.
+    """
+    por_cod: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+    visto: Dict[str, float] = {}
+    for s in sessoes:
+        criado = _epoch(s['created_at'])
+        visto[s['token']] = max(visto.get(s['token'], criado), _epoch(s.get('visto_em') or s['created_at']))
+        atual = por_cod.get(int(s['cod']))
+        if atual is None or criado >= atual[0]:
+            por_cod[int(s['cod'])] = (criado, s)
+    return {cod: dict(s) for cod, (_c, s) in por_cod.items()}, visto
+
+def _sincroniza():
+    """Reindexa se sessions/users mudaram no storage (login, CRUD de usuário, outro processo). Chamar sob _lock."""
+    global _base_sessoes, _base_usuarios
+    sessoes = storage.view('sessions')
+    if sessoes is not _base_sessoes:
+        _por_token.clear()
+        por_cod, visto = _resolve(sessoes)
+        for s in por_cod.values():
+            t = s['token']
+            _por_token[t] = s
+            _gravado[t] = visto[t]
+            _visto[t] = max(_visto.get(t, 0.0), visto[t])
+        for token in list(_visto):
+            if token not in _por_token:
+                del _visto[token]
+                _gravado.pop(token, None)
+        _base_sessoes = sessoes
+    usuarios = storage.view('users')
+    if usuarios is not _base_usuarios:
+        _usuarios.clear()
+        for u in usuarios:
+            _usuarios[int(u['cod'])] = {'cod': u['cod'], 'nome': u['nome'], 'role': u['role']}
+        _base_usuarios = usuarios
+
+def _expirada(token: str, agora: float) -> bool:
+    return agora - _visto.get(token, 0.0) > TTL_S
+
+def criar(cod: int, tz=None) -> str:
+    """Abre uma sessão para o usuário (derrubando a anterior dele) e devolve o token."""
+    token = secrets.token_hex(16)
+    with _lock_escrita:
+        storage.append('sessions', {'token': token, 'cod': cod, 'created_at': datetime.now(tz).isoformat()})
+    with _lock:
+        _sincroniza()
+    return token
+
+def usuario(token: str) -> Optional[Dict[str, Any]]:
+    """Usuário dono do token, ou None se o token não existe ou expirou. Conta como uso da sessão."""
+    agora = time.time()
+    with _lock:
+        _sincroniza()
+        sess = _por_token.get(token)
+        if not sess or _expirada(token, agora):
+            return None
+        _visto[token] = agora
+        toque = None
+        if agora - _gravado.get(token, 0.0) > TOQUE_S:
+            _gravado[token] = agora   # um toque por vez, mesmo com requisições concorrentes
+            toque = dict(sess, visto_em=datetime.fromtimestamp(agora).astimezone().isoformat())
+        u = _usuarios.get(int(sess['cod']))
+    if toque is not None:
+        with _lock_escrita:
+            storage.append('sessions', toque)
+    return dict(u) if u else None
+
+def limpar():
+    """
+    Remove sessões expiradas e compacta sessions.json com as que restaram. Vencida é a que
+    está sem uso pelo visto_em gravado (compartilhado), não pelo relógio deste worker: uma
+    sessão ativa só em outro worker segue valendo.
+    """
+    with _lock_escrita:
+        with _lock:
+            _sincroniza()
+            compactar = len(_base_sessoes) > len(_por_token) or \
+                any(time.time() - _gravado[t] > TTL_S for t in _por_token)
+        if not compactar:
+            return
+        # decide dentro da transação: logins e usos gravados por outros workers nesse meio-tempo contam
+        with storage.transacao('sessions') as sessoes:
+            por_cod, visto = _resolve(sessoes)
+            agora = time.time()
+            sessoes[:] = [dict(s, visto_em=datetime.fromtimestamp(visto[s['token']]).astimezone().isoformat())
+                          for s in por_cod.values() if agora - visto[s['token']] <= TTL_S]
+
+def _loop_limpeza():
+    while True:
+        time.sleep(LIMPEZA_S)
+        try:
+            limpar()
+        except Exception:
+            log.exception('falha na limpeza de sessões')   # tenta de novo no próximo ciclo
+
+Thread(target=_loop_limpeza, daemon=True, name='limpeza-sessoes').start()
@@ -1,11 +1,83 @@
-import json, os, tempfile
-from threading import Lock
-from typing import Any, Dict, List
+import gzip, json, math, os, tempfile, time, zlib
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from threading import Condition, Thread
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple
 from json import JSONDecodeError
 
+import metricas
+
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-_lock = Lock()
+DATA_DIR = os.getenv('PARADAS_DATA_DIR') or os.path.join(BASE_DIR, 'data')   # outro diretório: testes de carga
+BACKEND = os.getenv('PARADAS_STORAGE', 'json').lower()   # 'json' (data/*.json) | 'sqlite'
+_lock = metricas.TravaMedida('storage')
+_lock_compactacao = metricas.TravaMedida('storage_compactacao')  # serializa compactação x write() de chaves com journal
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class _TravaArquivo:
+    """
+    Trava entre processos (vários workers do uvicorn) num arquivo de lock: flock, ou
+    msvcrt.locking no Windows (lá sempre exclusiva). Reentrante dentro do processo —
+    quem usa já está sob a Lock correspondente, então um contador basta.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.nome = os.path.basename(path)
+        self._fd: Optional[int] = None
+        self._nivel = 0
+
+    @contextmanager
+    def __call__(self, compartilhada: bool = False):
+        if self._nivel:
+            self._nivel += 1
+            try:
+                yield
+            finally:
+                self._nivel -= 1
+            return
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl:
+            modo = fcntl.LOCK_SH if compartilhada else fcntl.LOCK_EX
+            try:
+                fcntl.flock(self._fd, modo | fcntl.LOCK_NB)
+            except BlockingIOError:   # outro processo segura: mede a espera
+                t = time.perf_counter()
+                fcntl.flock(self._fd, modo)
+                metricas.ESPERA_TRAVA.observa(time.perf_counter() - t, self.nome)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            while True:
+                try:
+                    msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK desiste após ~10s; continua esperando
+        self._nivel = 1
+        try:
+            yield
+        finally:
+            self._nivel = 0
+            if fcntl:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+# Ordem de aquisição (evita deadlock): _lock_compactacao → _trava_compactacao → _lock → _trava.
+# _trava: escritas nos arquivos (exclusiva) e releitura (compartilhada), sempre sob _lock.
+# _trava_compactacao: compactação inteira / reescrita de chave com journal, sob _lock_compactacao.
+_trava = _TravaArquivo(os.path.join(DATA_DIR, '.paradas.lock'))
+_trava_compactacao = _TravaArquivo(os.path.join(DATA_DIR, '.compactacao.lock'))
 
 FILES = {
     'status': os.path.join(DATA_DIR, 'status_tear.json'),
@@ -17,6 +89,47 @@ FILES = {
 
 }
 
+# Chaves append-only: cada registro novo vira uma linha no journal (JSONL),
+# e o snapshot (FILES[key]) só é reescrito na compactação.
+JOURNALS = {
+    'status': os.path.join(DATA_DIR, 'status_tear.jsonl'),
+    'sessions': os.path.join(DATA_DIR, 'sessions.jsonl'),
+}
+JOURNAL_MAX = int(os.getenv('PARADAS_JOURNAL_MAX', '2000'))  # linhas até compactar
+_journal_linhas: Dict[str, int] = {}
+_compactando: set = set()
+
+# Group commit: appends concorrentes da mesma chave entram numa fila; o primeiro que
+# encontra o disco livre vira líder, grava a fila inteira com um só fsync/transação e
+# acorda os demais. Enquanto um lote está no disco, o próximo vai se formando.
+# GRUPO_MS > 0 segura o líder um pouco mais para juntar lotes maiores (latência x vazão).
+GRUPO_S = float(os.getenv('PARADAS_GRUPO_MS', '0')) / 1000
+_fila: Dict[str, list] = {key: [] for key in JOURNALS}
+_gravando: set = set()          # chaves com lote no disco agora
+_grupo = Condition()
+
+# Cache em memória por chave: (assinatura dos arquivos, tupla de registros somente-leitura).
+# A assinatura (inode, mtime_ns, tamanho) detecta alteração feita por fora do processo;
+# escritas feitas aqui atualizam o cache diretamente, sem reler o arquivo.
+_cache: Dict[str, Tuple[tuple, tuple]] = {}
+
+# Registros que outro processo acrescentou, ainda não repassados a quem acompanha a chave
+# (ver acompanhar); None = o conteúdo mudou de outro jeito e quem acompanha deve recalcular.
+_externos: Dict[str, Optional[list]] = {}
+
+# Métricas (GET /metrics): leituras por resultado do cache, custo de reler/parsear,
+# escritas por chave, fsync e bytes por arquivo, tamanho do lote do group commit.
+LEITURAS = metricas.Contador('paradas_storage_leituras_total',
+                             'Leituras por chave: hit (cache), journal (só linhas novas) ou completa', ('key', 'cache'))
+CARGA = metricas.Histograma('paradas_storage_carga_segundos', 'Releitura e parse do disco por chave', ('key', 'tipo'))
+LIDOS = metricas.Contador('paradas_storage_lidos_bytes_total', 'Bytes relidos do disco por chave', ('key',))
+ESCRITA = metricas.Histograma('paradas_storage_escrita_segundos',
+                              'write/transacao/append por chave, com espera pelas travas', ('key', 'op'))
+FSYNC = metricas.Histograma('paradas_storage_fsync_segundos', 'Duração do fsync por arquivo', ('arquivo',))
+GRAVADOS = metricas.Contador('paradas_storage_gravados_bytes_total', 'Bytes gravados por arquivo', ('arquivo',))
+LOTE = metricas.Histograma('paradas_storage_lote_registros', 'Registros por commit do group commit', ('key',),
+                           buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+
 _DEF_STATUS: List[Dict[str, Any]] = []
 _DEF_MOTIVOS = [
     {"codigo": 103, "descricao": "Sem operador"},
@@ -34,7 +147,7 @@ for dow in range(1, 8):
 _DEF_TEARES: List[Dict[str, Any]] = []  # <- NOVO
 
 _DEF_USERS = []          # lista de dicts {cod, nome, senha_hash, role}
-_DEF_SESSIONS = []       # [{token, cod, created_at}]
+_DEF_SESSIONS = []       # [{token, cod, created_at, visto_em}] — journal: vale o login mais recente de cada cod
 _DEFAULTS = {
     'status': _DEF_STATUS,
     'motivos': _DEF_MOTIVOS,
@@ -50,8 +163,9 @@ def _ensure_file(path: str, default):
         with open(path, 'w', encoding='utf-8') as f:
             json.dump(default, f, ensure_ascii=False, indent=2)
 
-for key, default in _DEFAULTS.items():
-    _ensure_file(FILES[key], default)
+if BACKEND == 'json':
+    for key, default in _DEFAULTS.items():
+        _ensure_file(FILES[key], default)
 
 def _safe_load(path: str, default):
     try:
@@ -63,27 +177,689 @@ def _safe_load(path: str, default):
         return default
 
 def read(key: str):
-    path = FILES[key]
+    """Cópia (lista de dicts) dos dados de `key`; pode ser alterada livremente pelo chamador."""
     with _lock:
-        return _safe_load(path, _DEFAULTS[key])
+        return [dict(r) for r in _carrega(key)]
+
+def view(key: str) -> tuple:
+    """Dados de `key` sem cópia: tupla de mapeamentos somente-leitura, para quem só consulta."""
+    with _lock:
+        return _carrega(key)
 
 def write(key: str, data):
-    path = FILES[key]
+    with ESCRITA.tempo(key, 'write'), _lock_compactacao if key in JOURNALS else nullcontext():
+        with _trava_compactacao() if key in JOURNALS else nullcontext():
+            with _lock, _trava():
+                _grava(key, data)
+
+def _grava(key: str, data):
+    """Reescreve `key` por inteiro. Chamar sob _lock e _trava (e das travas de compactação, se tiver journal)."""
+    _atomic_write(FILES[key], data)
+    if key in JOURNALS:
+        # reescrita completa: o snapshot passa a ser a verdade e o journal é descartado
+        _remove(JOURNALS[key])
+        _journal_linhas[key] = 0
+    _guarda_cache(key, data)
+
+@contextmanager
+def transacao(key: str):
+    """
+    Leitura-alteração-escrita atômica, também entre processos:
+        with storage.transacao('teares') as teares:
+            teares.append(...)
+    A lista é gravada ao sair do bloco (nada é gravado se o bloco lançar exceção).
+    Segura o storage inteiro: nada de I/O lento nem outras chamadas ao storage dentro do bloco.
+    """
+    with ESCRITA.tempo(key, 'transacao'), _lock_compactacao if key in JOURNALS else nullcontext():
+        with _trava_compactacao() if key in JOURNALS else nullcontext():
+            with _lock, _trava():
+                rows = [dict(r) for r in _carrega(key)]
+                yield rows
+                _grava(key, rows)
+
+def append(key: str, registro):
+    """Acrescenta um registro ao journal de `key` (uma linha + fsync, em grupo com appends concorrentes)."""
+    append_lote(key, [registro])
+
+class _Pedido:
+    __slots__ = ('registros', 'feito', 'erro')
+
+    def __init__(self, registros: list):
+        self.registros = registros
+        self.feito = False
+        self.erro: Optional[BaseException] = None
+
+def append_lote(key: str, registros: list):
+    """
+    Acrescenta vários registros a `key` numa única escrita durável. Retorna só depois
+    que os registros estão no disco (possivelmente junto com os de outras threads).
+    """
+    if not registros:
+        return
+    with ESCRITA.tempo(key, 'append'):
+        _append_lote(key, registros)
+
+def _append_lote(key: str, registros: list):
+    pedido = _Pedido(list(registros))
+    with _grupo:
+        _fila[key].append(pedido)
+        while key in _gravando and not pedido.feito:
+            _grupo.wait()
+        if pedido.feito:   # foi no lote de outro thread
+            if pedido.erro is not None:
+                raise pedido.erro
+            return
+        _gravando.add(key)
+    # líder: junta o que chegou (inclusive durante a janela) e grava de uma vez
+    if GRUPO_S:
+        time.sleep(GRUPO_S)
+    with _grupo:
+        lote, _fila[key] = _fila[key], []
+    LOTE.observa(sum(len(p.registros) for p in lote), key)
+    erro: Optional[BaseException] = None
+    try:
+        _grava_lote(key, [r for p in lote for r in p.registros])
+    except BaseException as e:
+        erro = e
+    with _grupo:
+        for p in lote:
+            p.feito, p.erro = True, erro
+        _gravando.discard(key)
+        _grupo.notify_all()
+    if erro is not None:
+        raise erro
+
+def _grava_lote(key: str, registros: list):
+    """Uma linha por registro no journal de `key` + um fsync; atualiza o cache sem reler."""
+    jpath = JOURNALS[key]
+    with _lock, _trava():
+        _carrega(key)   # antes, o que outros processos gravaram (assim o cache fica em dia)
+        antes = _assinatura(key)
+        _append_journal(jpath, registros)
+        _journal_linhas[key] = _journal_linhas.get(key, 0) + len(registros)
+        hit = _cache.get(key)
+        if hit and hit[0] == antes:
+            novos = tuple(MappingProxyType(dict(r)) for r in registros)
+            _cache[key] = (_assinatura(key), hit[1] + novos)
+        compactar_agora = _journal_linhas[key] >= JOURNAL_MAX and key not in _compactando
+        if compactar_agora:
+            _compactando.add(key)
+    if compactar_agora:
+        Thread(target=_compactar, args=(key,), daemon=True, name=f'compacta-{key}').start()
+
+def versao(key: str) -> str:
+    """
+    Identificador do conteúdo atual de `key` (para ETag). Derivado da assinatura dos
+    arquivos, então é o mesmo em todos os workers e muda a cada escrita de qualquer um.
+    """
     with _lock:
-        _atomic_write(path, data)
+        _carrega(key)
+        return '%08x' % zlib.crc32(repr(_cache[key][0]).encode())
+
+def acompanhar(key: str) -> Optional[list]:
+    """
+    Registros que outros processos acrescentaram a `key` desde a chamada anterior
+    (a primeira chamada só começa o acompanhamento e devolve []). None quando a chave
+    foi reescrita por fora: quem acompanha deve recalcular a partir de view(key).
+    """
+    with _lock:
+        _carrega(key)
+        if key not in _externos:
+            _externos[key] = []
+            return []
+        novos, _externos[key] = _externos[key], []
+        return novos
+
+def compactar(key: str):
+    """Incorpora o journal de `key` ao snapshot (bloqueante)."""
+    with _lock:
+        if key in _compactando:
+            return
+        _compactando.add(key)
+    _compactar(key)
+
+def importar(key: str, registros: list):
+    """
+    Carga em massa: incorpora os registros direto no snapshot, junto com o journal pendente,
+    numa única regravação (bloqueante). Milhões de linhas no journal, cada lote disparando
+    uma compactação, regravariam o snapshot várias vezes. Outros processos veem a chave
+    reescrita e recarregam.
+    """
+    if not registros:
+        return
+    with ESCRITA.tempo(key, 'importa'):
+        with _lock:
+            _compactando.add(key)
+        _compactar(key, registros)
+
+def _compactar(key: str, extras: list = ()):
+    # 1) gira o journal (rápido, sob _lock) -> appends seguem num journal novo
+    # 2) mescla snapshot + journal girado (+ extras de importar) fora do _lock
+    # 3) troca o snapshot e apaga o journal girado (sob _lock)
+    path, jpath = FILES[key], JOURNALS[key]
+    rot = jpath + '.compactando'
+    try:
+        with _lock_compactacao, _trava_compactacao():
+            with _lock, _trava():
+                antes = _assinatura(key)
+                if os.path.exists(jpath):
+                    os.replace(jpath, rot)
+                _journal_linhas[key] = 0
+                _reassina(key, antes)
+            pendentes = _ler_journal(rot)
+            if not pendentes and not extras:
+                with _lock, _trava():
+                    antes = _assinatura(key)
+                    _remove(rot)
+                    _reassina(key, antes)
+                return
+            base = _safe_load(path, _DEFAULTS[key])
+            tmp = _dump_temp(path, base + pendentes + list(extras))
+            with _lock, _trava():
+                antes = _assinatura(key)
+                os.replace(tmp, path)
+                _remove(rot)
+                if extras:
+                    _cache.pop(key, None)   # conteúdo novo: relido na próxima leitura
+                else:
+                    _reassina(key, antes)
+    finally:
+        with _lock:
+            _compactando.discard(key)
+    if key == 'status':
+        arquivar()  # meses que saíram da janela quente vão para o arquivo
+
+def _arquivos(key: str) -> List[str]:
+    if key in JOURNALS:
+        jpath = JOURNALS[key]
+        return [FILES[key], jpath + '.compactando', jpath]
+    return [FILES[key]]
+
+def _assinatura(key: str) -> tuple:
+    sig = []
+    for p in _arquivos(key):
+        try:
+            st = os.stat(p)
+            sig.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            sig.append(None)
+    return tuple(sig)
+
+def _carrega(key: str) -> tuple:
+    """Devolve os registros de `key` do cache, relendo o disco só se os arquivos mudaram. Chamar sob _lock."""
+    sig = _assinatura(key)
+    hit = _cache.get(key)
+    if hit and hit[0] == sig:
+        LEITURAS.inc(key, 'hit')
+        return hit[1]
+    t = time.perf_counter()
+    with _trava(compartilhada=True):   # não lê no meio de uma escrita/compactação de outro processo
+        sig = _assinatura(key)
+        novos = _cauda_journal(key, hit[0], sig) if hit and key in JOURNALS else None
+        if novos is not None:
+            registros = hit[1] + tuple(MappingProxyType(dict(r)) for r in novos)
+            tipo, lidos = 'journal', sig[-1][2] - (hit[0][-1][2] if hit[0][-1] else 0)
+        else:
+            tipo, lidos = 'completa', sum(x[2] for x in sig if x)
+            data = _safe_load(FILES[key], _DEFAULTS[key])
+            if key in JOURNALS:
+                jpath = JOURNALS[key]
+                data = data + _ler_journal(jpath + '.compactando') + _ler_journal(jpath)
+            registros = tuple(MappingProxyType(dict(r)) for r in data)
+            if hit:
+                # compactação de outro processo: mesmo conteúdo + eventuais novos no fim
+                n = len(hit[1])
+                novos = list(data[n:]) if len(registros) >= n and registros[:n] == hit[1] else None
+    _cache[key] = (sig, registros)
+    LEITURAS.inc(key, tipo)
+    LIDOS.inc(key, n=lidos)
+    CARGA.observa(time.perf_counter() - t, key, tipo)
+    if hit and key in _externos and _externos[key] is not None:
+        if novos is None:
+            _externos[key] = None
+        else:
+            _externos[key].extend(novos)
+    return registros
+
+def _cauda_journal(key: str, antes: tuple, sig: tuple) -> Optional[list]:
+    """Se desde `antes` só o journal cresceu (appends de outro processo), lê apenas as linhas novas."""
+    if sig[:-1] != antes[:-1] or sig[-1] is None:
+        return None
+    ja_lido = 0
+    if antes[-1] is not None:
+        if antes[-1][0] != sig[-1][0] or sig[-1][2] < antes[-1][2]:
+            return None  # journal trocado/truncado
+        ja_lido = antes[-1][2]
+    with open(JOURNALS[key], 'rb') as f:
+        f.seek(ja_lido)
+        dados = f.read(sig[-1][2] - ja_lido)
+    out = []
+    for linha in dados.splitlines():
+        if linha.strip():
+            try:
+                out.append(json.loads(linha))
+            except JSONDecodeError:
+                return None
+    return out
+
+def _guarda_cache(key: str, data):
+    _cache[key] = (_assinatura(key), tuple(MappingProxyType(dict(r)) for r in data))
+    if key in _externos:
+        _externos[key] = None   # reescrita completa: quem acompanha recalcula
+
+def _reassina(key: str, antes: tuple):
+    """Após mudar só o layout dos arquivos (não o conteúdo), mantém o cache válido se ele estava em dia."""
+    hit = _cache.get(key)
+    if hit and hit[0] == antes:
+        _cache[key] = (_assinatura(key), hit[1])
+
+def _ler_journal(path: str) -> list:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            linhas = f.read().splitlines()
+    except FileNotFoundError:
+        return []
+    out = []
+    for linha in linhas:
+        if not linha.strip():
+            continue
+        try:
+            out.append(json.loads(linha))
+        except JSONDecodeError:
+            # linha parcial (queda no meio de um append) → ignora
+            continue
+    return out
+
+def _append_journal(path: str, registros: list):
+    linhas = ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in registros).encode('utf-8')
+    with open(path, 'ab') as f:
+        f.write(linhas)
+        f.flush()
+        _fsync(f.fileno(), os.path.basename(path), len(linhas))
+
+def _fsync(fd: int, nome: str, gravados: int):
+    t = time.perf_counter()
+    os.fsync(fd)
+    FSYNC.observa(time.perf_counter() - t, nome)
+    GRAVADOS.inc(nome, n=gravados)
+
+def _remove(path: str):
+    try: os.remove(path)
+    except FileNotFoundError: pass
+
+def _recupera_journal(key: str):
+    """Conclui uma compactação interrompida e corta linha parcial no fim do journal."""
+    path, jpath = FILES[key], JOURNALS[key]
+    rot = jpath + '.compactando'
+    if os.path.exists(rot):
+        pendentes = _ler_journal(rot)
+        base = _safe_load(path, _DEFAULTS[key])
+        # a compactação acrescenta o journal no fim do snapshot: se já está lá, não duplica
+        if pendentes and base[-len(pendentes):] != pendentes:
+            _atomic_write(path, base + pendentes)
+        _remove(rot)
+    try:
+        with open(jpath, 'rb+') as f:
+            dados = f.read()
+            if dados and not dados.endswith(b'\n'):
+                f.truncate(dados.rfind(b'\n') + 1)
+            _journal_linhas[key] = dados.count(b'\n')
+    except FileNotFoundError:
+        _journal_linhas[key] = 0
 
 def _atomic_write(path: str, data):
     """Grava JSON em arquivo temporário e troca por os.replace (atômico)."""
+    tmp = _dump_temp(path, data)
+    try:
+        os.replace(tmp, path)  # troca atômica
+    except Exception:
+        try: os.remove(tmp)
+        except Exception: pass
+        raise
+
+def _dump_temp(path: str, data) -> str:
+    """Grava JSON (com fsync) num temporário ao lado de `path` e devolve o caminho."""
     os.makedirs(os.path.dirname(path), exist_ok=True)
     fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_', suffix='.json')
     try:
         with os.fdopen(fd, 'w', encoding='utf-8') as f:
             json.dump(data, f, ensure_ascii=False, indent=2)
             f.flush()
-            os.fsync(f.fileno())
-        os.replace(tmp, path)  # troca atômica
+            _fsync(f.fileno(), os.path.basename(path), os.fstat(f.fileno()).st_size)
     except Exception:
         # se der erro, garante remoção do temp
         try: os.remove(tmp)
         except Exception: pass
         raise
+    return tmp
+
+# ---------- Arquivo de eventos por mês ----------
+# Meses fechados saem de status_tear.json para data/arquivo/status-AAAA-MM.json.gz.
+# O manifesto guarda, por segmento, os limites (epoch) e o último evento de cada tear, e
+# o estado de cada tear ao fim do arquivo. view('status') fica só com a janela quente
+# (ARQUIVO_MESES meses, mais eventos retroativos ainda não arquivados); consultas abrem
+# só os segmentos que cruzam o período pedido.
+ARQUIVO_DIR = os.path.join(DATA_DIR, 'arquivo')
+MANIFESTO = os.path.join(ARQUIVO_DIR, 'manifesto.json')
+ARQUIVO_MESES = int(os.getenv('PARADAS_ARQUIVO_MESES', '2'))    # meses na janela quente (inclui o atual)
+ARQUIVO_CACHE = int(os.getenv('PARADAS_ARQUIVO_CACHE', '6'))    # segmentos frios mantidos em memória
+_MANIFESTO_VAZIO: Dict[str, Any] = {'limite': None, 'segmentos': [], 'estado': {}}
+_manifesto: Tuple[Optional[tuple], Dict[str, Any]] = (None, _MANIFESTO_VAZIO)
+_segmentos_cache: 'OrderedDict[tuple, tuple]' = OrderedDict()
+
+def _ts(r) -> float:
+    return datetime.fromisoformat(r['data_hora']).timestamp()
+
+def _manifesto_atual() -> Dict[str, Any]:
+    """Manifesto do arquivo, relido só quando o arquivo muda. Chamar sob _lock."""
+    global _manifesto
+    try:
+        st = os.stat(MANIFESTO)
+        sig = (st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        sig = None
+    if sig != _manifesto[0]:
+        with _trava(compartilhada=True):
+            try:
+                with open(MANIFESTO, 'r', encoding='utf-8') as f:
+                    _manifesto = (sig, json.load(f))
+            except FileNotFoundError:
+                _manifesto = (None, _MANIFESTO_VAZIO)
+    return _manifesto[1]
+
+def _le_segmento(seg: Dict[str, Any]) -> tuple:
+    """Eventos de um segmento (em ordem de data_hora), com cache LRU. Chamar sob _lock."""
+    path = os.path.join(ARQUIVO_DIR, seg['arquivo'])
+    chave = (seg['arquivo'], seg['eventos'], seg['fim'])
+    hit = _segmentos_cache.get(chave)
+    if hit is not None:
+        _segmentos_cache.move_to_end(chave)
+        return hit
+    with _trava(compartilhada=True), gzip.open(path, 'rt', encoding='utf-8') as f:
+        regs = tuple(MappingProxyType(r) for r in json.load(f))
+    _segmentos_cache[chave] = regs
+    while len(_segmentos_cache) > ARQUIVO_CACHE:
+        _segmentos_cache.popitem(last=False)
+    return regs
+
+def limite_quente() -> Optional[float]:
+    """Eventos com data_hora (epoch) > limite estão todos em view('status'). None = nada arquivado."""
+    with _lock:
+        return _manifesto_atual()['limite']
+
+def segmentos_arquivo() -> List[Dict[str, Any]]:
+    """Segmentos arquivados, do mais antigo ao mais recente: {mes, arquivo, inicio, fim, eventos, ultimos}."""
+    with _lock:
+        return [dict(s) for s in _manifesto_atual()['segmentos']]
+
+def ler_segmento(seg: Dict[str, Any]) -> tuple:
+    with _lock:
+        return _le_segmento(seg)
+
+def estado_arquivado() -> Dict[int, Dict[str, Any]]:
+    """Por tear: {status, desde (ISO), ultimo} ao fim do último mês arquivado."""
+    with _lock:
+        return {int(t): dict(e) for t, e in _manifesto_atual()['estado'].items()}
+
+def consultar_eventos(inicio: Optional[float] = None, fim: Optional[float] = None,
+                      teares=None) -> List[Dict[str, Any]]:
+    """
+    Eventos com inicio <= data_hora < fim (epoch), opcionalmente de alguns teares, em ordem de
+    data_hora — do arquivo (só os segmentos que cruzam o período) e da janela quente.
+    """
+    sel = set(teares) if teares else None
+    out = []
+    with _lock:
+        fontes = [_le_segmento(seg) for seg in _manifesto_atual()['segmentos']
+                  if (inicio is None or seg['fim'] >= inicio) and (fim is None or seg['inicio'] < fim)]
+        fontes.append(_carrega('status'))
+    for regs in fontes:
+        for r in regs:
+            if sel is not None and int(r['tear']) not in sel:
+                continue
+            ts = _ts(r)
+            if (inicio is not None and ts < inicio) or (fim is not None and ts >= fim):
+                continue
+            out.append((ts, dict(r)))
+    out.sort(key=lambda x: x[0])  # estável: empate mantém ordem de gravação
+    return [r for _ts, r in out]
+
+def percorrer_eventos(inicio: Optional[float] = None, fim: Optional[float] = None,
+                      teares=None) -> Iterator[Mapping[str, Any]]:
+    """
+    Os mesmos eventos de consultar_eventos, na mesma ordem, mas lendo um mês do arquivo por
+    vez: a memória fica na janela quente mais um segmento, qualquer que seja o período.
+    Os segmentos são abertos já no início; um arquivar no meio da leitura não os apaga
+    para quem está lendo. Registros somente leitura.
+    """
+    sel = set(teares) if teares else None
+
+    def filtra(regs):
+        for r in regs:
+            if sel is not None and int(r['tear']) not in sel:
+                continue
+            ts = _ts(r)
+            if (inicio is not None and ts < inicio) or (fim is not None and ts >= fim):
+                continue
+            yield ts, r
+
+    abertos = []
+    try:
+        with _lock, _trava(compartilhada=True):
+            for seg in _manifesto_atual()['segmentos']:
+                if (inicio is None or seg['fim'] >= inicio) and (fim is None or seg['inicio'] < fim):
+                    abertos.append(open(os.path.join(ARQUIVO_DIR, seg['arquivo']), 'rb'))
+            quentes = sorted(filtra(_carrega('status')), key=lambda x: x[0])   # estável: ordem de gravação
+        q = 0
+        for f in abertos:
+            with f, gzip.open(f, 'rt', encoding='utf-8') as gz:
+                regs = json.load(gz)
+            for ts, r in filtra(regs):
+                while q < len(quentes) and quentes[q][0] < ts:   # empate: o arquivado foi gravado antes
+                    yield quentes[q][1]
+                    q += 1
+                yield r
+        for _ts_r, r in quentes[q:]:
+            yield r
+    finally:
+        for f in abertos:
+            f.close()
+
+def anteriores(ts: float, teares) -> Dict[int, Mapping[str, Any]]:
+    """
+    Último evento de cada tear com data_hora < ts (o que vale em ts). Meses arquivados
+    inteiros antes de ts vêm dos 'ultimos' do manifesto; só o segmento que contém ts é lido.
+    """
+    sel = {int(t) for t in teares}
+    out: Dict[int, Mapping[str, Any]] = {}
+    if not sel:
+        return out
+    desde = None
+    with _lock:
+        for seg in _manifesto_atual()['segmentos']:
+            if seg['fim'] >= ts:
+                break
+            for t, r in seg['ultimos'].items():
+                if int(t) in sel:
+                    out[int(t)] = MappingProxyType(r)
+            desde = math.nextafter(seg['fim'], math.inf)
+    for r in percorrer_eventos(desde, ts, sel):
+        out[int(r['tear'])] = r
+    return out
+
+def _estado_apos(estado: Optional[Dict[str, Any]], eventos: List[Tuple[float, Any]]) -> Dict[str, Any]:
+    """Estado de um tear (status, desde, ultimo) após aplicar eventos já ordenados por data_hora."""
+    for _t, r in eventos:
+        if estado is None or int(r['status']) != estado['status']:
+            estado = {'status': int(r['status']), 'desde': r['data_hora'], 'ultimo': dict(r)}
+        else:
+            estado = {**estado, 'ultimo': dict(r)}
+    return estado
+
+def arquivar(meses_quentes: int = ARQUIVO_MESES) -> int:
+    """
+    Move para o arquivo os eventos de meses anteriores à janela quente. Devolve quantos
+    eventos foram arquivados. Roda junto com a compactação; pode ser chamado à mão.
+    """
+    hoje = datetime.now().date()
+    a, m = hoje.year, hoje.month - (meses_quentes - 1)
+    while m < 1:
+        a, m = a - 1, m + 12
+    corte = f'{a:04d}-{m:02d}'   # meses < corte (pelo texto de data_hora, no fuso gravado) vão pro arquivo
+    with _lock_compactacao, _trava_compactacao():
+        with _lock:
+            atual = _carrega('status')
+            manifesto = _manifesto_atual()
+        frios: Dict[str, List[Tuple[float, Any]]] = {}
+        for r in atual:
+            if r['data_hora'][:7] < corte:
+                frios.setdefault(r['data_hora'][:7], []).append((_ts(r), r))
+        if not frios:
+            return 0
+
+        # 1) segmentos novos/mesclados em temporários, fora do _lock
+        segs = {s['mes']: dict(s) for s in manifesto['segmentos']}
+        conteudo: Dict[str, List[Tuple[float, Any]]] = {}   # mes -> eventos do segmento regravado
+        trocas: List[Tuple[str, str]] = []
+        for mes, evs in sorted(frios.items()):
+            with _lock:
+                antigos = [(_ts(r), r) for r in _le_segmento(segs[mes])] if mes in segs else []
+            todos = sorted(antigos + evs, key=lambda x: x[0])
+            conteudo[mes] = todos
+            nome = f'status-{mes}.{len(todos)}.json.gz'   # nome novo a cada regravação: o manifesto antigo segue válido
+            destino = os.path.join(ARQUIVO_DIR, nome)
+            trocas.append((_gz_temp(destino, [dict(r) for _t, r in todos]), destino))
+            ultimos = {str(int(r['tear'])): dict(r) for _t, r in todos}   # vale o último de cada tear
+            segs[mes] = {'mes': mes, 'arquivo': nome, 'inicio': todos[0][0], 'fim': todos[-1][0],
+                         'eventos': len(todos), 'ultimos': ultimos}
+        ordem = [segs[k] for k in sorted(segs)]
+
+        # 2) estado de cada tear ao fim do arquivo: incremental, exceto para teares com
+        #    evento retroativo (anterior ao último já arquivado), refeitos do zero
+        estado = {t: dict(e) for t, e in manifesto['estado'].items()}
+        novos_por_tear: Dict[str, List[Tuple[float, Any]]] = {}
+        for mes in sorted(frios):
+            for item in frios[mes]:
+                novos_por_tear.setdefault(str(int(item[1]['tear'])), []).append(item)
+        refazer = set()
+        for t, evs in novos_por_tear.items():
+            evs.sort(key=lambda x: x[0])
+            e = estado.get(t)
+            if e is not None and evs[0][0] < _ts(e['ultimo']):
+                refazer.add(t)
+            else:
+                estado[t] = _estado_apos(e, evs)
+        if refazer:
+            historico: Dict[str, List[Tuple[float, Any]]] = {t: [] for t in refazer}
+            for seg in ordem:
+                if seg['mes'] in conteudo:
+                    regs = conteudo[seg['mes']]
+                else:
+                    with _lock:
+                        regs = [(_ts(r), r) for r in _le_segmento(seg)]
+                for item in regs:
+                    t = str(int(item[1]['tear']))
+                    if t in refazer:
+                        historico[t].append(item)
+            for t, evs in historico.items():
+                estado[t] = _estado_apos(None, evs)
+
+        limite = max(s['fim'] for s in ordem)
+        novo_manifesto = {'limite': limite, 'segmentos': ordem, 'estado': estado}
+
+        # 3) publica: segmentos, manifesto (ponto de efetivação) e janela quente sem os arquivados.
+        #    Uma queda entre o manifesto e a janela quente é desfeita por _recupera_arquivo.
+        with _lock, _trava():
+            agora = _carrega('status')
+            arquivados = {id(r) for evs in frios.values() for _t, r in evs}
+            restantes = [dict(r) for r in atual if id(r) not in arquivados] + [dict(r) for r in agora[len(atual):]]
+            for tmp, destino in trocas:
+                os.replace(tmp, destino)
+            _atomic_write(MANIFESTO, novo_manifesto)
+            _grava('status', restantes)
+            _remove_orfaos(novo_manifesto)
+        return sum(len(evs) for evs in frios.values())
+
+def _remove_orfaos(manifesto: Dict[str, Any]):
+    """Apaga segmentos que o manifesto não referencia mais (versões antigas, sobras de queda)."""
+    usados = {seg['arquivo'] for seg in manifesto['segmentos']}
+    for nome in os.listdir(ARQUIVO_DIR):
+        if nome.startswith('status-') and nome.endswith('.json.gz') and nome not in usados:
+            _remove(os.path.join(ARQUIVO_DIR, nome))
+
+def _recupera_arquivo():
+    """Tira da janela quente eventos que já estão no arquivo (queda no meio de arquivar). Sob as travas."""
+    manifesto = _manifesto_atual()
+    if not manifesto['segmentos']:
+        return
+    por_mes = {seg['mes']: seg for seg in manifesto['segmentos']}
+    quentes = _carrega('status')
+    meses = {r['data_hora'][:7] for r in quentes} & set(por_mes)
+    if meses:
+        ja_arquivados = {json.dumps(dict(r), sort_keys=True)
+                         for mes in meses for r in _le_segmento(por_mes[mes])}
+        restantes = [dict(r) for r in quentes if json.dumps(dict(r), sort_keys=True) not in ja_arquivados]
+        if len(restantes) < len(quentes):
+            _grava('status', restantes)
+    _remove_orfaos(manifesto)
+
+def _gz_temp(path: str, data) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_', suffix='.json.gz')
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as gz:
+                gz.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
+            raw.flush()
+            _fsync(raw.fileno(), 'arquivo/segmentos', os.fstat(raw.fileno()).st_size)
+    except Exception:
+        try: os.remove(tmp)
+        except Exception: pass
+        raise
+    return tmp
+
+if BACKEND == 'json':
+    with _lock_compactacao, _trava_compactacao(), _lock, _trava():
+        for key in JOURNALS:
+            _recupera_journal(key)
+        _recupera_arquivo()
+    # histórico antigo no arquivo quente (instalação existente / servidor parado na virada do mês)
+    Thread(target=arquivar, daemon=True, name='arquiva-status').start()
+elif BACKEND == 'sqlite':
+    # mesma interface, outra implementação (ver storage_sqlite.py)
+    import storage_sqlite as _sqlite
+    read, view, write, compactar = _sqlite.read, _sqlite.view, _sqlite.write, _sqlite.compactar
+    _grava_lote = _sqlite.append_lote   # append/append_lote continuam com o group commit daqui
+    transacao, acompanhar = _sqlite.transacao, _sqlite.acompanhar
+    versao = _sqlite.versao
+    consultar_eventos, percorrer_eventos, anteriores = (
+        _sqlite.consultar_eventos, _sqlite.percorrer_eventos, _sqlite.anteriores)
+    importar = _sqlite.importar
+    limite_quente, segmentos_arquivo, estado_arquivado, arquivar = (
+        _sqlite.limite_quente, _sqlite.segmentos_arquivo, _sqlite.estado_arquivado, _sqlite.arquivar)
+else:
+    raise ValueError(f'PARADAS_STORAGE inválido: {BACKEND!r} (use json ou sqlite)')
+
+
+def _tamanhos() -> Dict[tuple, float]:
+    if BACKEND == 'sqlite':
+        caminhos = [_sqlite.DB_PATH, _sqlite.DB_PATH + '-wal']
+    else:
+        caminhos = list(FILES.values()) + list(JOURNALS.values()) + [MANIFESTO]
+    out: Dict[tuple, float] = {}
+    for p in caminhos:
+        try:
+            out[(os.path.basename(p),)] = os.path.getsize(p)
+        except OSError:
+            pass
+    if BACKEND == 'json' and os.path.isdir(ARQUIVO_DIR):
+        out[('arquivo/segmentos',)] = sum(e.stat().st_size for e in os.scandir(ARQUIVO_DIR)
+                                          if e.name.endswith('.json.gz'))
+    return out
+
+metricas.Medidor('paradas_storage_arquivo_bytes', 'Tamanho atual dos arquivos de dados', _tamanhos, ('arquivo',))
+metricas.Medidor('paradas_storage_journal_linhas', 'Linhas no journal ainda não compactadas',
+                 lambda: {(k,): n for k, n in _journal_linhas.items()}, ('key',))
+metricas.Medidor('paradas_storage_registros', 'Registros em memória por chave',
+                 lambda: {(k,): len(v[1]) for k, v in list((_sqlite._cache if BACKEND == 'sqlite' else _cache).items())},
+                 ('key',))
@@ -0,0 +1,415 @@
+# server/storage_sqlite.py
+# Backend SQLite (WAL) com a mesma interface do storage em JSON: read/view/write/append.
+# Ativado com PARADAS_STORAGE=sqlite; na primeira abertura importa os data/*.json existentes
+# e os meses já arquivados em data/arquivo.
+import os, sqlite3, time
+from contextlib import contextmanager
+from datetime import datetime
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metricas
+import storage
+
+DB_PATH = os.getenv('PARADAS_SQLITE', os.path.join(storage.DATA_DIR, 'paradas.db'))
+
+# chave do storage -> (tabela, colunas na ordem dos registros)
+TABELAS: Dict[str, Tuple[str, List[str]]] = {
+    'status': ('eventos', ['tear', 'data_hora', 'status', 'hora_registro', 'motivo', 'turno']),
+    'motivos': ('motivos', ['codigo', 'descricao']),
+    'turnos': ('turnos', ['turno', 'dia_semana', 'inicio', 'fim']),
+    'teares': ('teares', ['codigo', 'nome']),
+    'users': ('users', ['cod', 'nome', 'senha_hash', 'role']),
+    'sessions': ('sessions', ['token', 'cod', 'created_at', 'visto_em']),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS eventos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tear INTEGER NOT NULL,
+    data_hora TEXT NOT NULL,       -- ISO-8601 com offset, como gravado pela API
+    ts REAL NOT NULL,              -- data_hora em epoch: ordenação e filtros por período
+    status INTEGER NOT NULL,
+    hora_registro TEXT NOT NULL,
+    motivo INTEGER,
+    turno INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_eventos_tear_ts ON eventos (tear, ts);
+CREATE INDEX IF NOT EXISTS ix_eventos_ts ON eventos (ts);
+CREATE TABLE IF NOT EXISTS motivos (codigo INTEGER PRIMARY KEY, descricao TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS turnos (
+    turno INTEGER NOT NULL, dia_semana INTEGER NOT NULL, inicio TEXT NOT NULL, fim TEXT NOT NULL,
+    PRIMARY KEY (dia_semana, turno)
+);
+CREATE TABLE IF NOT EXISTS teares (codigo INTEGER PRIMARY KEY, nome TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS users (cod INTEGER PRIMARY KEY, nome TEXT NOT NULL, senha_hash TEXT NOT NULL, role INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS sessions (id INTEGER PRIMARY KEY AUTOINCREMENT, token TEXT NOT NULL, cod INTEGER NOT NULL, created_at TEXT NOT NULL, visto_em TEXT);
+CREATE INDEX IF NOT EXISTS ix_sessions_token ON sessions (token);
+-- versão por chave, incrementada na mesma transação de cada escrita (invalida cache de outros processos)
+CREATE TABLE IF NOT EXISTS versoes (chave TEXT PRIMARY KEY, n INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT);
+"""
+
+_lock = metricas.TravaMedida('sqlite')
+_con: Optional[sqlite3.Connection] = None
+_data_version: Optional[int] = None
+_cache: Dict[str, Tuple[int, tuple]] = {}   # chave -> (versão, registros somente-leitura)
+_ultimo_rowid: Dict[str, int] = {}           # maior rowid já no cache, p/ ler só o que outro processo inseriu
+_externos: Dict[str, Optional[list]] = {}    # ver storage.acompanhar
+
+
+def _conexao() -> sqlite3.Connection:
+    global _con
+    if _con is None:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        con = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None, timeout=30)
+        con.execute('PRAGMA journal_mode=WAL')
+        con.execute('PRAGMA synchronous=FULL')   # commit durável (equivale ao fsync do JSON)
+        con.executescript(_SCHEMA)
+        if 'visto_em' not in {c[1] for c in con.execute('PRAGMA table_info(sessions)')}:
+            con.execute('ALTER TABLE sessions ADD COLUMN visto_em TEXT')   # banco criado antes do visto_em
+        _con = con
+        if _meta(con, 'migrado_json') is None or _meta(con, 'migrado_arquivo') is None:
+            migrar_de_json(con)
+    return _con
+
+def _meta(con: sqlite3.Connection, k: str) -> Optional[str]:
+    row = con.execute('SELECT v FROM meta WHERE k = ?', (k,)).fetchone()
+    return row[0] if row else None
+
+def _linha(key: str, r) -> tuple:
+    cols = TABELAS[key][1]
+    vals = tuple(r.get(c) for c in cols)
+    if key == 'status':
+        vals += (datetime.fromisoformat(r['data_hora']).timestamp(),)
+    return vals
+
+def _insere(con: sqlite3.Connection, key: str, registros: Iterable):
+    tabela, cols = TABELAS[key]
+    if key == 'status':
+        cols = cols + ['ts']
+    sql = f'INSERT OR REPLACE INTO {tabela} ({", ".join(cols)}) VALUES ({", ".join("?" * len(cols))})'
+    con.executemany(sql, (_linha(key, r) for r in registros))
+
+def _incrementa_versao(con: sqlite3.Connection, key: str) -> int:
+    con.execute('INSERT INTO versoes (chave, n) VALUES (?, 1) '
+                'ON CONFLICT (chave) DO UPDATE SET n = n + 1', (key,))
+    return con.execute('SELECT n FROM versoes WHERE chave = ?', (key,)).fetchone()[0]
+
+def _versao(con: sqlite3.Connection, key: str) -> int:
+    row = con.execute('SELECT n FROM versoes WHERE chave = ?', (key,)).fetchone()
+    return row[0] if row else 0
+
+def migrar_de_json(con: Optional[sqlite3.Connection] = None):
+    """
+    Importa (uma vez) o conteúdo de data/*.json, dos journals e dos meses arquivados
+    (data/arquivo, ver storage.arquivar) para o banco. Banco migrado antes de o arquivo
+    entrar na migração recebe só os meses arquivados.
+    """
+    con = con or _conexao()
+    con.execute('BEGIN IMMEDIATE')
+    try:
+        if _meta(con, 'migrado_json') is None:
+            for key, path in storage.FILES.items():
+                dados = storage._safe_load(path, storage._DEFAULTS[key]) if os.path.exists(path) \
+                    else list(storage._DEFAULTS[key])
+                if key in storage.JOURNALS:
+                    jpath = storage.JOURNALS[key]
+                    dados = dados + storage._ler_journal(jpath + '.compactando') + storage._ler_journal(jpath)
+                con.execute(f'DELETE FROM {TABELAS[key][0]}')
+                if key == 'status':
+                    _migra_arquivo(con)   # antes dos quentes: rowid segue a ordem cronológica
+                    dados = _sem_repetidos(con, dados)
+                _insere(con, key, dados)
+                _incrementa_versao(con, key)
+            agora = datetime.now().isoformat()
+            con.execute("INSERT INTO meta (k, v) VALUES ('migrado_json', ?)", (agora,))
+            con.execute("INSERT INTO meta (k, v) VALUES ('migrado_arquivo', ?)", (agora,))
+        elif _meta(con, 'migrado_arquivo') is None:
+            if _migra_arquivo(con):
+                _incrementa_versao(con, 'status')
+            con.execute("INSERT INTO meta (k, v) VALUES ('migrado_arquivo', ?)", (datetime.now().isoformat(),))
+        con.execute('COMMIT')
+    except Exception:
+        con.execute('ROLLBACK')
+        raise
+
+def _migra_arquivo(con: sqlite3.Connection) -> int:
+    """Insere os eventos dos segmentos do arquivo em JSON, um segmento por vez. Devolve quantos."""
+    with storage._lock:
+        segmentos = list(storage._manifesto_atual()['segmentos'])
+    n = 0
+    for seg in segmentos:
+        with storage._lock:
+            regs = storage._le_segmento(seg)
+        novos = _sem_repetidos(con, regs)
+        _insere(con, 'status', novos)
+        n += len(novos)
+    return n
+
+def _sem_repetidos(con: sqlite3.Connection, registros) -> list:
+    """
+    Os eventos de `registros` que ainda não estão no banco com os mesmos campos (queda no meio
+    de storage.arquivar deixa um evento no segmento e na janela quente; migração repetida).
+    """
+    if not registros:
+        return []
+    cols = TABELAS['status'][1]
+    ts = [datetime.fromisoformat(r['data_hora']).timestamp() for r in registros]
+    ja = set(con.execute(f'SELECT {", ".join(cols)} FROM eventos WHERE ts BETWEEN ? AND ?',
+                         (min(ts), max(ts))))
+    if not ja:
+        return list(registros)
+    return [r for r in registros if tuple(r.get(c) for c in cols) not in ja]
+
+def _sincroniza(con: sqlite3.Connection):
+    """
+    Atualiza o cache com o que outra conexão/processo gravou (PRAGMA data_version muda).
+    Inserções no fim são lidas incrementalmente; outras mudanças descartam a chave. Chamar sob _lock.
+    """
+    global _data_version
+    dv = con.execute('PRAGMA data_version').fetchone()[0]
+    if dv != _data_version:
+        for key, (v, regs) in list(_cache.items()):
+            atual = _versao(con, key)
+            if atual == v:
+                continue
+            novos = _novas_linhas(con, key, regs)
+            if novos is None:
+                del _cache[key]
+                if _externos.get(key) is not None:
+                    _externos[key] = None
+            else:
+                _cache[key] = (atual, regs + tuple(MappingProxyType(r) for r in novos))
+                if _externos.get(key) is not None:
+                    _externos[key].extend(novos)
+        _data_version = dv
+
+def _novas_linhas(con: sqlite3.Connection, key: str, regs: tuple) -> Optional[List[dict]]:
+    """Linhas com rowid além do último em cache, se a tabela só cresceu; senão None."""
+    tabela, cols = TABELAS[key]
+    ultimo = _ultimo_rowid.get(key, 0)
+    rows = con.execute(f'SELECT rowid, {", ".join(cols)} FROM {tabela} WHERE rowid > ? ORDER BY rowid',
+                       (ultimo,)).fetchall()
+    total = con.execute(f'SELECT count(*) FROM {tabela}').fetchone()[0]
+    if total != len(regs) + len(rows):
+        return None
+    if rows:
+        _ultimo_rowid[key] = rows[-1][0]
+    return [dict(zip(cols, row[1:])) for row in rows]
+
+def _carrega(key: str) -> tuple:
+    con = _conexao()
+    _sincroniza(con)
+    hit = _cache.get(key)
+    if hit:
+        return hit[1]
+    tabela, cols = TABELAS[key]
+    v = _versao(con, key)
+    # ordem de gravação, como na lista do JSON
+    rows = con.execute(f'SELECT rowid, {", ".join(cols)} FROM {tabela} ORDER BY rowid').fetchall()
+    registros = tuple(MappingProxyType(dict(zip(cols, row[1:]))) for row in rows)
+    _cache[key] = (v, registros)
+    _ultimo_rowid[key] = rows[-1][0] if rows else 0
+    return registros
+
+def _max_rowid(con: sqlite3.Connection, key: str) -> int:
+    return con.execute(f'SELECT coalesce(max(rowid), 0) FROM {TABELAS[key][0]}').fetchone()[0]
+
+def read(key: str):
+    """Cópia (lista de dicts) dos dados de `key`; pode ser alterada livremente pelo chamador."""
+    with _lock:
+        return [dict(r) for r in _carrega(key)]
+
+def view(key: str) -> tuple:
+    """Dados de `key` sem cópia: tupla de mapeamentos somente-leitura, para quem só consulta."""
+    with _lock:
+        return _carrega(key)
+
+def write(key: str, data):
+    with storage.ESCRITA.tempo(key, 'write'), _lock:
+        con = _conexao()
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            _grava(con, key, data)
+            _commit(con)
+        except Exception:
+            con.execute('ROLLBACK')
+            _cache.pop(key, None)
+            raise
+        _sincroniza(con)
+
+def _commit(con: sqlite3.Connection):
+    # synchronous=FULL: o COMMIT é o fsync deste backend
+    t = time.perf_counter()
+    con.execute('COMMIT')
+    storage.FSYNC.observa(time.perf_counter() - t, os.path.basename(DB_PATH))
+
+def _grava(con: sqlite3.Connection, key: str, data):
+    """Substitui o conteúdo de `key` dentro da transação aberta. Chamar sob _lock."""
+    con.execute(f'DELETE FROM {TABELAS[key][0]}')
+    _insere(con, key, data)
+    v = _incrementa_versao(con, key)
+    _cache[key] = (v, tuple(MappingProxyType({c: r.get(c) for c in TABELAS[key][1]}) for r in data))
+    _ultimo_rowid[key] = _max_rowid(con, key)
+    if _externos.get(key) is not None:
+        _externos[key] = None
+
+@contextmanager
+def transacao(key: str):
+    """Leitura-alteração-escrita atômica (BEGIN IMMEDIATE); ver storage.transacao."""
+    with storage.ESCRITA.tempo(key, 'transacao'), _lock:
+        con = _conexao()
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            _sincroniza(con)
+            rows = [dict(r) for r in _carrega(key)]
+            yield rows
+            _grava(con, key, rows)
+            _commit(con)
+        except BaseException:
+            con.execute('ROLLBACK')
+            _cache.pop(key, None)
+            raise
+        _sincroniza(con)
+
+def append(key: str, registro):
+    """Acrescenta um registro (INSERT numa transação), sem reescrever o restante."""
+    append_lote(key, [registro])
+
+def append_lote(key: str, registros: list):
+    """Acrescenta vários registros numa única transação (um commit durável)."""
+    if not registros:
+        return
+    with _lock:
+        con = _conexao()
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            _sincroniza(con)   # o que outros processos gravaram entra antes (e como externo)
+            hit = _cache.get(key)
+            _insere(con, key, registros)
+            v = _incrementa_versao(con, key)
+            ultimo = _max_rowid(con, key)
+            _commit(con)
+        except Exception:
+            con.execute('ROLLBACK')
+            raise
+        if hit and hit[0] == v - 1:
+            novos = tuple(MappingProxyType({c: r.get(c) for c in TABELAS[key][1]}) for r in registros)
+            _cache[key] = (v, hit[1] + novos)
+            _ultimo_rowid[key] = ultimo
+        else:
+            _cache.pop(key, None)
+        _sincroniza(con)
+
+def importar(key: str, registros: list):
+    """Carga em massa: no SQLite um append_lote já é uma transação só, sem regravar nada."""
+    with storage.ESCRITA.tempo(key, 'importa'):
+        append_lote(key, registros)
+
+def versao(key: str) -> str:
+    """Identificador do conteúdo atual de `key` (tabela versoes: o mesmo em todos os processos)."""
+    with _lock:
+        con = _conexao()
+        _sincroniza(con)
+        hit = _cache.get(key)
+        return str(hit[0] if hit else _versao(con, key))
+
+def acompanhar(key: str) -> Optional[list]:
+    """Registros inseridos por outros processos desde a chamada anterior; ver storage.acompanhar."""
+    with _lock:
+        _carrega(key)
+        if key not in _externos:
+            _externos[key] = []
+            return []
+        novos, _externos[key] = _externos[key], []
+        return novos
+
+def compactar(key: str):
+    """No SQLite não há journal próprio a compactar; faz checkpoint do WAL."""
+    with _lock:
+        _conexao().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+def _filtro_eventos(inicio: Optional[float], fim: Optional[float],
+                    teares: Optional[Iterable[int]]) -> Tuple[List[str], List[Any]]:
+    where, args = [], []
+    if inicio is not None:
+        where.append('ts >= ?'); args.append(inicio)
+    if fim is not None:
+        where.append('ts < ?'); args.append(fim)
+    if teares:
+        teares = list(teares)
+        where.append(f'tear IN ({", ".join("?" * len(teares))})'); args.extend(teares)
+    return where, args
+
+def consultar_eventos(inicio: Optional[float] = None, fim: Optional[float] = None,
+                      teares: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+    """Eventos com inicio <= ts < fim (epoch), opcionalmente de alguns teares — filtro feito no banco."""
+    cols = TABELAS['status'][1]
+    where, args = _filtro_eventos(inicio, fim, teares)
+    sql = f'SELECT {", ".join(cols)} FROM eventos'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY ts, id'
+    with _lock:
+        rows = _conexao().execute(sql, args).fetchall()
+    return [dict(zip(cols, row)) for row in rows]
+
+def percorrer_eventos(inicio: Optional[float] = None, fim: Optional[float] = None,
+                      teares: Optional[Iterable[int]] = None, lote: int = 5000) -> Iterator[Dict[str, Any]]:
+    """
+    Como consultar_eventos, em páginas de 'lote' linhas continuando depois do último (ts, id):
+    a trava só fica presa durante cada página e a memória não cresce com o período.
+    """
+    cols = TABELAS['status'][1]
+    where, args = _filtro_eventos(inicio, fim, teares)
+    depois: Optional[Tuple[float, int]] = None
+    while True:
+        w, a = list(where), list(args)
+        if depois is not None:
+            w.append('(ts, id) > (?, ?)'); a.extend(depois)
+        sql = f'SELECT {", ".join(cols)}, ts, id FROM eventos'
+        if w:
+            sql += ' WHERE ' + ' AND '.join(w)
+        sql += ' ORDER BY ts, id LIMIT ?'
+        with _lock:
+            rows = _conexao().execute(sql, a + [lote]).fetchall()
+        for row in rows:
+            yield dict(zip(cols, row))
+        if len(rows) < lote:
+            return
+        depois = rows[-1][-2:]
+
+def anteriores(ts: float, teares: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Último evento de cada tear com data_hora < ts; uma busca no índice (tear, ts) por tear."""
+    cols = TABELAS['status'][1]
+    sql = f'SELECT {", ".join(cols)} FROM eventos WHERE tear = ? AND ts < ? ORDER BY ts DESC, id DESC LIMIT 1'
+    out = {}
+    with _lock:
+        con = _conexao()
+        for t in sorted({int(t) for t in teares}):
+            row = con.execute(sql, (t, ts)).fetchone()
+            if row is not None:
+                out[t] = dict(zip(cols, row))
+    return out
+
+
+# Arquivo por mês (storage.arquivar): no SQLite o índice (ts) já restringe as consultas ao
+# período pedido, então não há segmentos; tudo fica na "janela quente".
+def limite_quente() -> Optional[float]:
+    return None
+
+def segmentos_arquivo() -> List[Dict[str, Any]]:
+    return []
+
+def estado_arquivado() -> Dict[int, Dict[str, Any]]:
+    return {}
+
+def arquivar(meses_quentes: int = 0) -> int:
+    return 0
+
+
+if __name__ == '__main__':
+    # uso: python storage_sqlite.py  → cria o banco e importa os JSON (se ainda não importou)
+    _conexao()
+    print(f'SQLite pronto em {DB_PATH}')
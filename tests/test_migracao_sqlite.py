@@ -0,0 +1,59 @@
+# tests/test_migracao_sqlite.py
+# Migração JSON -> SQLite com meses arquivados. Cada backend roda num processo próprio:
+# o storage lê PARADAS_STORAGE/PARADAS_DATA_DIR na importação e guarda estado de módulo.
+import json, os, sqlite3, subprocess, sys
+from datetime import datetime, timedelta, timezone
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server')
+FUSO = timezone(timedelta(hours=-3))
+
+
+def _roda(data_dir, backend, codigo):
+    env = dict(os.environ, PARADAS_DATA_DIR=str(data_dir), PARADAS_STORAGE=backend)
+    env.pop('PARADAS_SQLITE', None)
+    out = subprocess.run([sys.executable, '-c', codigo], cwd=SERVER, env=env,
+                         capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def _eventos(data_dir):
+    agora = datetime.now(FUSO).replace(microsecond=0)
+    evs = []
+    for dias in (200, 170, 140, 1):   # três meses fora da janela quente e um dentro
+        for tear in (1, 2):
+            for i, status in enumerate((0, 1)):
+                dh = (agora - timedelta(days=dias, hours=i)).isoformat()
+                evs.append({'tear': tear, 'data_hora': dh, 'status': status, 'hora_registro': dh,
+                            'motivo': 1 if status == 0 else None, 'turno': 1})
+    with open(os.path.join(data_dir, 'status_tear.json'), 'w', encoding='utf-8') as f:
+        json.dump(evs, f)
+    return evs
+
+_ARQUIVA = ('import json, storage; storage.arquivar(); '
+            'print(json.dumps([len(storage.segmentos_arquivo()), len(storage.view("status"))]))')
+_LISTA = ('import json, storage; '
+          'print(json.dumps(sorted(r["data_hora"] for r in storage.consultar_eventos())))')
+
+
+def test_migracao_leva_meses_arquivados(tmp_path):
+    evs = _eventos(tmp_path)
+    segmentos, quentes = _roda(tmp_path, 'json', _ARQUIVA)
+    assert segmentos >= 3 and quentes < len(evs)
+
+    assert _roda(tmp_path, 'sqlite', _LISTA) == sorted(e['data_hora'] for e in evs)
+
+def test_banco_migrado_sem_arquivo_recebe_os_meses(tmp_path):
+    evs = _eventos(tmp_path)
+    _roda(tmp_path, 'json', _ARQUIVA)
+    _roda(tmp_path, 'sqlite', _LISTA)
+    # banco de antes da correção: só a janela quente e sem a marca 'migrado_arquivo'
+    con = sqlite3.connect(tmp_path / 'paradas.db')
+    limite = (datetime.now(FUSO) - timedelta(days=60)).timestamp()
+    con.execute('DELETE FROM eventos WHERE ts < ?', (limite,))
+    con.execute("DELETE FROM meta WHERE k = 'migrado_arquivo'")
+    con.commit()
+    con.close()
+
+    assert _roda(tmp_path, 'sqlite', _LISTA) == sorted(e['data_hora'] for e in evs)
+    # reabrir não duplica
+    assert _roda(tmp_path, 'sqlite', _LISTA) == sorted(e['data_hora'] for e in evs)
@@ -1,7 +1,7 @@
 import React from 'react'
 import { useEffect, useState } from 'react'
 import type { StatusAtual } from './types'
-import { getStatusTeares } from './api'
+import { getStatusTeares, openStatusStream } from './api'
 import ModalRegistro, { Modo } from './ModalRegistro'
 import { Link } from 'react-router-dom'
 
@@ -18,25 +18,54 @@ function formatHoras(h?: number) {
   return `${hh}:${String(mm).padStart(2, '0')}h`
 }
 
+// Horas desde 'desde' calculadas no cliente (o stream só manda mudanças de status)
+function horasDesde(st: StatusAtual, agora: number) {
+  if (!st.desde) return st.horas
+  const ms = agora - new Date(st.desde).getTime()
+  return isNaN(ms) ? st.horas : Math.max(0, ms / 3600000)
+}
+
 export default function Dashboard() {
   const [itens, setItens] = useState<StatusAtual[]>([])
   const [sel, setSel] = useState<{ tear: number; modo: Modo; desde?: string; horas?: number; nome?: string } | null>(null)
 
+  const [agora, setAgora] = useState(() => Date.now())
+
   async function load() {
     const rows = await getStatusTeares()
     setItens(rows)
   }
   useEffect(() => {
-    load()
-    const id = setInterval(load, 5000)
-    return () => clearInterval(id)
+    // preferimos o stream; se o navegador não suportar ou a conexão fechar de vez, volta ao polling
+    let poll: ReturnType<typeof setInterval> | undefined
+    const startPolling = () => {
+      if (poll) return
+      load()
+      poll = setInterval(load, 5000)
+    }
+    let es: EventSource | undefined
+    if (typeof EventSource !== 'undefined') {
+      es = openStatusStream(setItens, st =>
+        setItens(prev => prev.some(x => x.tear === st.tear)
+          ? prev.map(x => (x.tear === st.tear ? st : x))
+          : [...prev, st].sort((a, b) => a.tear - b.tear)))
+      es.onerror = () => { if (es?.readyState === EventSource.CLOSED) startPolling() }
+    } else {
+      startPolling()
+    }
+    const tick = setInterval(() => setAgora(Date.now()), 30000)
+    return () => {
+      es?.close()
+      if (poll) clearInterval(poll)
+      clearInterval(tick)
+    }
   }, [])
 
   function click(tear: number) {
     const st = itens.find(x => x.tear === tear)
     const status = st?.status ?? 1
     const modo: Modo = status === 1 ? 'parada' : 'funcionando'
-    setSel({ tear, modo, desde: st?.desde, horas: st?.horas, nome: st?.nome })
+    setSel({ tear, modo, desde: st?.desde, horas: st ? horasDesde(st, Date.now()) : undefined, nome: st?.nome })
   }
 
   return (
@@ -78,7 +107,7 @@ export default function Dashboard() {
                     {st.desde && (
                       <div className="text-body-secondary fw-semibold mt-1"
                            style={{ fontSize: 'clamp(1rem, 2.8vw, 1.25rem)' }}>
-                        {ok ? 'Funcionando' : 'Parado'} há {formatHoras(st.horas)}
+                        {ok ? 'Funcionando' : 'Parado'} há {formatHoras(horasDesde(st, agora))}
                       </div>
                     )}
                   </div>
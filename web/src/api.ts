@@ -63,6 +63,19 @@ export async function getStatusTeares(): Promise<StatusAtual[]> {
   return get<StatusAtual[]>('/status-teares')
 }
 
+// Stream (SSE): snapshot ao conectar e depois só o tear que mudou.
+// EventSource não manda headers, então o token vai na query string.
+export function openStatusStream(
+  onSnapshot: (rows: StatusAtual[]) => void,
+  onTear: (st: StatusAtual) => void,
+): EventSource {
+  const t = localStorage.getItem('token') || ''
+  const es = new EventSource(`${API}/status-teares/stream?token=${encodeURIComponent(t)}`)
+  es.addEventListener('snapshot', e => onSnapshot(JSON.parse((e as MessageEvent).data)))
+  es.addEventListener('tear', e => onTear(JSON.parse((e as MessageEvent).data)))
+  return es
+}
+
 // --- Turnos ---
 export async function listTurnos(): Promise<Turno[]> {
   return get<Turno[]>('/turnos')
@@ -115,3 +128,14 @@ export async function registrarParada(body: NovoRegistro) {
 export async function registrarFuncionando(body: NovoRegistro) {
   return post('/funcionando', body)
 }
+
+// vários teares de uma vez (queda de energia, virada de turno): um resultado por item
+export type RegistroLote = NovoRegistro & { status: 0 | 1 }
+export type ResultadoLote = {
+  indice: number; ok: boolean; erro?: string
+  evento?: { tear: number; data_hora: string; status: number; hora_registro: string; motivo?: number | null; turno?: number | null }
+}
+
+export async function registrarLote(itens: RegistroLote[]): Promise<ResultadoLote[]> {
+  return post<ResultadoLote[]>('/registros/lote', itens)
+}